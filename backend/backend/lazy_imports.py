@@ -0,0 +1,62 @@
+"""
+Lazy imports for heavy optional dependencies
+
+sentence-transformers, scikit-learn, SciPy and pandas take seconds and
+hundreds of megabytes to import. Modules reachable from the URLconf refer
+to them through LazyModule facades instead, so the import happens on the
+first attribute access (usually the first request that needs it) rather
+than in every worker, shell and management command at startup.
+
+    text = lazy_import('sklearn.feature_extraction.text')
+    vectorizer = text.TfidfVectorizer()   # sklearn is imported here
+
+is_available() checks whether a package is installed without importing it.
+"""
+
+import importlib
+import importlib.util
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<LazyModule {self._name!r} ({state})>'
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Facade for module ``name``; nothing is imported until it is used"""
+    return LazyModule(name)
+
+
+def is_available(*names: str) -> bool:
+    """True when every named top-level package is installed (none are imported)"""
+    for name in names:
+        try:
+            if importlib.util.find_spec(name) is None:
+                return False
+        except (ImportError, ValueError):
+            return False
+    return True
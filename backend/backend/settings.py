@@ -273,3 +273,64 @@ LOGGING = {
         },
     },
 }
+
+
+# Therapist matching
+# Pre-computed therapist bio / blog section embeddings (see matching/embedding_store.py)
+MATCHING_EMBEDDING_STORE_DIR = os.path.join(BASE_DIR, 'matching_data', 'embeddings')
+# Read Layer 3 match statistics from the TherapistMatchStats table instead of
+# aggregating TherapistMatch on every request. The table is only maintained
+# while this is on: run rebuild_match_stats whenever enabling it
+MATCHING_MATERIALIZED_MATCH_STATS = False
+# Seconds a therapist quality score stays cached (invalidated on profile/blog changes)
+MATCHING_QUALITY_CACHE_TIMEOUT = 3600
+# Asynchronous matching jobs: 'worker' leaves them to `python manage.py run_match_jobs`;
+# 'thread' runs them in a small pool inside the web process (development only)
+MATCHING_JOB_RUNNER = 'thread' if DEBUG else 'worker'
+MATCHING_JOB_THREADS = 2
+# ANN candidate retrieval in front of full scoring (see matching/ann_index.py);
+# None scores every therapist. Build the index with `build_ann_index`.
+MATCHING_ANN_INDEX_DIR = os.path.join(BASE_DIR, 'matching_data', 'ann')
+MATCHING_ANN_CANDIDATES = None
+MATCHING_ANN_NPROBE = 8
+# Seconds a match result stays cached per survey fingerprint and therapist pool version
+MATCHING_RESULT_CACHE_TIMEOUT = 3600
+# Fraction of computed matches logged to MatchingLog with per-stage timings
+MATCHING_LOG_SAMPLE_RATE = 1.0
+# Persisted TF-IDF model for MatchingEngine (see matching/tfidf_model.py); fit it
+# with `build_tfidf_model`. It is refitted in the background once more than this
+# fraction of therapist documents changed since the last fit.
+MATCHING_TFIDF_MODEL_DIR = os.path.join(BASE_DIR, 'matching_data', 'tfidf')
+MATCHING_TFIDF_REFIT_FRACTION = 0.2
+# Host-wide memory-mapped cache of text embeddings shared by all worker processes
+# (see matching/embedding_cache.py); 0 disables it
+MATCHING_EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, 'matching_data', 'embedding_cache')
+MATCHING_EMBEDDING_CACHE_MAX_MB = 64
+# Unix socket of the host's shared embedding service (`run_embedding_service`);
+# None encodes in each process. Requests within the window are batched together.
+MATCHING_EMBEDDING_SOCKET = None
+MATCHING_EMBEDDING_BATCH_WINDOW_MS = 5
+MATCHING_EMBEDDING_MAX_BATCH = 64
+MATCHING_EMBEDDING_SERVICE_TIMEOUT = 5.0
+# Time synchronous match requests wait for the encoder; past it Layer 2 falls back
+# to TF-IDF or stored vectors and a rematch job upgrades the match. None waits.
+MATCHING_LATENCY_BUDGET_MS = None
+# Largest cohort accepted by the batch matching endpoint (see matching/batch_matching.py)
+MATCHING_BATCH_MAX_RESPONSES = 500
+# Startup budget checked by `profile_imports`: time for django.setup() plus the
+# URLconf in a fresh interpreter, and heavy packages that must only load lazily
+STARTUP_IMPORT_BUDGET_MS = 1500
+STARTUP_FORBIDDEN_IMPORTS = ['sentence_transformers', 'torch', 'sklearn', 'scipy', 'pandas']
+# Learned Layer 3 factors fitted by `train_collaborative_model` from appointment
+# outcomes (see matching/collaborative_model.py); unused until trained
+MATCHING_CF_MODEL_DIR = os.path.join(BASE_DIR, 'matching_data', 'collaborative')
+# Similar-patient index (see matching/patient_index.py, `build_patient_index`) and
+# the number of nearest past patients whose outcomes feed Layer 3
+MATCHING_PATIENT_INDEX_DIR = os.path.join(BASE_DIR, 'matching_data', 'patients')
+MATCHING_SIMILAR_PATIENTS_K = 20
+# Capacity-aware ranking from TherapistCapacity free-slot counts (see matching/capacity.py):
+# None ignores them, 'penalty' scales down therapists with fewer than MIN_FREE_SLOTS
+# free slots (by up to PENALTY), 'filter' drops therapists without any
+MATCHING_CAPACITY_MODE = None
+MATCHING_CAPACITY_PENALTY = 0.3
+MATCHING_CAPACITY_MIN_FREE_SLOTS = 3
@@ -1,10 +1,13 @@
-import pandas as pd
 from django.db.models import Count, Case, When
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from backend.lazy_imports import lazy_import
 from .models import BlogPost, BlogLike, BlogView
 
+# pandas and scikit-learn load on the first recommendation, not at startup
+pd = lazy_import('pandas')
+sklearn_text = lazy_import('sklearn.feature_extraction.text')
+sklearn_pairwise = lazy_import('sklearn.metrics.pairwise')
+
 
 class BlogRecommender:
 
@@ -60,14 +63,14 @@ class BlogRecommender:
 
         df = pd.DataFrame(rows)
 
-        tfidf = TfidfVectorizer(
+        tfidf = sklearn_text.TfidfVectorizer(
             stop_words="english",
             ngram_range=(1, 2),
             max_features=5000
         )
 
         tfidf_matrix = tfidf.fit_transform(df["features"])
-        cosine_sim = cosine_similarity(tfidf_matrix)
+        cosine_sim = sklearn_pairwise.cosine_similarity(tfidf_matrix)
 
         interacted_indices = df[df["id"].isin(interacted_blog_ids)].index
         if interacted_indices.empty:
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TherapistMatch
+from .models import TherapistMatch, TherapistMatchStats, TherapistCapacity, BlogSection, TherapistPoolVersion, MatchingLog, PatientMatchFeatures
 
 
 @admin.register(TherapistMatch)
@@ -14,7 +14,7 @@ class TherapistMatchAdmin(admin.ModelAdmin):
     ]
     list_filter = ['matched_at', 'patient']
     search_fields = ['patient__username', 'top_match_1__username']
-    readonly_fields = ['matched_at', 'updated_at']
+    readonly_fields = ['survey_fingerprint', 'pool_version', 'matched_at', 'updated_at']
     
     fieldsets = (
         ('Patient & Survey', {
@@ -28,7 +28,50 @@ class TherapistMatchAdmin(admin.ModelAdmin):
             )
         }),
         ('Timestamps', {
-            'fields': ('matched_at', 'updated_at'),
+            'fields': ('survey_fingerprint', 'pool_version', 'matched_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(TherapistMatchStats)
+class TherapistMatchStatsAdmin(admin.ModelAdmin):
+    list_display = ['therapist', 'match_count', 'first_choice_count', 'updated_at']
+    search_fields = ['therapist__email']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(TherapistCapacity)
+class TherapistCapacityAdmin(admin.ModelAdmin):
+    list_display = ['therapist', 'free_slots', 'next_available_at', 'computed_at']
+    search_fields = ['therapist__email']
+    readonly_fields = ['free_slots', 'next_available_at', 'computed_at']
+
+
+@admin.register(BlogSection)
+class BlogSectionAdmin(admin.ModelAdmin):
+    list_display = ['post', 'position', 'relevance', 'updated_at']
+    search_fields = ['post__title']
+    readonly_fields = ['source_hash', 'updated_at']
+    exclude = ['embedding']
+
+
+@admin.register(TherapistPoolVersion)
+class TherapistPoolVersionAdmin(admin.ModelAdmin):
+    list_display = ['version', 'updated_at']
+    readonly_fields = ['version', 'updated_at']
+
+
+@admin.register(MatchingLog)
+class MatchingLogAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'matcher', 'patient', 'processing_time_ms', 'query_count', 'encoder_calls', 'matches_generated']
+    list_filter = ['matcher', 'created_at']
+    readonly_fields = ['created_at']
+
+
+@admin.register(PatientMatchFeatures)
+class PatientMatchFeaturesAdmin(admin.ModelAdmin):
+    list_display = ['survey_response', 'updated_at']
+    search_fields = ['survey_response__patient__email']
+    readonly_fields = ['survey_fingerprint', 'updated_at']
+    exclude = ['embedding']
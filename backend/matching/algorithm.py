@@ -535,14 +535,42 @@ Layer 3: Collaborative Filtering (IMPROVED with quality boost)
 NO DATABASE CHANGES - Works with existing models
 """
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Prefetch
+from django.db.models.functions import Lower, Trim
+from django.db.models.lookups import Exact
+from django.utils import timezone
 from surveys.models import SurveyResponse, SurveyAnswer
 from blogs.models import BlogPost
 from accounts.models import TherapistProfile
+from .embedding_cache import get_embedding_cache
+from .embedding_service import try_encode_remote
+from .embedding_store import get_embedding_store, bio_key, blog_section_key, normalize_rows
+from .blog_sections import blog_post_text, sections_are_current, decode_embedding
+from .match_stats import get_match_stats, collaborative_score
+from .collaborative_model import get_collaborative_model, learned_layer3_result, learned_layer3_scores
+from .patient_index import blend_similar_patients, get_patient_index
+from .capacity import capacity_factors, capacity_mode, get_capacity
+from .ann_index import get_ann_index
+from .instrumentation import MatchingInstrumentation, NO_STAGE, record_encoder_call
+from .tfidf_model import get_tfidf_model
+from backend.lazy_imports import is_available, lazy_import
+from .vectorized import (
+    hard_rule_mask,
+    semantic_scores,
+    weighted_scores,
+    composite_scores,
+    top_n_indices,
+)
 import numpy as np
 from typing import List, Dict, Tuple, Optional, TYPE_CHECKING
+import contextvars
 import logging
+from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 logger = logging.getLogger(__name__)
 
@@ -552,13 +580,11 @@ if TYPE_CHECKING:
 else:
     User = get_user_model()
 
-# Sentence Transformers for semantic matching
-try:
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
-    EMBEDDINGS_AVAILABLE = True
-except ImportError:
-    EMBEDDINGS_AVAILABLE = False
+# Sentence Transformers for semantic matching, imported when the model is
+# first loaded rather than with this module (see backend.lazy_imports)
+sentence_transformers = lazy_import('sentence_transformers')
+EMBEDDINGS_AVAILABLE = is_available('sentence_transformers', 'sklearn')
+if not EMBEDDINGS_AVAILABLE:
     print("Warning: sentence-transformers not installed. Install with: pip install sentence-transformers scikit-learn")
 
 # Import improved matching utilities (NEW)
@@ -566,8 +592,11 @@ try:
     from .improved_matching import (
         extract_patient_issues_enhanced,
         calculate_semantic_specialization_match,
+        therapist_specialization_masks,
         extract_therapeutic_sections,
+        score_therapeutic_sections,
         calculate_therapist_activity_score,
+        calculate_therapist_activity_scores,
         calculate_composite_score,
     )
     IMPROVED_MATCHING_AVAILABLE = True
@@ -577,7 +606,7 @@ except ImportError:
 
 # Import quality scorer (NEW)
 try:
-    from .quality_scorer import TherapistQualityScorer
+    from .quality_scorer import TherapistQualityScorer, fetch_blog_stats
     QUALITY_SCORER_AVAILABLE = True
 except ImportError:
     QUALITY_SCORER_AVAILABLE = False
@@ -585,6 +614,8 @@ except ImportError:
 
 User = get_user_model()
 
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
 # Load model once at module level for efficiency
 _EMBEDDING_MODEL = None
 
@@ -592,10 +623,148 @@ def get_embedding_model():
     """Lazy load the embedding model"""
     global _EMBEDDING_MODEL
     if _EMBEDDING_MODEL is None and EMBEDDINGS_AVAILABLE:
-        _EMBEDDING_MODEL = SentenceTransformer('all-MiniLM-L6-v2')
+        _EMBEDDING_MODEL = sentence_transformers.SentenceTransformer(EMBEDDING_MODEL_NAME)
     return _EMBEDDING_MODEL
 
 
+
+def _answer_entry(answer: SurveyAnswer) -> Dict:
+    question = answer.question
+    return {
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'answer_text': answer.answer_text or '',
+        'answer_option_id': answer.answer_option_id,
+        'answer_option_text': answer.answer_option.option_text if answer.answer_option else '',
+        'answer_rating': answer.answer_rating,
+        'answer_yes_no': answer.answer_yes_no,
+    }
+
+
+def parse_survey_answers(survey_response) -> Dict:
+    """Survey answers keyed by question id (TherapistMatcher.answers)"""
+    answers_dict = {}
+    for answer in survey_response.answers.select_related('question', 'answer_option').all():
+        answers_dict[answer.question_id] = _answer_entry(answer)
+    return answers_dict
+
+
+def parse_survey_answers_many(response_ids: List[int]) -> Dict[int, Dict]:
+    """parse_survey_answers() for many responses in one query, keyed by response id"""
+    answers = {response_id: {} for response_id in response_ids}
+    queryset = SurveyAnswer.objects.filter(
+        response_id__in=response_ids
+    ).select_related('question', 'answer_option').order_by('response_id', 'id')
+    for answer in queryset:
+        answers[answer.response_id][answer.question_id] = _answer_entry(answer)
+    return answers
+
+
+def build_patient_text(answers: Dict) -> str:
+    """Combined text of all patient answers, the text Layer 2 embeds"""
+    text_parts = []
+    
+    for qid, answer in answers.items():
+        # Add question context
+        q_text = answer.get('question_text', '')
+        
+        # Add the answer
+        if answer.get('answer_text'):
+            text_parts.append(f"{q_text}: {answer['answer_text']}")
+        elif answer.get('answer_option_text'):
+            text_parts.append(f"{q_text}: {answer['answer_option_text']}")
+        elif answer.get('answer_rating') is not None:
+            text_parts.append(f"{q_text}: rating {answer['answer_rating']}")
+    
+    return ' '.join(text_parts)
+
+
+def therapist_pool_queryset():
+    """Active therapists with everything scoring reads (profile, published posts and sections)"""
+    return User.objects.filter(
+        role='therapist',
+        is_active=True
+    ).select_related('therapist_profile').prefetch_related(
+        Prefetch(
+            'blog_posts',
+            queryset=BlogPost.objects.filter(status='published').prefetch_related('matching_sections')
+        )
+    )
+
+
+def load_therapist_pool() -> List[User]:
+    """
+    Every active therapist, loaded once for many matchers
+    
+    Pass the result as find_best_matches(pool=...) when matching many
+    patients in a row (e.g. bulk rematches) to skip the per-request load.
+    """
+    return list(therapist_pool_queryset().order_by('id'))
+
+
+def _model_encode(texts: List[str]) -> np.ndarray:
+    record_encoder_call(len(texts))
+    # The host's embedding service when configured, else this process's model
+    vectors = try_encode_remote(texts)
+    if vectors is None:
+        vectors = get_embedding_model().encode(texts)
+    return vectors
+
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Encode a batch of texts with the shared embedding model
+    
+    Texts any worker on this host has already encoded are read from the
+    shared embedding cache (matching.embedding_cache) instead.
+    """
+    cache = get_embedding_cache(EMBEDDING_MODEL_NAME)
+    if cache is None:
+        return _model_encode(texts)
+    return cache.encode(texts, _model_encode)
+
+
+def _precomputed_encoder(texts: List[str], vectors: np.ndarray):
+    """Encoder returning vectors computed earlier (anything else is encoded)"""
+    known = dict(zip(texts, vectors))
+    
+    def encode(batch: List[str]) -> np.ndarray:
+        unknown = [text for text in batch if text not in known]
+        if unknown:
+            known.update(zip(unknown, encode_texts(unknown)))
+        return np.stack([known[text] for text in batch])
+    
+    return encode
+
+
+# Runs encoder calls a matcher waits on for at most its latency budget
+_BUDGET_EXECUTOR = None
+_BUDGET_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_budget_executor() -> ThreadPoolExecutor:
+    global _BUDGET_EXECUTOR
+    with _BUDGET_EXECUTOR_LOCK:
+        if _BUDGET_EXECUTOR is None:
+            _BUDGET_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='matching-budget')
+        return _BUDGET_EXECUTOR
+
+
+def blog_post_sections(post: BlogPost) -> List[str]:
+    """Texts of a blog post that Layer 2 embeds and compares against"""
+    return [text for text, _ in scored_blog_post_sections(post)]
+
+
+def scored_blog_post_sections(post: BlogPost) -> List[Tuple[str, float]]:
+    """blog_post_sections() with each section's relevance score"""
+    if IMPROVED_MATCHING_AVAILABLE:
+        # IMPROVED: Use full content and extract therapeutic sections only
+        return score_therapeutic_sections(blog_post_text(post))
+    
+    # Fallback: use original approach
+    return [(f"{post.title}. {post.excerpt}. {post.content[:1000]}", 1.0)]
+
+
 class TherapistMatcher:
     """
     Main class for matching patients with therapists using 3-layer approach
@@ -615,18 +784,85 @@ class TherapistMatcher:
         'specialization': 0.25,     # Direct tag matching
     }
     
-    def __init__(self, survey_response: SurveyResponse):
+    def __init__(
+        self,
+        survey_response: SurveyResponse,
+        answers: Optional[Dict] = None,
+        instrumentation: Optional[MatchingInstrumentation] = None,
+        features=None,
+        latency_budget_ms: Optional[float] = None,
+        patient_embedding: Optional[np.ndarray] = None,
+        cold_start: bool = False,
+    ):
         self.survey_response = survey_response
         self.patient = survey_response.patient
-        self.answers = self._parse_answers()
-        self.patient_text = self._build_patient_context_text()
+        # Per-stage timings and query counts (see matching.instrumentation)
+        self.instrumentation = instrumentation
+        # PatientMatchFeatures computed from these answers at submission
+        # (matching.patient_features.get_patient_features checks that)
+        self.features = features
+        # Encoding that does not finish within the budget is abandoned and
+        # Layer 2 degrades (see _within_budget); None waits for the encoder
+        self.latency_budget_ms = latency_budget_ms
+        self._deadline = time.monotonic() + latency_budget_ms / 1000 if latency_budget_ms else None
+        # Fallbacks taken in this run, reported in every score_breakdown
+        self.degraded_reasons = []
+        
+        with self._stage('preferences'):
+            # Callers that already parsed the answers (result_cache) pass them in
+            self.answers = answers if answers is not None else self._parse_answers()
+            if features is not None:
+                self.patient_text = features.patient_text
+            else:
+                self.patient_text = self._build_patient_context_text()
         self.patient_embedding = None
         
-        # Pre-compute patient embedding
+        # Detected patient issues (_patient_issues)
+        self._issues = list(features.issues) if features is not None else None
+        
+        # Layer 3 (match_count, first_choice_count) per therapist id
+        self._match_stats = {}
+        # Learned Layer 3 (predicted preference, score) per therapist id (_load_learned_scores);
+        # with cold_start the patient's own learned factors are ignored (replay evaluation)
+        self.cold_start = cold_start
+        self._cf_scores = {}
+        # (outcome, support, patients) of similar past patients per therapist id
+        self._similar_patient_outcomes = {}
+        # Quality and activity scores per therapist id (_load_profile_scores)
+        self._quality_scores = {}
+        self._activity_scores = {}
+        # Specialization tag category masks per therapist id
+        self._spec_masks = {}
+        # (free slots, next available) per therapist id, when MATCHING_CAPACITY_MODE is set
+        self.capacity_mode = capacity_mode()
+        self._capacity = {}
+        
+        # Failed Layer 1 rules per therapist id (find_best_matches(debug_hard_rules=True))
+        self.hard_rule_diagnostics = {}
+        # Hard preferences and number of therapists passing Layer 1 in the last run
+        self.preferences = {}
+        self.eligible_count = 0
+        
+        # Layer 2 state: per-therapist texts and store similarities for this request
+        self._semantic_items_cache = {}
+        self._semantic_scores = None
+        self._semantic_rows = None
+        # TF-IDF similarity per therapist id when the patient embedding timed out
+        self._tfidf_scores = {}
+        
+        # Pre-compute patient embedding (the model is only loaded if encoding
+        # falls back to this process, see embedding_service). Batch matching
+        # encodes a whole cohort at once and passes each vector in.
         if EMBEDDINGS_AVAILABLE and self.patient_text:
-            model = get_embedding_model()
-            if model:
-                self.patient_embedding = model.encode([self.patient_text])[0]
+            if patient_embedding is not None:
+                self.patient_embedding = patient_embedding
+            elif features is not None and features.embedding:
+                self.patient_embedding = decode_embedding(features.embedding)
+            else:
+                with self._stage('layer2'):
+                    finished, vectors = self._within_budget('patient_embedding', encode_texts, [self.patient_text])
+                    if finished:
+                        self.patient_embedding = vectors[0]
         
         # Initialize quality scorer (NEW)
         if QUALITY_SCORER_AVAILABLE:
@@ -634,102 +870,199 @@ class TherapistMatcher:
         else:
             self.quality_scorer = None
     
+    def _stage(self, name: str):
+        """Context attributing work to a stage of self.instrumentation (no-op without one)"""
+        if self.instrumentation is None:
+            return NO_STAGE
+        return self.instrumentation.stage(name)
+    
+    @property
+    def degraded(self) -> bool:
+        """True when part of Layer 2 fell back to cheaper signals"""
+        return bool(self.degraded_reasons)
+    
+    def _within_budget(self, reason: str, func, *args) -> Tuple[bool, object]:
+        """
+        Call func(*args), waiting no longer than the rest of the latency budget
+        
+        Returns (finished, result). On timeout ``reason`` is recorded in
+        self.degraded_reasons; the call keeps running in the background, so
+        its vectors still reach the embedding cache for the upgrade run.
+        """
+        if self._deadline is None:
+            return True, func(*args)
+        
+        # Encoder calls are still attributed to this request's instrumentation
+        context = contextvars.copy_context()
+        future = _get_budget_executor().submit(context.run, func, *args)
+        try:
+            return True, future.result(timeout=max(0.0, self._deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.warning(
+                f"[MATCHING] {reason} not ready within {self.latency_budget_ms}ms "
+                f"for patient {self.patient.id}, degrading Layer 2"
+            )
+            if reason not in self.degraded_reasons:
+                self.degraded_reasons.append(reason)
+            return False, None
+    
+    def _load_preferences(self) -> Dict:
+        """Hard preferences, from the stored features when available"""
+        if self.features is not None:
+            self.preferences = dict(self.features.preferences)
+        else:
+            self.preferences = self._extract_preferences()
+        return self.preferences
+    
+    def share_therapist_state(self, other: 'TherapistMatcher') -> None:
+        """
+        Reuse another matcher's per-therapist caches
+        
+        Layer 3 statistics, quality, activity, specialization masks,
+        capacity and semantic texts do not depend on the patient, so matchers scoring the
+        same pool for different patients (batch matching) load them once.
+        """
+        self._match_stats = other._match_stats
+        self._quality_scores = other._quality_scores
+        self._activity_scores = other._activity_scores
+        self._spec_masks = other._spec_masks
+        self._capacity = other._capacity
+        self._semantic_items_cache = other._semantic_items_cache
+    
+    def _mark_degraded(self, score_breakdown: Dict) -> Dict:
+        if self.degraded_reasons:
+            score_breakdown['degraded'] = True
+            score_breakdown['degraded_reasons'] = list(self.degraded_reasons)
+        return score_breakdown
+    
     def _parse_answers(self) -> Dict:
         """Parse survey answers into a structured format"""
-        answers_dict = {}
-        for answer in self.survey_response.answers.select_related('question', 'answer_option').all():
-            question = answer.question
-            answers_dict[question.id] = {
-                'question_text': question.question_text,
-                'question_type': question.question_type,
-                'answer_text': answer.answer_text or '',
-                'answer_option_id': answer.answer_option_id,
-                'answer_option_text': answer.answer_option.option_text if answer.answer_option else '',
-                'answer_rating': answer.answer_rating,
-                'answer_yes_no': answer.answer_yes_no,
-            }
-        return answers_dict
+        return parse_survey_answers(self.survey_response)
     
     def _build_patient_context_text(self) -> str:
         """Build a combined text from all patient answers for embedding"""
-        text_parts = []
-        
-        for qid, answer in self.answers.items():
-            # Add question context
-            q_text = answer.get('question_text', '')
-            
-            # Add the answer
-            if answer.get('answer_text'):
-                text_parts.append(f"{q_text}: {answer['answer_text']}")
-            elif answer.get('answer_option_text'):
-                text_parts.append(f"{q_text}: {answer['answer_option_text']}")
-            elif answer.get('answer_rating') is not None:
-                text_parts.append(f"{q_text}: rating {answer['answer_rating']}")
-        
-        return ' '.join(text_parts)
+        return build_patient_text(self.answers)
     
-    def find_best_matches(self, top_n: int = 3) -> List[Tuple[User, float, Dict]]:
+    def find_best_matches(
+        self,
+        top_n: int = 3,
+        vectorized: bool = False,
+        debug_hard_rules: bool = False,
+        candidate_k: Optional[int] = None,
+        pool: Optional[List[User]] = None,
+    ) -> List[Tuple[User, float, Dict]]:
         """
         Find top N matching therapists for the patient
         Returns list of (therapist, score, score_breakdown) tuples
         
         IMPROVED: Uses enhanced matching logic if available
+        
+        Args:
+            top_n: Number of matches to return
+            vectorized: Score the whole candidate pool with NumPy array
+                operations instead of one therapist at a time. Produces the
+                same scores and ranking as the per-therapist path.
+            debug_hard_rules: Load every active therapist and evaluate Layer 1
+                in Python, recording each therapist's failed rules in
+                self.hard_rule_diagnostics. By default the mandatory rules
+                run in the database and failing therapists are never loaded.
+            candidate_k: Only fully score the candidate_k therapists closest
+                to the patient in the ANN index (plus therapists without any
+                indexed text). Defaults to MATCHING_ANN_CANDIDATES; None or 0
+                scores the whole pool.
+            pool: Preloaded therapists (load_therapist_pool()) to score
+                instead of querying the database. Layer 1 then runs in
+                Python and ANN retrieval is skipped.
         """
+        stage = self._stage
+        
         # Extract hard rule preferences from survey
-        preferences = self._extract_preferences()
+        with stage('preferences'):
+            preferences = self._load_preferences()
         logger.info(f"[MATCHING] Patient {self.patient.id} preferences: {preferences}")
         
-        # Start with all active therapists
-        available_therapists = User.objects.filter(
-            role='therapist',
-            is_active=True
-        ).select_related('therapist_profile').prefetch_related(
-            'blog_posts'
-        ).exclude(id=self.patient.id)
+        with stage('layer1'):
+            if pool is not None:
+                therapists = [therapist for therapist in pool if therapist.id != self.patient.id]
+            else:
+                therapists = self._load_candidate_pool(preferences, debug_hard_rules, candidate_k)
         
-        matches = []
+        if vectorized:
+            return self._score_vectorized(therapists, preferences, top_n, debug_hard_rules)
         
-        for therapist in available_therapists:
-            # Layer 1: Hard Rules (Pass/Fail)
-            layer1_result = self._layer1_hard_rules(therapist, preferences)
-            
-            therapist_display = getattr(therapist, 'email', f"ID:{therapist.id}")
-            if not layer1_result['passed']:
-                logger.info(f"[MATCHING] Therapist {therapist.id} ({therapist_display}) failed hard rules: {layer1_result['failed_rules']}")
-                continue  # Skip therapists who don't pass hard rules
-            
-            logger.info(f"[MATCHING] Therapist {therapist.id} ({therapist_display}) passed hard rules")
+        candidates = []
+        
+        with stage('layer1'):
+            for therapist in therapists:
+                # Layer 1: Hard Rules (Pass/Fail)
+                layer1_result = self._layer1_hard_rules(therapist, preferences)
+                
+                therapist_display = getattr(therapist, 'email', f"ID:{therapist.id}")
+                if debug_hard_rules:
+                    self.hard_rule_diagnostics[therapist.id] = layer1_result['failed_rules']
+                if not layer1_result['passed']:
+                    logger.info(f"[MATCHING] Therapist {therapist.id} ({therapist_display}) failed hard rules: {layer1_result['failed_rules']}")
+                    continue  # Skip therapists who don't pass hard rules
+                
+                logger.info(f"[MATCHING] Therapist {therapist.id} ({therapist_display}) passed hard rules")
+                candidates.append((therapist, layer1_result))
             
+            # Capacity: one query, then optionally drop fully booked therapists
+            self._load_capacity([therapist for therapist, _ in candidates])
+            if self.capacity_mode == 'filter':
+                candidates = [(therapist, result) for therapist, result in candidates if self._has_capacity(therapist)]
+        self.eligible_count = len(candidates)
+        
+        # Layer 2 lookups for every candidate in a single store pass
+        with stage('layer2'):
+            self._prepare_semantic_scores([therapist for therapist, _ in candidates])
+        # Layer 3 statistics, quality and activity for every candidate in bulk
+        with stage('layer3'):
+            self._load_layer3_scores([therapist.id for therapist, _ in candidates])
+            self._load_profile_scores([therapist for therapist, _ in candidates])
+        
+        matches = []
+        
+        for therapist, layer1_result in candidates:
             # Layer 2: Semantic Matching (IMPROVED)
-            layer2_result = self._layer2_semantic_matching(therapist)
+            with stage('layer2'):
+                layer2_result = self._layer2_semantic_matching(therapist)
             
             # Layer 3: Collaborative Filtering (IMPROVED with quality boost)
-            layer3_result = self._layer3_collaborative_filtering(therapist)
+            with stage('layer3'):
+                layer3_result = self._layer3_collaborative_filtering(therapist)
             
             # Specialization matching (IMPROVED)
-            spec_score = self._calculate_specialization_match(therapist)
+            with stage('spec'):
+                spec_score = self._calculate_specialization_match(therapist)
             
-            # Calculate final weighted score (IMPROVED with composite scoring)
-            final_score = (
-                self.WEIGHTS['layer2_semantic'] * layer2_result['score'] +
-                self.WEIGHTS['layer3_collaborative'] * layer3_result['score'] +
-                self.WEIGHTS['specialization'] * spec_score
-            )
-            
-            # Apply composite scoring if available (NEW)
-            if IMPROVED_MATCHING_AVAILABLE:
-                therapist_activity = calculate_therapist_activity_score(therapist)
-                survey_completion = len(self.answers) / 20  # Assume ~20 questions
-                
-                final_score = calculate_composite_score(
-                    layer2_score=layer2_result['score'],
-                    layer3_score=layer3_result['score'],
-                    spec_score=spec_score,
-                    therapist_activity=therapist_activity,
-                    survey_completion=survey_completion,
+            with stage('composite'):
+                # Calculate final weighted score (IMPROVED with composite scoring)
+                final_score = (
+                    self.WEIGHTS['layer2_semantic'] * layer2_result['score'] +
+                    self.WEIGHTS['layer3_collaborative'] * layer3_result['score'] +
+                    self.WEIGHTS['specialization'] * spec_score
                 )
                 
-                layer2_result['therapist_activity'] = therapist_activity
+                # Apply composite scoring if available (NEW)
+                if IMPROVED_MATCHING_AVAILABLE:
+                    therapist_activity = self._activity_score(therapist)
+                    survey_completion = len(self.answers) / 20  # Assume ~20 questions
+                    
+                    final_score = calculate_composite_score(
+                        layer2_score=layer2_result['score'],
+                        layer3_score=layer3_result['score'],
+                        spec_score=spec_score,
+                        therapist_activity=therapist_activity,
+                        survey_completion=survey_completion,
+                        weights=self.WEIGHTS,
+                    )
+                    
+                    layer2_result['therapist_activity'] = therapist_activity
+                
+                availability = self._availability(therapist)
+                if availability is not None and self.capacity_mode == 'penalty':
+                    final_score *= availability['factor']
             
             score_breakdown = {
                 'layer1_hard_rules': layer1_result,
@@ -738,14 +1071,191 @@ class TherapistMatcher:
                 'specialization_score': spec_score,
                 'final_score': final_score,
             }
+            if availability is not None:
+                score_breakdown['availability'] = availability
+            self._mark_degraded(score_breakdown)
             
             matches.append((therapist, final_score, score_breakdown))
         
         # Sort by final score descending
-        matches.sort(key=lambda x: x[1], reverse=True)
+        with stage('composite'):
+            matches.sort(key=lambda x: x[1], reverse=True)
         
         return matches[:top_n]
     
+    def _load_candidate_pool(
+        self,
+        preferences: Dict,
+        debug_hard_rules: bool,
+        candidate_k: Optional[int],
+    ) -> List[User]:
+        """
+        Active therapists to score, with profiles and published posts loaded
+        
+        Mandatory Layer 1 rules run in the database (unless debugging) and
+        large pools are narrowed by ANN retrieval first.
+        """
+        # Start with all active therapists
+        available_therapists = therapist_pool_queryset()
+        
+        if not debug_hard_rules:
+            # Layer 1 mandatory rules as an ORM filter
+            available_therapists = available_therapists.filter(self._hard_rules_query(preferences))
+        
+        available_therapists = available_therapists.exclude(id=self.patient.id)
+        
+        # Retrieval stage: narrow large pools to the nearest semantic candidates
+        if candidate_k is None:
+            candidate_k = getattr(settings, 'MATCHING_ANN_CANDIDATES', None)
+        if candidate_k:
+            candidate_ids = self._retrieve_candidates(available_therapists, candidate_k)
+            if candidate_ids is not None:
+                available_therapists = available_therapists.filter(id__in=candidate_ids)
+        
+        return list(available_therapists)
+    
+    def _semantic_features(self, therapists: List[User]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bio and best blog-section similarity for every therapist as arrays
+        
+        Gathered from the store similarities computed by
+        _prepare_semantic_scores(), without per-therapist Python math.
+        """
+        count = len(therapists)
+        bio_similarity = np.zeros(count)
+        blog_similarity = np.zeros(count)
+        
+        if not EMBEDDINGS_AVAILABLE or self.patient_embedding is None or self._semantic_rows is None:
+            return bio_similarity, blog_similarity
+        
+        # Texts not encoded within the latency budget have no row
+        rows = self._semantic_rows
+        bio_owners, bio_rows = [], []
+        section_owners, section_rows = [], []
+        for idx, therapist in enumerate(therapists):
+            items = self._semantic_items(therapist)
+            if items['bio'] and items['bio'][0] in rows:
+                bio_owners.append(idx)
+                bio_rows.append(rows[items['bio'][0]])
+            for key, _ in items['sections']:
+                if key in rows:
+                    section_owners.append(idx)
+                    section_rows.append(rows[key])
+        
+        scores = self._semantic_scores.astype(np.float64)
+        if bio_rows:
+            bio_similarity[bio_owners] = scores[bio_rows]
+        if section_rows:
+            best = np.full(count, -np.inf)
+            np.maximum.at(best, section_owners, scores[section_rows])
+            has_sections = np.isfinite(best)
+            blog_similarity[has_sections] = best[has_sections]
+        
+        return bio_similarity, blog_similarity
+    
+    def _score_vectorized(
+        self,
+        therapists: List[User],
+        preferences: Dict,
+        top_n: int,
+        debug_hard_rules: bool = False,
+    ) -> List[Tuple[User, float, Dict]]:
+        """
+        Whole-pool scoring with NumPy
+        
+        Applies the hard rules as a boolean mask, builds one feature array
+        per signal (semantic similarity, L3, spec, activity), combines them
+        with array operations and only builds the detailed score breakdown
+        for the selected top N.
+        """
+        stage = self._stage
+        
+        with stage('layer1'):
+            genders = [therapist.gender for therapist in therapists]
+            passed = hard_rule_mask(genders, preferences.get('gender'))
+            if debug_hard_rules:
+                for therapist in therapists:
+                    self.hard_rule_diagnostics[therapist.id] = self._layer1_hard_rules(therapist, preferences)['failed_rules']
+            therapists = [therapist for therapist, ok in zip(therapists, passed) if ok]
+            self._load_capacity(therapists)
+            if self.capacity_mode == 'filter':
+                therapists = [therapist for therapist in therapists if self._has_capacity(therapist)]
+        self.eligible_count = len(therapists)
+        logger.info(f"[MATCHING] {len(therapists)} of {len(genders)} therapists passed hard rules")
+        
+        if not therapists:
+            return []
+        
+        # Layer 2
+        with stage('layer2'):
+            self._prepare_semantic_scores(therapists)
+            if EMBEDDINGS_AVAILABLE and self.patient_embedding is not None:
+                bio_similarity, blog_similarity = self._semantic_features(therapists)
+                layer2_scores = semantic_scores(bio_similarity, blog_similarity)
+            elif EMBEDDINGS_AVAILABLE and 'patient_embedding' in self.degraded_reasons:
+                layer2_scores = np.array(
+                    [self._layer2_tfidf_fallback(therapist, {'score': 0.5})['score'] for therapist in therapists],
+                    dtype=np.float64
+                )
+            else:
+                layer2_scores = np.full(len(therapists), 0.5)
+        
+        # Layer 3 and specialization
+        with stage('layer3'):
+            self._load_layer3_scores([therapist.id for therapist in therapists])
+            self._load_profile_scores(therapists)
+            layer3_results = [self._layer3_collaborative_filtering(therapist) for therapist in therapists]
+            layer3_scores = np.array([result['score'] for result in layer3_results], dtype=np.float64)
+        with stage('spec'):
+            spec_scores = np.array(
+                [self._calculate_specialization_match(therapist) for therapist in therapists],
+                dtype=np.float64
+            )
+        
+        with stage('composite'):
+            if IMPROVED_MATCHING_AVAILABLE:
+                activity = np.array(
+                    [self._activity_score(therapist) for therapist in therapists],
+                    dtype=np.float64
+                )
+                final_scores = composite_scores(
+                    layer2_scores,
+                    layer3_scores,
+                    spec_scores,
+                    activity,
+                    survey_completion=len(self.answers) / 20,  # Assume ~20 questions
+                    weights=self.WEIGHTS,
+                )
+            else:
+                activity = None
+                final_scores = weighted_scores(layer2_scores, layer3_scores, spec_scores, self.WEIGHTS)
+            if self.capacity_mode == 'penalty':
+                final_scores = final_scores * capacity_factors(self._free_slots(therapists))
+        
+        matches = []
+        for idx in top_n_indices(final_scores, top_n):
+            therapist = therapists[idx]
+            layer1_result = self._layer1_hard_rules(therapist, preferences)
+            layer2_result = self._layer2_semantic_matching(therapist)
+            if activity is not None:
+                layer2_result['therapist_activity'] = float(activity[idx])
+            
+            final_score = float(final_scores[idx])
+            score_breakdown = {
+                'layer1_hard_rules': layer1_result,
+                'layer2_semantic': layer2_result,
+                'layer3_collaborative': layer3_results[idx],
+                'specialization_score': float(spec_scores[idx]),
+                'final_score': final_score,
+            }
+            availability = self._availability(therapist)
+            if availability is not None:
+                score_breakdown['availability'] = availability
+            self._mark_degraded(score_breakdown)
+            matches.append((therapist, final_score, score_breakdown))
+        
+        return matches
+    
     def _extract_preferences(self) -> Dict:
         """Extract patient's hard preferences from survey answers"""
         preferences = {
@@ -796,6 +1306,59 @@ class TherapistMatcher:
         
         return preferences
     
+    def _retrieve_candidates(self, therapists, candidate_k: int) -> Optional[List[int]]:
+        """
+        Ids of the therapists worth full scoring, from the ANN index
+        
+        The candidate_k best semantic matches among ``therapists`` plus
+        every therapist the index has no vectors for (their Layer 2 score
+        is the neutral default, so they cannot be ranked by retrieval).
+        Returns None when retrieval is unavailable and the whole pool
+        should be scored.
+        """
+        if not EMBEDDINGS_AVAILABLE or self.patient_embedding is None:
+            return None
+        
+        index = get_ann_index()
+        if not len(index):
+            return None
+        
+        pool_ids = list(therapists.values_list('id', flat=True))
+        if len(pool_ids) <= candidate_k:
+            return None
+        
+        nprobe = getattr(settings, 'MATCHING_ANN_NPROBE', 8)
+        retrieved = [
+            therapist_id
+            for therapist_id, _ in index.search(self.patient_embedding, candidate_k, nprobe, allowed=pool_ids)
+        ]
+        indexed = set(index.therapist_ids())
+        unindexed = [therapist_id for therapist_id in pool_ids if therapist_id not in indexed]
+        
+        logger.info(
+            f"[MATCHING] Retrieved {len(retrieved)} of {len(pool_ids)} therapists "
+            f"(+{len(unindexed)} without indexed text)"
+        )
+        return retrieved + unindexed
+    
+    def _hard_rules_query(self, preferences: Dict) -> Q:
+        """
+        Layer 1 mandatory rules as an ORM filter
+        
+        Same outcome as _layer1_hard_rules()['passed']: only gender is
+        mandatory (a stated preference must equal the therapist's gender,
+        and a missing gender fails). Consultation mode and language are soft
+        rules, reported in the breakdown but never used to exclude anyone.
+        """
+        query = Q()
+        
+        # Both sides normalised like _layer1_hard_rules (trimmed, case-insensitive)
+        required_gender = (preferences.get('gender') or '').lower().strip()
+        if required_gender:
+            query &= Q(Exact(Lower(Trim('gender')), required_gender))
+        
+        return query
+    
     def _layer1_hard_rules(self, therapist: User, preferences: Dict) -> Dict:
         """
         Layer 1: Check non-negotiable compatibility factors
@@ -812,10 +1375,9 @@ class TherapistMatcher:
         profile = getattr(therapist, 'therapist_profile', None)
         
         # Gender preference check - MANDATORY if patient specified a preference
-        required_gender = preferences.get('gender')
-        if required_gender:  # Only check if patient has a preference (not None or empty)
+        required_gender_lower = (preferences.get('gender') or '').lower().strip()
+        if required_gender_lower:  # Only check if patient has a preference (not None or empty)
             therapist_gender = (therapist.gender or '').lower().strip()
-            required_gender_lower = required_gender.lower().strip()
             
             # If therapist gender is empty/missing, they don't pass
             if not therapist_gender:
@@ -858,6 +1420,107 @@ class TherapistMatcher:
         
         return result
     
+    def _published_posts(self, therapist: User) -> List[BlogPost]:
+        """Published blog posts of a therapist (uses the prefetch cache if any)"""
+        return [post for post in therapist.blog_posts.all() if post.status == 'published']
+    
+    def _semantic_items(self, therapist: User) -> Dict:
+        """
+        Texts Layer 2 compares the patient against, with their store keys
+        
+        Cached per matcher so blog sections are only extracted once per request.
+        """
+        cached = self._semantic_items_cache.get(therapist.id)
+        if cached is not None:
+            return cached
+        
+        profile = getattr(therapist, 'therapist_profile', None)
+        items = {
+            'bio': None,          # (key, text)
+            'posts': [],          # published BlogPost objects
+            'sections': [],       # [(key, text)]
+            'section_posts': [],  # index into 'posts' for each section
+            'vectors': {},        # key -> stored BlogSection embedding
+        }
+        
+        if profile and profile.bio:
+            items['bio'] = (bio_key(therapist.id), profile.bio)
+        
+        items['posts'] = self._published_posts(therapist)
+        for post_idx, post in enumerate(items['posts']):
+            stored = list(post.matching_sections.all())
+            if sections_are_current(post, stored):
+                for section in stored:
+                    key = blog_section_key(post.id, section.position)
+                    items['sections'].append((key, section.text))
+                    items['section_posts'].append(post_idx)
+                    items['vectors'][key] = section.embedding
+                continue
+            
+            # Not pre-computed yet: extract now, embed through the store
+            for section_idx, section in enumerate(blog_post_sections(post)):
+                items['sections'].append((blog_section_key(post.id, section_idx), section))
+                items['section_posts'].append(post_idx)
+        
+        self._semantic_items_cache[therapist.id] = items
+        return items
+    
+    def _prepare_semantic_scores(self, therapists) -> None:
+        """
+        Score the patient against all therapist texts in one pass
+        
+        Blog sections pre-computed in the BlogSection table are scored with
+        one matrix product over their stored embeddings. Bios (and sections
+        not pre-computed yet) go through the embedding store: texts missing
+        or changed since they were stored are encoded in a single batch,
+        then the whole store is scored with one matrix product.
+        """
+        if not EMBEDDINGS_AVAILABLE:
+            return
+        if self.patient_embedding is None:
+            if 'patient_embedding' in self.degraded_reasons:
+                self._prepare_tfidf_scores(therapists)
+            return
+        
+        pending = []
+        table_keys, table_vectors = [], []
+        for therapist in therapists:
+            items = self._semantic_items(therapist)
+            if items['bio']:
+                pending.append(items['bio'])
+            for key, text in items['sections']:
+                if key in items['vectors']:
+                    table_keys.append(key)
+                    table_vectors.append(decode_embedding(items['vectors'][key]))
+                else:
+                    pending.append((key, text))
+        
+        store = get_embedding_store()
+        encoder = encode_texts
+        if self._deadline is not None:
+            # Encode outside the store lock: on timeout the vectors stored so
+            # far are scored and the texts still missing are left out
+            stale = dict(store.missing(pending))
+            if stale:
+                texts = list(stale.values())
+                finished, vectors = self._within_budget('therapist_embeddings', encode_texts, texts)
+                encoder = _precomputed_encoder(texts, vectors) if finished else None
+        
+        encoded = store.ensure(pending, encoder) if encoder is not None else 0
+        if encoded:
+            logger.info(f"[MATCHING] Encoded {encoded} new/changed texts into the embedding store")
+        
+        scores, rows = store.score(self.patient_embedding)
+        
+        if table_vectors:
+            query = normalize_rows(self.patient_embedding)[0]
+            offset = scores.shape[0]
+            scores = np.concatenate([scores, np.stack(table_vectors) @ query])
+            rows = dict(rows)
+            rows.update({key: offset + idx for idx, key in enumerate(table_keys)})
+        
+        self._semantic_scores, self._semantic_rows = scores, rows
+    
     def _layer2_semantic_matching(self, therapist: User) -> Dict:
         """
         Layer 2: AI-powered semantic similarity matching
@@ -866,6 +1529,8 @@ class TherapistMatcher:
         - Uses full blog content (not truncated to 1000 chars)
         - Extracts therapeutic sections intelligently
         - Better handling of semantic content
+        - Reads pre-computed embeddings from the embedding store instead of
+          encoding bios and blog sections on every request
         """
         result = {
             'score': 0.5,  # Default neutral score
@@ -874,63 +1539,58 @@ class TherapistMatcher:
             'matching_topics': [],
         }
         
-        if not EMBEDDINGS_AVAILABLE or self.patient_embedding is None:
+        if not EMBEDDINGS_AVAILABLE:
             return result
         
-        model = get_embedding_model()
-        profile = getattr(therapist, 'therapist_profile', None)
+        if self.patient_embedding is None:
+            if 'patient_embedding' in self.degraded_reasons:
+                self._layer2_tfidf_fallback(therapist, result)
+            return result
+        
+        items = self._semantic_items(therapist)
+        keys = [key for key, _ in items['sections']]
+        if items['bio']:
+            keys.append(items['bio'][0])
+        
+        # Therapist not covered by find_best_matches() preparation
+        if self._semantic_rows is None or any(key not in self._semantic_rows for key in keys):
+            if 'therapist_embeddings' not in self.degraded_reasons:
+                self._prepare_semantic_scores([therapist])
+        
+        # Texts not encoded within the latency budget are left out
+        rows = self._semantic_rows or {}
+        section_indices = [idx for idx, (key, _) in enumerate(items['sections']) if key in rows]
         
         # Bio similarity
-        if profile and profile.bio:
-            bio_embedding = model.encode([profile.bio])[0]
-            result['bio_similarity'] = float(cosine_similarity(
-                [self.patient_embedding], [bio_embedding]
-            )[0][0])
+        if items['bio'] and items['bio'][0] in rows:
+            result['bio_similarity'] = float(self._semantic_scores[rows[items['bio'][0]]])
         
         # Blog content similarity (IMPROVED)
-        blog_posts = list(therapist.blog_posts.filter(status='published'))
-        if blog_posts:
-            blog_sections = []
-            blog_post_references = []  # Keep track of which post each section came from
+        if section_indices:
+            blog_posts = items['posts']
+            blog_post_references = [items['section_posts'][idx] for idx in section_indices]
+            similarities = self._semantic_scores[
+                [rows[items['sections'][idx][0]] for idx in section_indices]
+            ]
             
-            for post_idx, post in enumerate(blog_posts):
-                # IMPROVED: Use full content, not just first 1000 chars
-                full_content = f"{post.title}. {post.excerpt}. {post.content}"
-                
-                # IMPROVED: Extract therapeutic sections only
-                if IMPROVED_MATCHING_AVAILABLE:
-                    sections = extract_therapeutic_sections(full_content)
-                    for section in sections:
-                        blog_sections.append(section)
-                        blog_post_references.append(post_idx)
-                else:
-                    # Fallback: use original approach
-                    blog_text = f"{post.title}. {post.excerpt}. {post.content[:1000]}"
-                    blog_sections.append(blog_text)
-                    blog_post_references.append(post_idx)
+            # Use max similarity (best matching blog section)
+            result['blog_similarity'] = float(np.max(similarities))
             
-            if blog_sections:
-                blog_embeddings = model.encode(blog_sections)
-                similarities = cosine_similarity([self.patient_embedding], blog_embeddings)[0]
-                
-                # Use max similarity (best matching blog section)
-                result['blog_similarity'] = float(np.max(similarities))
-                
-                # Get top matching topics from blog titles
-                top_indices = np.argsort(similarities)[-3:][::-1]
-                seen_posts = set()
-                
-                for idx in top_indices:
-                    if similarities[idx] > 0.25:
-                        post_idx = blog_post_references[idx]
-                        if post_idx not in seen_posts:
-                            post = blog_posts[post_idx]
-                            result['matching_topics'].append({
-                                'title': post.title,
-                                'category': getattr(post, 'category', 'General'),
-                                'similarity': float(similarities[idx])
-                            })
-                            seen_posts.add(post_idx)
+            # Get top matching topics from blog titles
+            top_indices = np.argsort(similarities)[-3:][::-1]
+            seen_posts = set()
+            
+            for idx in top_indices:
+                if similarities[idx] > 0.25:
+                    post_idx = blog_post_references[idx]
+                    if post_idx not in seen_posts:
+                        post = blog_posts[post_idx]
+                        result['matching_topics'].append({
+                            'title': post.title,
+                            'category': getattr(post, 'category', 'General'),
+                            'similarity': float(similarities[idx])
+                        })
+                        seen_posts.add(post_idx)
         
         # Calculate combined semantic score
         # Weight bio more if no blogs, and vice versa
@@ -946,6 +1606,36 @@ class TherapistMatcher:
         
         return result
     
+    def _prepare_tfidf_scores(self, therapists) -> None:
+        """
+        Layer 2 fallback when the patient embedding missed the latency budget
+        
+        Scores the patient text against the therapist documents of the
+        persisted TF-IDF model (matching.tfidf_model), in one sparse product.
+        """
+        owners = [therapist.id for therapist in therapists if therapist.id not in self._tfidf_scores]
+        if not owners:
+            return
+        
+        similarities = get_tfidf_model().similarities(self.patient_text, owners)
+        if similarities is None:
+            # No model fitted yet: Layer 2 stays neutral
+            self._tfidf_scores.update(dict.fromkeys(owners))
+        else:
+            self._tfidf_scores.update(zip(owners, (float(value) for value in similarities)))
+    
+    def _layer2_tfidf_fallback(self, therapist: User, result: Dict) -> Dict:
+        """Fill a Layer 2 result from the TF-IDF similarity (_prepare_tfidf_scores)"""
+        if therapist.id not in self._tfidf_scores:
+            self._prepare_tfidf_scores([therapist])
+        
+        similarity = self._tfidf_scores[therapist.id]
+        result['fallback'] = 'tfidf'
+        if similarity is not None:
+            result['tfidf_similarity'] = similarity
+            result['score'] = min(1.0, max(0.0, similarity * 1.3))
+        return result
+    
     def _layer3_collaborative_filtering(self, therapist: User) -> Dict:
         """
         Layer 3: Learn from past successful matches
@@ -953,47 +1643,143 @@ class TherapistMatcher:
         IMPROVED:
         - Quality score is automatically applied in find_best_matches()
         - Uses TherapistQualityScorer for new therapists
+        - Match statistics are loaded for the whole pool in one query
+          (see _load_match_stats); a therapist outside it costs one query
+        - Therapists in the learned collaborative model are scored from
+          appointment outcomes instead (see _load_learned_scores)
+        - Outcomes of the most similar past patients are blended in
+          (see _load_similar_patients)
         """
-        from .models import TherapistMatch
+        if therapist.id in self._cf_scores:
+            result = learned_layer3_result(*self._cf_scores[therapist.id])
+        else:
+            if therapist.id not in self._match_stats:
+                self._load_match_stats([therapist.id])
+            
+            total_matches, first_choice_matches = self._match_stats[therapist.id]
+            result = collaborative_score(total_matches, first_choice_matches)
+            
+            # IMPROVED: Boost with quality score if available
+            if self.quality_scorer and result['score'] == 0.5:  # No match history
+                quality_score = self._quality_scores.get(therapist.id)
+                if quality_score is None:
+                    quality_score = self.quality_scorer.calculate_quality_score(therapist)
+                result['score'] = quality_score
+                result['quality_boosted'] = True
+        
+        similar = self._similar_patient_outcomes.get(therapist.id)
+        if similar is not None:
+            outcome, support, patients = similar
+            result['score'] = blend_similar_patients(result['score'], outcome, support)
+            result['similar_patients_matched'] = patients
+            result['similar_patient_outcome'] = outcome
         
-        result = {
-            'score': 0.5,  # Default neutral score
-            'match_frequency': 0,
-            'first_choice_rate': 0.0,
-            'similar_patients_matched': 0,
-        }
+        return result
+    
+    def _load_profile_scores(self, therapists: List[User]) -> None:
+        """
+        Quality, activity and specialization data for many therapists at once
         
-        # Count how often this therapist appears in matches
-        total_matches = TherapistMatch.objects.filter(
-            Q(top_match_1=therapist) |
-            Q(top_match_2=therapist) |
-            Q(top_match_3=therapist)
-        ).count()
+        Quality and activity are derived from the same published-blog
+        statistics, fetched in one grouped query; quality scores and
+        specialization masks are served from the cache where possible.
+        """
+        if not therapists or not QUALITY_SCORER_AVAILABLE:
+            return
         
-        first_choice_matches = TherapistMatch.objects.filter(
-            top_match_1=therapist
-        ).count()
+        try:
+            blog_stats = fetch_blog_stats([therapist.id for therapist in therapists])
+        except Exception as e:
+            logger.warning(f"[MATCHING] Could not load blog statistics: {e}")
+            return
         
-        result['match_frequency'] = total_matches
+        if IMPROVED_MATCHING_AVAILABLE:
+            self._activity_scores.update(calculate_therapist_activity_scores(therapists, blog_stats))
+            self._spec_masks.update(therapist_specialization_masks(therapists))
+        if self.quality_scorer:
+            self._quality_scores.update(self.quality_scorer.score_many(therapists, blog_stats))
+    
+    def _activity_score(self, therapist: User) -> float:
+        """Therapist activity score, from the bulk load when available"""
+        activity = self._activity_scores.get(therapist.id)
+        if activity is None:
+            activity = calculate_therapist_activity_score(therapist)
+        return activity
+    
+    def _load_match_stats(self, therapist_ids: List[int]) -> None:
+        """Fetch Layer 3 match statistics for many therapists at once"""
+        self._match_stats.update(get_match_stats(therapist_ids))
+    
+    def _load_capacity(self, therapists: List[User]) -> None:
+        """Free-slot counts for many therapists at once (skipped when capacity is ignored)"""
+        missing = [therapist.id for therapist in therapists if therapist.id not in self._capacity]
+        if self.capacity_mode is None or not missing:
+            return
+        capacity = get_capacity(missing)
+        for therapist_id in missing:
+            self._capacity[therapist_id] = capacity.get(therapist_id)
+    
+    def _free_slots(self, therapists: List[User]) -> np.ndarray:
+        """Free slots per therapist, -1 for therapists never counted"""
+        return np.array([
+            capacity[0] if capacity is not None else -1
+            for capacity in (self._capacity.get(therapist.id) for therapist in therapists)
+        ], dtype=np.float64)
+    
+    def _has_capacity(self, therapist: User) -> bool:
+        """False only for therapists counted with no free slot"""
+        capacity = self._capacity.get(therapist.id)
+        return capacity is None or capacity[0] > 0
+    
+    def _availability(self, therapist: User) -> Optional[Dict]:
+        """Availability part of a score breakdown; None when capacity is ignored"""
+        if self.capacity_mode is None:
+            return None
+        capacity = self._capacity.get(therapist.id)
+        if capacity is None:
+            return {'free_slots': None, 'next_available_at': None, 'factor': 1.0}
+        free, earliest = capacity
+        return {
+            'free_slots': free,
+            'next_available_at': earliest.isoformat() if earliest else None,
+            'factor': float(capacity_factors([free])[0]),
+        }
+    
+    def _load_learned_scores(self, therapist_ids: List[int]) -> None:
+        """
+        Learned Layer 3 scores for every therapist in the collaborative model
         
-        if total_matches > 0:
-            result['first_choice_rate'] = first_choice_matches / total_matches
-            result['similar_patients_matched'] = total_matches
-            
-            # Score based on frequency and first-choice rate
-            # More matches and higher first-choice rate = better score
-            frequency_score = min(1.0, total_matches / 20)  # Cap at 20 matches
-            first_choice_score = result['first_choice_rate']
-            
-            result['score'] = 0.3 + (frequency_score * 0.3) + (first_choice_score * 0.4)
+        One dot product per therapist against the patient's factors (learned,
+        or predicted from the survey embedding for new patients); no queries.
+        """
+        model = get_collaborative_model()
+        if not therapist_ids or not model.exists:
+            return
+        
+        vector = model.patient_vector(self.patient.id, self.patient_embedding, learned=not self.cold_start)
+        known, predictions = model.predict(vector, therapist_ids)
+        for therapist_id, prediction, score in zip(known, predictions, learned_layer3_scores(predictions)):
+            self._cf_scores[therapist_id] = (float(prediction), float(score))
+    
+    def _load_similar_patients(self) -> None:
+        """
+        Per-therapist outcomes of the patients most similar to this one
         
-        # IMPROVED: Boost with quality score if available
-        if self.quality_scorer and result['score'] == 0.5:  # No match history
-            quality_score = self.quality_scorer.calculate_quality_score(therapist)
-            result['score'] = quality_score
-            result['quality_boosted'] = True
+        One product of the patient embedding with the similar-patient
+        index; skipped without an embedding or a built index.
+        """
+        index = get_patient_index()
+        if self.patient_embedding is None or not index.exists():
+            return
         
-        return result
+        k = getattr(settings, 'MATCHING_SIMILAR_PATIENTS_K', 20)
+        self._similar_patient_outcomes = index.therapist_outcomes(self.patient_embedding, k, exclude=self.patient.id)
+    
+    def _load_layer3_scores(self, therapist_ids: List[int]) -> None:
+        """Learned scores where available, match statistics for the other therapists"""
+        self._load_learned_scores(therapist_ids)
+        self._load_match_stats([therapist_id for therapist_id in therapist_ids if therapist_id not in self._cf_scores])
+        self._load_similar_patients()
     
     def _calculate_specialization_match(self, therapist: User) -> float:
         """
@@ -1010,12 +1796,15 @@ class TherapistMatcher:
         therapist_tags = profile.specialization_tags if isinstance(profile.specialization_tags, list) else []
         
         # IMPROVED: Use enhanced issue extraction
+        patient_issues = self._patient_issues()
         if IMPROVED_MATCHING_AVAILABLE:
-            patient_issues = extract_patient_issues_enhanced(self.answers)
-            return calculate_semantic_specialization_match(patient_issues, therapist_tags)
+            return calculate_semantic_specialization_match(
+                patient_issues,
+                therapist_tags,
+                therapist_mask=self._spec_masks.get(therapist.id),
+            )
         else:
             # Fallback to original logic
-            patient_issues = self._extract_patient_issues()
             therapist_tags = [tag.lower() for tag in therapist_tags]
             
             if not patient_issues:
@@ -1085,18 +1874,28 @@ class TherapistMatcher:
         
         return issues
     
+    def _patient_issues(self) -> List[str]:
+        """Patient issues, extracted once per matcher and reused for every therapist"""
+        if self._issues is None:
+            if IMPROVED_MATCHING_AVAILABLE:
+                self._issues = extract_patient_issues_enhanced(self.answers)
+            else:
+                self._issues = self._extract_patient_issues()
+        return self._issues
+    
     def generate_match_reasons(self, therapist: User, score_breakdown: Dict) -> List[str]:
         """Generate human-readable reasons for the match"""
+        with self._stage('reasons'):
+            return self._match_reasons(therapist, score_breakdown)
+    
+    def _match_reasons(self, therapist: User, score_breakdown: Dict) -> List[str]:
         reasons = []
         profile = getattr(therapist, 'therapist_profile', None)
         
         # Specialization-based reasons
         if profile and profile.specialization_tags:
             # IMPROVED: Use enhanced issue extraction
-            if IMPROVED_MATCHING_AVAILABLE:
-                patient_issues = extract_patient_issues_enhanced(self.answers)
-            else:
-                patient_issues = self._extract_patient_issues()
+            patient_issues = self._patient_issues()
             
             for tag in profile.specialization_tags[:2]:
                 for issue in patient_issues:
@@ -1124,7 +1923,11 @@ class TherapistMatcher:
         
         # Collaborative filtering reasons
         layer3 = score_breakdown.get('layer3_collaborative', {})
-        if layer3.get('first_choice_rate', 0) > 0.5:
+        if layer3.get('learned') and layer3.get('predicted_preference', 0) > 0.7:
+            reasons.append("Patients like you had good outcomes with them")
+        elif layer3.get('similar_patients_matched', 0) >= 2 and layer3.get('similar_patient_outcome', 0) > 0.7:
+            reasons.append("Helped patients with concerns like yours")
+        elif layer3.get('first_choice_rate', 0) > 0.5:
             reasons.append("Highly recommended by similar patients")
         elif layer3.get('match_frequency', 0) > 5:
             reasons.append("Successfully matched with many patients")
@@ -1140,6 +1943,13 @@ class TherapistMatcher:
                 if profile.is_verified:
                     reasons.append("Verified by our team")
         
+        # Availability (when capacity-aware ranking is on)
+        availability = score_breakdown.get('availability') or {}
+        if availability.get('next_available_at'):
+            next_available = datetime.fromisoformat(availability['next_available_at'])
+            if next_available - timezone.now() < timedelta(days=3):
+                reasons.append("Has openings in the next few days")
+        
         # Consultation mode
         if profile and profile.consultation_mode:
             if profile.consultation_mode == 'both':
@@ -0,0 +1,404 @@
+"""
+Approximate Nearest-Neighbour Candidate Retrieval
+IVF (inverted file) index over therapist bio and blog-section embeddings
+
+Vectors are clustered with spherical k-means; a query is compared with
+the centroids and only the vectors of the ``nprobe`` closest clusters are
+scored. Per therapist, the bio similarity and best section similarity are
+combined exactly like Layer 2 (vectorized.semantic_scores), and the top-K
+therapists become the candidate pool for full scoring.
+
+The index lives on disk next to the embedding store and is updated
+incrementally when a bio or blog post changes: new vectors are assigned
+to their nearest centroid, and the clustering is retrained once the index
+has grown well beyond the size it was trained on.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .embedding_store import directory_lock, normalize_rows
+from .vectorized import semantic_scores
+
+logger = logging.getLogger(__name__)
+
+KIND_BIO = 0
+KIND_SECTION = 1
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster L2-normalised vectors by cosine similarity
+
+    Returns:
+        (centroids, assignment of each vector)
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, vectors.shape[0]))
+    centroids = vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)].copy()
+
+    assignments = np.zeros(vectors.shape[0], dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters with random vectors
+        if empty.any():
+            sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()))]
+        centroids = normalize_rows(sums)
+
+    assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+    return centroids, assignments
+
+
+class IVFIndex:
+    """
+    Disk-backed IVF index of therapist vectors
+
+    Layout inside ``directory``:
+    - ivf.npz:        vectors, owners (therapist ids), kinds, assignments, centroids
+    - ivf_keys.json:  store key of every vector row plus training metadata
+    """
+
+    DATA_FILE = 'ivf.npz'
+    KEYS_FILE = 'ivf_keys.json'
+    LOCK_FILE = '.ivf.lock'
+
+    # Retrain the clustering once the index has grown by this factor
+    RETRAIN_GROWTH = 2.0
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.keys: List[str] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.owners = np.zeros(0, dtype=np.int64)
+        self.kinds = np.zeros(0, dtype=np.int8)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.trained_size = 0
+
+    # ------------------------------------------------------------------
+    # Loading / saving
+    # ------------------------------------------------------------------
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.directory, self.KEYS_FILE)
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.directory, self.DATA_FILE)
+
+    def _keys_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._keys_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        mtime = self._keys_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+
+        try:
+            with open(self._keys_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with np.load(self._data_path) as data:
+                vectors = data['vectors']
+                owners = data['owners']
+                kinds = data['kinds']
+                assignments = data['assignments']
+                centroids = data['centroids']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load ANN index from {self.directory}: {e}")
+            return
+
+        self.keys = meta['keys']
+        self.trained_size = meta.get('trained_size', len(self.keys))
+        self.vectors = vectors.astype(np.float32, copy=False)
+        self.owners = owners
+        self.kinds = kinds
+        self.assignments = assignments
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self._loaded_mtime = mtime
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        data_tmp = self._data_path + '.tmp.npz'
+        keys_tmp = self._keys_path + '.tmp'
+
+        np.savez(
+            data_tmp,
+            vectors=self.vectors,
+            owners=self.owners,
+            kinds=self.kinds,
+            assignments=self.assignments,
+            centroids=self.centroids,
+        )
+        with open(keys_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'keys': self.keys, 'trained_size': self.trained_size}, f)
+
+        # Data first so a reader never sees keys pointing past the arrays
+        os.replace(data_tmp, self._data_path)
+        os.replace(keys_tmp, self._keys_path)
+        self._loaded_mtime = self._keys_mtime()
+
+    # ------------------------------------------------------------------
+    # Building and incremental updates
+    # ------------------------------------------------------------------
+
+    def build(
+        self,
+        keys: List[str],
+        owners: Iterable[int],
+        kinds: Iterable[int],
+        vectors: np.ndarray,
+        n_clusters: Optional[int] = None,
+    ) -> None:
+        """Replace the whole index and train the clustering from scratch"""
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reset()
+            if keys:
+                self.keys = list(keys)
+                self.vectors = normalize_rows(vectors)
+                self.owners = np.asarray(list(owners), dtype=np.int64)
+                self.kinds = np.asarray(list(kinds), dtype=np.int8)
+                self._train(n_clusters)
+            self._save()
+
+    def _train(self, n_clusters: Optional[int] = None) -> None:
+        count = self.vectors.shape[0]
+        if n_clusters is None:
+            n_clusters = max(1, int(np.sqrt(count)))
+        self.centroids, self.assignments = spherical_kmeans(self.vectors, n_clusters)
+        self.trained_size = count
+
+    def replace_owner(
+        self,
+        owner: int,
+        keys: List[str],
+        kinds: Iterable[int],
+        vectors: Optional[np.ndarray],
+    ) -> None:
+        """
+        Swap all vectors of one therapist for a new set
+
+        New vectors go to their nearest existing centroid; the clustering
+        is retrained when the index has outgrown it.
+        """
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reload_if_changed()
+
+            keep = self.owners != owner
+            self.keys = [key for key, kept in zip(self.keys, keep) if kept]
+            if self.vectors.size:
+                self.vectors = self.vectors[keep]
+            self.owners = self.owners[keep]
+            self.kinds = self.kinds[keep]
+            self.assignments = self.assignments[keep]
+
+            if keys:
+                new_vectors = normalize_rows(vectors)
+                if self.vectors.size == 0:
+                    self.vectors = np.zeros((0, new_vectors.shape[1]), dtype=np.float32)
+                self.keys.extend(keys)
+                self.vectors = np.vstack([self.vectors, new_vectors])
+                self.owners = np.concatenate([self.owners, np.full(len(keys), owner, dtype=np.int64)])
+                self.kinds = np.concatenate([self.kinds, np.asarray(list(kinds), dtype=np.int8)])
+
+                if self.centroids.size == 0 or len(self.keys) > self.trained_size * self.RETRAIN_GROWTH:
+                    self._train()
+                else:
+                    new_assignments = np.argmax(new_vectors @ self.centroids.T, axis=1).astype(np.int32)
+                    self.assignments = np.concatenate([self.assignments, new_assignments])
+
+            self._save()
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        """True once the index has been built (see build_ann_index)"""
+        return os.path.exists(self._keys_path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self.keys)
+
+    def therapist_ids(self) -> List[int]:
+        with self._lock:
+            self._reload_if_changed()
+            return [int(owner) for owner in np.unique(self.owners)]
+
+    def _rank(self, rows: np.ndarray, similarities: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Aggregate row similarities per therapist and return the top k"""
+        if rows.size == 0:
+            return []
+
+        owners = self.owners[rows]
+        kinds = self.kinds[rows]
+        unique_owners, owner_idx = np.unique(owners, return_inverse=True)
+
+        bio = np.zeros(unique_owners.shape[0])
+        blog = np.full(unique_owners.shape[0], -np.inf)
+        is_bio = kinds == KIND_BIO
+        bio[owner_idx[is_bio]] = similarities[is_bio]
+        np.maximum.at(blog, owner_idx[~is_bio], similarities[~is_bio])
+        blog[~np.isfinite(blog)] = 0.0
+
+        scores = semantic_scores(bio, blog)
+        order = np.lexsort((unique_owners, -scores))[:k]
+        return [(int(unique_owners[i]), float(scores[i])) for i in order]
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        allowed: Optional[Iterable[int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k therapists (id, Layer-2 style score) from the closest clusters
+
+        ``allowed`` restricts the result to those therapist ids (e.g. the
+        ones passing the Layer 1 hard rules).
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if not self.keys:
+                return []
+
+            query = normalize_rows(query)[0]
+            probe = np.argsort(-(self.centroids @ query))[:max(1, nprobe)]
+            mask = np.isin(self.assignments, probe)
+            if allowed is not None:
+                mask &= np.isin(self.owners, np.fromiter(allowed, dtype=np.int64))
+            rows = np.flatnonzero(mask)
+            return self._rank(rows, self.vectors[rows] @ query, k)
+
+    def exhaustive_search(
+        self,
+        query: np.ndarray,
+        k: int,
+        allowed: Optional[Iterable[int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Exact top-k over every vector (reference for recall)"""
+        with self._lock:
+            self._reload_if_changed()
+            if not self.keys:
+                return []
+
+            query = normalize_rows(query)[0]
+            if allowed is not None:
+                rows = np.flatnonzero(np.isin(self.owners, np.fromiter(allowed, dtype=np.int64)))
+            else:
+                rows = np.arange(len(self.keys))
+            return self._rank(rows, self.vectors[rows] @ query, k)
+
+    def recall_at_k(self, queries: np.ndarray, k: int, nprobe: int = 8) -> float:
+        """Mean fraction of the exact top-k therapists found by search()"""
+        queries = normalize_rows(queries)
+        recalls = []
+        for query in queries:
+            exact = {owner for owner, _ in self.exhaustive_search(query, k)}
+            if not exact:
+                continue
+            found = {owner for owner, _ in self.search(query, k, nprobe)}
+            recalls.append(len(exact & found) / len(exact))
+        return float(np.mean(recalls)) if recalls else 1.0
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_ann_index() -> IVFIndex:
+    """Process-wide ANN index (stored in MATCHING_ANN_INDEX_DIR)"""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            directory = getattr(
+                settings,
+                'MATCHING_ANN_INDEX_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'ann'),
+            )
+            _INDEX = IVFIndex(str(directory))
+        return _INDEX
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the index when MATCHING_ANN_INDEX_DIR is overridden (tests, benchmarks)"""
+    global _INDEX
+    if setting == 'MATCHING_ANN_INDEX_DIR':
+        with _INDEX_LOCK:
+            _INDEX = None
+
+
+def therapist_vectors(therapist_ids: Iterable[int]) -> Tuple[List[str], List[int], List[int], np.ndarray]:
+    """
+    Gather index entries from the embedding store (bios) and BlogSection rows
+
+    Returns:
+        (keys, owners, kinds, vectors)
+    """
+    from .blog_sections import decode_embedding
+    from .embedding_store import bio_key, blog_section_key, get_embedding_store
+    from .models import BlogSection
+
+    therapist_ids = list(therapist_ids)
+    keys, owners, kinds, vectors = [], [], [], []
+
+    bios = get_embedding_store().vectors(bio_key(therapist_id) for therapist_id in therapist_ids)
+    for therapist_id in therapist_ids:
+        vector = bios.get(bio_key(therapist_id))
+        if vector is not None:
+            keys.append(bio_key(therapist_id))
+            owners.append(therapist_id)
+            kinds.append(KIND_BIO)
+            vectors.append(vector)
+
+    sections = BlogSection.objects.filter(
+        post__author_id__in=therapist_ids,
+        post__status='published',
+        embedding__isnull=False,
+    ).values_list('post_id', 'post__author_id', 'position', 'embedding')
+    for post_id, author_id, position, embedding in sections.iterator():
+        keys.append(blog_section_key(post_id, position))
+        owners.append(author_id)
+        kinds.append(KIND_SECTION)
+        vectors.append(decode_embedding(embedding))
+
+    matrix = np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return keys, owners, kinds, matrix
+
+
+def refresh_ann_therapist(therapist_id: int) -> None:
+    """Re-index one therapist after their bio or blog sections changed"""
+    index = get_ann_index()
+    if not index.exists():
+        return  # Index not built yet (see build_ann_index)
+
+    keys, _, kinds, vectors = therapist_vectors([therapist_id])
+    index.replace_owner(therapist_id, keys, kinds, vectors if keys else None)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MatchingConfig(AppConfig):
     name = 'matching'
+
+    def ready(self):
+        import matching.signals  # Keeps the embedding store in sync
@@ -0,0 +1,357 @@
+"""
+Batch Matching
+Match a cohort of survey responses against the therapist pool at once
+
+find_best_matches() handles one patient per call: every call loads the
+pool, encodes one text and scores it against the whole embedding store.
+match_cohort() instead:
+
+- loads the pool and the therapist-side scores (Layer 3, quality,
+  activity, specialization masks, capacity) once for the cohort
+- encodes every patient text not covered by stored features in a single
+  encoder batch
+- computes the patient x therapist-text similarity matrix with one
+  matrix product and reduces it to bio / best-section similarities
+- scores learned Layer 3 (matching.collaborative_model) for the cohort
+  with one patient-factor x therapist-factor product, and looks up every
+  patient's similar past patients (matching.patient_index) with another
+- applies the hard rules (and the capacity filter or penalty) as one
+  mask per patient and ranks each row with the functions of
+  matching.vectorized
+
+Scores and rankings are those of find_best_matches(vectorized=True).
+"""
+
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from surveys.models import SurveyResponse
+from .blog_sections import decode_embedding
+from .collaborative_model import get_collaborative_model, learned_layer3_scores
+from .capacity import capacity_factors
+from .embedding_store import get_embedding_store, normalize_rows
+from .patient_index import blend_similar_patients, get_patient_index
+from .models import PatientMatchFeatures
+from .result_cache import survey_fingerprint
+from .vectorized import composite_scores, hard_rule_mask, semantic_scores, top_n_indices, weighted_scores
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class CohortMatch(NamedTuple):
+    """Top matches of one survey response"""
+    survey_response: SurveyResponse
+    matcher: object  # TherapistMatcher, for generate_match_reasons()
+    matches: List[Tuple[User, float, Dict]]
+
+
+class TextMatrix(NamedTuple):
+    """Stored vectors of every therapist text in the pool"""
+    vectors: np.ndarray           # (texts, dim), unit rows
+    columns: Dict[str, int]       # store key -> row of ``vectors``
+    bio_owners: np.ndarray        # therapist index of each bio
+    bio_columns: np.ndarray
+    section_owners: np.ndarray    # therapist index of each blog section
+    section_columns: np.ndarray
+
+
+def _cohort_matchers(responses: List[SurveyResponse]) -> List:
+    """
+    One TherapistMatcher per response, with patient texts encoded in one batch
+
+    Answers are read in one query; stored PatientMatchFeatures computed
+    from the same answers are used as in run_matching.
+    """
+    from .algorithm import (
+        EMBEDDINGS_AVAILABLE,
+        TherapistMatcher,
+        build_patient_text,
+        encode_texts,
+        parse_survey_answers_many,
+    )
+
+    answers = parse_survey_answers_many([response.id for response in responses])
+    stored = {
+        features.survey_response_id: features
+        for features in PatientMatchFeatures.objects.filter(survey_response__in=responses)
+    }
+
+    features, embeddings, pending = {}, {}, {}
+    for response in responses:
+        current = stored.get(response.id)
+        if current is not None and current.survey_fingerprint == survey_fingerprint(answers[response.id]):
+            features[response.id] = current
+            if current.embedding:
+                continue
+        text = current.patient_text if response.id in features else build_patient_text(answers[response.id])
+        if EMBEDDINGS_AVAILABLE and text:
+            pending[response.id] = text
+
+    if pending:
+        vectors = encode_texts(list(pending.values()))
+        embeddings = dict(zip(pending.keys(), vectors))
+
+    return [
+        TherapistMatcher(
+            response,
+            answers=answers[response.id],
+            features=features.get(response.id),
+            patient_embedding=embeddings.get(response.id),
+        )
+        for response in responses
+    ]
+
+
+def _text_matrix(matcher, therapists: List[User]) -> TextMatrix:
+    """
+    Vectors of every bio and blog section of the pool, in one array
+
+    Sections pre-computed in the BlogSection table come from there; bios
+    and other sections go through the embedding store (texts missing from
+    it are encoded in one batch, as in _prepare_semantic_scores).
+    """
+    from .algorithm import encode_texts
+
+    bio_keys, bio_owners = [], []
+    section_keys, section_owners = [], []
+    table_vectors, pending = {}, []
+    for idx, therapist in enumerate(therapists):
+        items = matcher._semantic_items(therapist)
+        if items['bio']:
+            bio_keys.append(items['bio'][0])
+            bio_owners.append(idx)
+            pending.append(items['bio'])
+        for key, text in items['sections']:
+            section_keys.append(key)
+            section_owners.append(idx)
+            if key in items['vectors']:
+                table_vectors[key] = decode_embedding(items['vectors'][key])
+            else:
+                pending.append((key, text))
+
+    store = get_embedding_store()
+    encoded = store.ensure(pending, encode_texts)
+    if encoded:
+        logger.info(f"[MATCHING] Encoded {encoded} new/changed texts into the embedding store")
+
+    vectors = store.vectors(key for key in bio_keys + section_keys if key not in table_vectors)
+    vectors.update(table_vectors)
+
+    columns = {key: column for column, key in enumerate(dict.fromkeys(bio_keys + section_keys))}
+    if columns:
+        matrix = np.stack([vectors[key] for key in columns]).astype(np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    return TextMatrix(
+        vectors=matrix,
+        columns=columns,
+        bio_owners=np.array(bio_owners, dtype=np.intp),
+        bio_columns=np.array([columns[key] for key in bio_keys], dtype=np.intp),
+        section_owners=np.array(section_owners, dtype=np.intp),
+        section_columns=np.array([columns[key] for key in section_keys], dtype=np.intp),
+    )
+
+
+def _similarity_features(
+    patients: np.ndarray,
+    texts: TextMatrix,
+    therapist_count: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Patient x text similarities and the bio / best-section arrays derived from them
+
+    Returns (similarities, bio, blog); the last two are (patients, therapists)
+    like _semantic_features() returns for one patient.
+    """
+    similarities = normalize_rows(patients) @ texts.vectors.T
+    bio = np.zeros((patients.shape[0], therapist_count))
+    blog = np.zeros((patients.shape[0], therapist_count))
+
+    scores = similarities.astype(np.float64)
+    if texts.bio_columns.size:
+        bio[:, texts.bio_owners] = scores[:, texts.bio_columns]
+    if texts.section_columns.size:
+        best = np.full((therapist_count, patients.shape[0]), -np.inf)
+        np.maximum.at(best, texts.section_owners, scores[:, texts.section_columns].T)
+        best = best.T
+        has_sections = np.isfinite(best)
+        blog[has_sections] = best[has_sections]
+
+    return similarities, bio, blog
+
+
+def _learned_layer3(matchers: List, therapists: List[User]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Learned Layer 3 for the cohort: (therapist indices, predictions)
+
+    Predictions are (patients, therapists in the model); None without a
+    trained model.
+    """
+    model = get_collaborative_model()
+    if not therapists or not model.exists:
+        return None
+
+    patients = np.stack([
+        model.patient_vector(matcher.patient.id, matcher.patient_embedding, learned=not matcher.cold_start)
+        for matcher in matchers
+    ])
+    known, predictions = model.predict(patients, [therapist.id for therapist in therapists])
+    positions = {therapist.id: idx for idx, therapist in enumerate(therapists)}
+    return np.array([positions[therapist_id] for therapist_id in known], dtype=np.intp), predictions
+
+
+def _load_similar_patients(matchers: List) -> None:
+    """Similar-patient outcomes of every matcher with an embedding, in one product"""
+    index = get_patient_index()
+    encoded = [matcher for matcher in matchers if matcher.patient_embedding is not None]
+    if not encoded or not index.exists():
+        return
+
+    outcomes = index.therapist_outcomes_many(
+        np.stack([matcher.patient_embedding for matcher in encoded]),
+        getattr(settings, 'MATCHING_SIMILAR_PATIENTS_K', 20),
+        exclude=[matcher.patient.id for matcher in encoded],
+    )
+    for matcher, similar in zip(encoded, outcomes):
+        matcher._similar_patient_outcomes = similar
+
+
+def match_cohort(
+    survey_response_ids: Sequence[int],
+    top_n: int = 3,
+    pool: Optional[List[User]] = None,
+) -> List[CohortMatch]:
+    """
+    Top ``top_n`` therapists for every survey response, in id order
+
+    Args:
+        survey_response_ids: Responses to match (unknown ids are skipped)
+        top_n: Matches returned per response
+        pool: Preloaded therapists (load_therapist_pool()), else loaded here
+    """
+    from .algorithm import EMBEDDINGS_AVAILABLE, IMPROVED_MATCHING_AVAILABLE, TherapistMatcher, load_therapist_pool
+
+    responses = list(
+        SurveyResponse.objects.filter(id__in=list(survey_response_ids)).select_related('patient').order_by('id')
+    )
+    if not responses:
+        return []
+
+    matchers = _cohort_matchers(responses)
+    therapists = pool if pool is not None else load_therapist_pool()
+
+    # Therapist-side scores, shared by every matcher of the cohort
+    shared = matchers[0]
+    shared._load_match_stats([therapist.id for therapist in therapists])
+    shared._load_profile_scores(therapists)
+    shared._load_capacity(therapists)
+    for matcher in matchers[1:]:
+        matcher.share_therapist_state(shared)
+
+    layer3_results = [shared._layer3_collaborative_filtering(therapist) for therapist in therapists]
+    layer3_scores = np.tile(
+        np.array([result['score'] for result in layer3_results], dtype=np.float64), (len(matchers), 1)
+    )
+    learned = _learned_layer3(matchers, therapists)
+    if learned is not None:
+        learned_columns, predictions = learned
+        learned_scores = learned_layer3_scores(predictions)
+        layer3_scores[:, learned_columns] = learned_scores
+
+    _load_similar_patients(matchers)
+    positions = {therapist.id: idx for idx, therapist in enumerate(therapists)}
+    for row, matcher in enumerate(matchers):
+        for therapist_id, (outcome, support, _) in matcher._similar_patient_outcomes.items():
+            idx = positions.get(therapist_id)
+            if idx is not None:
+                layer3_scores[row, idx] = blend_similar_patients(layer3_scores[row, idx], outcome, support)
+
+    activity = None
+    if IMPROVED_MATCHING_AVAILABLE:
+        activity = np.array([shared._activity_score(therapist) for therapist in therapists], dtype=np.float64)
+
+    # Layer 2 for the whole cohort: one matrix product
+    layer2_scores = np.full((len(matchers), len(therapists)), 0.5)
+    encoded = [idx for idx, matcher in enumerate(matchers) if matcher.patient_embedding is not None]
+    if EMBEDDINGS_AVAILABLE and encoded and therapists:
+        texts = _text_matrix(shared, therapists)
+        if texts.columns:
+            patients = np.stack([matchers[idx].patient_embedding for idx in encoded])
+            similarities, bio, blog = _similarity_features(patients, texts, len(therapists))
+            layer2_scores[encoded] = semantic_scores(bio, blog)
+            for row, idx in enumerate(encoded):
+                # What _prepare_semantic_scores() would have produced
+                matchers[idx]._semantic_scores = similarities[row]
+                matchers[idx]._semantic_rows = texts.columns
+
+    genders = [therapist.gender for therapist in therapists]
+    therapist_ids = np.array([therapist.id for therapist in therapists])
+    free_slots = shared._free_slots(therapists)
+
+    results = []
+    for row, (response, matcher) in enumerate(zip(responses, matchers)):
+        preferences = matcher._load_preferences()
+        passed = hard_rule_mask(genders, preferences.get('gender')) & (therapist_ids != matcher.patient.id)
+        if matcher.capacity_mode == 'filter':
+            passed &= free_slots != 0
+        eligible = np.flatnonzero(passed)
+        matcher.eligible_count = len(eligible)
+
+        spec_scores = np.array(
+            [matcher._calculate_specialization_match(therapists[idx]) for idx in eligible],
+            dtype=np.float64
+        )
+        if activity is not None:
+            final_scores = composite_scores(
+                layer2_scores[row, eligible],
+                layer3_scores[row, eligible],
+                spec_scores,
+                activity[eligible],
+                survey_completion=len(matcher.answers) / 20,  # Assume ~20 questions
+                weights=TherapistMatcher.WEIGHTS,
+            )
+        else:
+            final_scores = weighted_scores(
+                layer2_scores[row, eligible], layer3_scores[row, eligible], spec_scores, TherapistMatcher.WEIGHTS
+            )
+        if matcher.capacity_mode == 'penalty':
+            final_scores = final_scores * capacity_factors(free_slots[eligible])
+
+        if learned is not None:
+            # What _load_learned_scores() would have produced
+            for column, idx in enumerate(learned_columns):
+                matcher._cf_scores[therapists[idx].id] = (
+                    float(predictions[row, column]), float(learned_scores[row, column])
+                )
+
+        matches = []
+        for position in top_n_indices(final_scores, top_n):
+            idx = eligible[position]
+            therapist = therapists[idx]
+            layer2_result = matcher._layer2_semantic_matching(therapist)
+            if activity is not None:
+                layer2_result['therapist_activity'] = float(activity[idx])
+
+            final_score = float(final_scores[position])
+            breakdown = {
+                'layer1_hard_rules': matcher._layer1_hard_rules(therapist, preferences),
+                'layer2_semantic': layer2_result,
+                'layer3_collaborative': matcher._layer3_collaborative_filtering(therapist),
+                'specialization_score': float(spec_scores[position]),
+                'final_score': final_score,
+            }
+            availability = matcher._availability(therapist)
+            if availability is not None:
+                breakdown['availability'] = availability
+            matches.append((therapist, final_score, breakdown))
+
+        results.append(CohortMatch(response, matcher, matches))
+
+    return results
@@ -0,0 +1,6 @@
+"""
+Matching Benchmarks
+Synthetic therapist pools and per-stage latency / query / memory reports
+
+Run with `python manage.py benchmark_matching` (see runner.run_benchmark).
+"""
@@ -0,0 +1,320 @@
+"""
+Matching Replay Evaluation
+Ranking quality and cost of today's matchers on historical survey responses
+
+Each submitted SurveyResponse whose patient went on to book is a test
+case. The therapists booked afterwards are the relevant ones: an
+appointment attached to the response counts for it, an unattached one
+for the patient's latest response completed before it was booked.
+Relevance is graded by how it went:
+
+- booked (pending through completed): 1.0
+- rated in AppointmentFeedback: 1.0 + (rating - 1) / 4, up to 2.0
+- no-show: 0.5
+
+Every case is re-matched by TherapistMatcher (loop and vectorized) and
+MatchingEngine as they would score today, inside a rolled-back
+transaction, and the top K is compared with what was booked (NDCG@K,
+recall@K, hit rate) next to the latency, query and encoder-call
+percentiles of matching.instrumentation. Cases can be spread over a
+process pool; queries per request are exact either way, latencies are
+only comparable between runs with the same worker count.
+
+The bookings being predicted are also training data for the learned
+collaborative model and the similar-patient index. Replayed patients are
+therefore scored as new patients: the model gives them the cold-start
+prediction from their survey embedding (or the mean patient) instead of
+their learned factors, and the index never returns the patient
+themselves. The therapist factors and the cold-start regression still
+saw their appointments, so absolute scores remain slightly optimistic;
+compare runs against each other.
+"""
+
+import math
+import multiprocessing
+import platform
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+
+from ..instrumentation import MatchingInstrumentation, summarize, summarize_samples
+
+REPORT_VERSION = 1
+
+BOOKED_RELEVANCE = 1.0
+NO_SHOW_RELEVANCE = 0.5
+
+MATCHERS = ('loop', 'vectorized', 'engine')
+
+# Matching settings recorded with every report
+REPORTED_SETTINGS = (
+    'MATCHING_ANN_CANDIDATES',
+    'MATCHING_CAPACITY_MODE',
+    'MATCHING_SIMILAR_PATIENTS_K',
+    'MATCHING_LATENCY_BUDGET_MS',
+)
+
+
+class ReplayCase(NamedTuple):
+    """A historical survey response and the graded relevance of the therapists booked after it"""
+    survey_response_id: int
+    relevance: Dict[int, float]
+
+
+def appointment_relevance(status: str, rating: Optional[int]) -> float:
+    """Graded relevance of one booking"""
+    if status == 'no_show':
+        return NO_SHOW_RELEVANCE
+    if rating is not None:
+        return BOOKED_RELEVANCE + (min(5, max(1, rating)) - 1) / 4
+    return BOOKED_RELEVANCE
+
+
+def collect_replay_cases(limit: Optional[int] = None) -> List[ReplayCase]:
+    """Most recent submitted responses followed by a booking, in two queries"""
+    from booking.models import Appointment
+    from surveys.models import SurveyResponse
+
+    # Submission time, not creation: a draft may be started long before it is sent
+    responses = defaultdict(list)
+    for response_id, patient_id, completed_at in SurveyResponse.objects.filter(
+        status__in=['submitted', 'reviewed'], completed_at__isnull=False
+    ).order_by('completed_at').values_list('id', 'patient_id', 'completed_at'):
+        responses[patient_id].append((completed_at, response_id))
+
+    relevance = defaultdict(dict)
+    for patient_id, therapist_id, response_id, created_at, status, rating in Appointment.objects.filter(
+        patient_id__in=list(responses)
+    ).exclude(status='cancelled').values_list(
+        'patient_id', 'therapist_id', 'survey_response_id', 'created_at', 'status', 'feedback__rating'
+    ):
+        if response_id is None:
+            earlier = [candidate for submitted, candidate in responses[patient_id] if submitted <= created_at]
+            if not earlier:
+                continue
+            response_id = earlier[-1]
+        gain = appointment_relevance(status, rating)
+        relevance[response_id][therapist_id] = max(gain, relevance[response_id].get(therapist_id, 0.0))
+
+    cases = [ReplayCase(response_id, gains) for response_id, gains in sorted(relevance.items(), reverse=True)]
+    return cases[:limit] if limit else cases
+
+
+def ndcg_at_k(ranked: Sequence[int], relevance: Dict[int, float], k: int) -> float:
+    """Normalised discounted cumulative gain of the top ``k``"""
+    dcg = sum(relevance.get(therapist_id, 0.0) / math.log2(position + 2) for position, therapist_id in enumerate(ranked[:k]))
+    ideal = sorted(relevance.values(), reverse=True)[:k]
+    idcg = sum(gain / math.log2(position + 2) for position, gain in enumerate(ideal))
+    return dcg / idcg if idcg else 0.0
+
+
+def recall_at_k(ranked: Sequence[int], relevance: Dict[int, float], k: int) -> float:
+    """Share of the booked therapists found in the top ``k``"""
+    if not relevance:
+        return 0.0
+    return len(set(ranked[:k]) & set(relevance)) / len(relevance)
+
+
+@contextmanager
+def matcher_weights(weights: Optional[Dict[str, float]]) -> Iterator[None]:
+    """Temporarily override TherapistMatcher.WEIGHTS (composite base weights included)"""
+    from ..algorithm import TherapistMatcher
+
+    if not weights:
+        yield
+        return
+    original = TherapistMatcher.WEIGHTS
+    TherapistMatcher.WEIGHTS = {**original, **weights}
+    try:
+        yield
+    finally:
+        TherapistMatcher.WEIGHTS = original
+
+
+def _rank(matcher: str, response, k: int, instrumentation: MatchingInstrumentation) -> List[int]:
+    """Therapist ids the matcher ranks first for a response"""
+    if matcher == 'engine':
+        from ..services.matching_engine import MatchingEngine
+
+        matches = MatchingEngine().generate_matches(response.patient, top_n=k, instrumentation=instrumentation)
+        return [getattr(match, 'therapist_id', None) for match in matches]
+
+    from ..algorithm import TherapistMatcher
+
+    with instrumentation.activate():
+        # Scored as a new patient, so the label bookings cannot leak in through Layer 3
+        therapist_matcher = TherapistMatcher(response, instrumentation=instrumentation, cold_start=True)
+        matches = therapist_matcher.find_best_matches(top_n=k, vectorized=matcher == 'vectorized')
+        for therapist, _, breakdown in matches:
+            therapist_matcher.generate_match_reasons(therapist, breakdown)
+    return [therapist.id for therapist, _, _ in matches]
+
+
+def replay_chunk(
+    matcher: str,
+    response_ids: Sequence[int],
+    k: int,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Dict]:
+    """
+    Re-match a chunk of responses; one {response, ranked, sample | error} per id
+
+    Everything runs in a rolled-back transaction, so matchers that save
+    their results (MatchingEngine) leave the database untouched.
+    """
+    from surveys.models import SurveyResponse
+
+    responses = SurveyResponse.objects.select_related('patient').in_bulk(list(response_ids))
+    results = []
+    with matcher_weights(weights):
+        for response_id in response_ids:
+            response = responses.get(response_id)
+            if response is None:
+                results.append({'response': response_id, 'error': 'missing'})
+                continue
+
+            instrumentation = MatchingInstrumentation()
+            try:
+                with transaction.atomic():
+                    ranked = _rank(matcher, response, k, instrumentation)
+                    transaction.set_rollback(True)
+            except Exception as e:
+                results.append({'response': response_id, 'error': f'{type(e).__name__}: {e}'})
+                continue
+            results.append({'response': response_id, 'ranked': ranked, 'sample': instrumentation.as_dict()})
+    return results
+
+
+def _chunks(items: Sequence, size: int) -> List[Sequence]:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def summarize_run(matcher: str, cases: List[ReplayCase], results: List[Dict], k: int) -> Dict:
+    """Quality and cost summary of one matcher over all cases"""
+    relevance = {case.survey_response_id: case.relevance for case in cases}
+    scored = [result for result in results if 'ranked' in result]
+    errors = [result for result in results if 'error' in result]
+    run = {'matcher': matcher, 'cases': len(scored), 'errors': len(errors)}
+
+    if not scored:
+        run['skipped'] = errors[0]['error'] if errors else 'no cases'
+        return run
+
+    ndcg = [ndcg_at_k(result['ranked'], relevance[result['response']], k) for result in scored]
+    recall = [recall_at_k(result['ranked'], relevance[result['response']], k) for result in scored]
+    run.update({
+        'ndcg': round(sum(ndcg) / len(ndcg), 4),
+        'recall': round(sum(recall) / len(recall), 4),
+        'hit_rate': round(sum(1 for value in recall if value > 0) / len(recall), 4),
+        'ndcg_distribution': summarize(ndcg),
+        **summarize_samples([result['sample'] for result in scored]),
+    })
+    return run
+
+
+def run_replay(
+    cases: List[ReplayCase],
+    matchers: Sequence[str] = MATCHERS,
+    k: int = 3,
+    workers: int = 1,
+    chunk_size: int = 25,
+    weights: Optional[Dict[str, float]] = None,
+    label: str = '',
+    log: Callable[[str], None] = lambda message: None,
+) -> Dict:
+    """
+    Replay every case through every matcher
+
+    With ``workers`` > 1 chunks of cases run in a pool of spawned
+    processes; each sets Django up and opens its own database connection,
+    so no connection, model or thread state is inherited.
+
+    Returns:
+        JSON-serialisable report (see compare_replays)
+    """
+    from ..algorithm import EMBEDDINGS_AVAILABLE
+
+    report = {
+        'version': REPORT_VERSION,
+        'label': label,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'embeddings_available': EMBEDDINGS_AVAILABLE,
+        'settings': {name: getattr(settings, name, None) for name in REPORTED_SETTINGS},
+        'parameters': {'k': k, 'cases': len(cases), 'workers': workers, 'weights': weights or {}},
+        'runs': [],
+    }
+    response_ids = [case.survey_response_id for case in cases]
+
+    executor = None
+    if workers > 1 and len(response_ids) > chunk_size:
+        connections.close_all()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    try:
+        for matcher in matchers:
+            log(f'  {matcher}: {len(response_ids)} cases...')
+            start = time.perf_counter()
+            if executor is not None:
+                futures = [
+                    executor.submit(replay_chunk, matcher, chunk, k, weights)
+                    for chunk in _chunks(response_ids, chunk_size)
+                ]
+                results = [result for future in futures for result in future.result()]
+            else:
+                results = replay_chunk(matcher, response_ids, k, weights)
+            run = summarize_run(matcher, cases, results, k)
+            run['wall_s'] = round(time.perf_counter() - start, 2)
+            report['runs'].append(run)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return report
+
+
+def compare_replays(
+    baseline: Dict,
+    current: Dict,
+    threshold: float = 1.25,
+    max_drop: float = 0.02,
+) -> List[str]:
+    """
+    Regressions of ``current`` against ``baseline``
+
+    A matcher regresses when NDCG or recall drop by more than ``max_drop``,
+    its p95 latency grows by more than ``threshold`` times, or it issues
+    more queries or encoder calls per request.
+    """
+    baseline_runs = {run['matcher']: run for run in baseline.get('runs', []) if 'skipped' not in run}
+    regressions = []
+
+    for run in current.get('runs', []):
+        old = baseline_runs.get(run['matcher'])
+        if old is None or 'skipped' in run:
+            continue
+
+        name = run['matcher']
+        for metric in ('ndcg', 'recall'):
+            if run[metric] < old[metric] - max_drop:
+                regressions.append(f'{name}: {metric}@K {old[metric]:.4f} -> {run[metric]:.4f}')
+
+        old_p95, new_p95 = old['latency_ms']['p95'], run['latency_ms']['p95']
+        if old_p95 and new_p95 > old_p95 * threshold:
+            regressions.append(f'{name}: p95 latency {old_p95:.1f} ms -> {new_p95:.1f} ms')
+
+        for metric in ('queries', 'encoder_calls'):
+            old_value, new_value = old[metric]['max'], run[metric]['max']
+            if new_value > old_value:
+                regressions.append(f'{name}: {metric} per request {old_value:g} -> {new_value:g}')
+
+    return regressions
@@ -0,0 +1,222 @@
+"""
+Matching Benchmark Runner
+Latency, query count, encoder and memory percentiles per matcher and stage
+
+Benchmarks run against a throwaway test database (as Django's test
+runner creates it) with a private cache and temporary embedding / ANN
+directories, so they never touch real data or warm production caches.
+"""
+
+import platform
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import override_settings
+
+from ..instrumentation import MatchingInstrumentation, summarize_samples
+from .synthetic import SyntheticPool, generate_pool
+
+REPORT_VERSION = 1
+
+# Matching settings recorded with every report
+REPORTED_SETTINGS = (
+    'MATCHING_MATERIALIZED_MATCH_STATS',
+    'MATCHING_ANN_CANDIDATES',
+    'MATCHING_ANN_NPROBE',
+)
+
+
+def measure(func: Callable[[MatchingInstrumentation], object], trace_memory: bool = False) -> Dict:
+    """Run ``func`` under a fresh instrumentation and return its counters"""
+    instrumentation = MatchingInstrumentation(trace_memory=trace_memory)
+    with instrumentation.activate():
+        func(instrumentation)
+    return instrumentation.as_dict()
+
+
+def benchmark_therapist_matcher(
+    pool: SyntheticPool,
+    top_n: int = 3,
+    vectorized: bool = False,
+    candidate_k: Optional[int] = 0,
+) -> Dict:
+    """find_best_matches plus reason generation for every request in the pool"""
+    from ..algorithm import TherapistMatcher
+
+    def request(response):
+        def run(instrumentation):
+            matcher = TherapistMatcher(response, instrumentation=instrumentation)
+            matches = matcher.find_best_matches(top_n=top_n, vectorized=vectorized, candidate_k=candidate_k)
+            for therapist, _, breakdown in matches:
+                matcher.generate_match_reasons(therapist, breakdown)
+        return run
+
+    responses = pool.request_responses
+    # Warm-up: model load, lru caches, cached quality scores
+    measure(request(responses[0]))
+
+    samples = [measure(request(response)) for response in responses]
+    memory_sample = measure(request(responses[0]), trace_memory=True)
+    return summarize_samples(samples, memory_sample)
+
+
+def benchmark_matching_engine(pool: SyntheticPool, top_n: int = 3) -> Dict:
+    """MatchingEngine.generate_matches for every request (skipped if unusable)"""
+    try:
+        from ..services.matching_engine import MatchingEngine
+    except Exception as e:
+        return {'skipped': f'{type(e).__name__}: {e}'}
+
+    engine = MatchingEngine()
+
+    def request(response):
+        def run(instrumentation):
+            engine.generate_matches(response.patient, top_n=top_n, instrumentation=instrumentation)
+        return run
+
+    try:
+        responses = pool.request_responses
+        measure(request(responses[0]))
+        samples = [measure(request(response)) for response in responses]
+        memory_sample = measure(request(responses[0]), trace_memory=True)
+    except Exception as e:
+        return {'skipped': f'{type(e).__name__}: {e}'}
+    return summarize_samples(samples, memory_sample)
+
+
+@contextmanager
+def benchmark_database(verbosity: int = 0) -> Iterator[None]:
+    """Create a throwaway test database for the duration of the block"""
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+@contextmanager
+def isolated_matching_state() -> Iterator[None]:
+    """
+    Empty database tables, private cache and every matching data directory
+    
+    Signals fired by the synthetic pool write to the stores, models and
+    indexes under MATCHING_*_DIR, and trained models change the scores
+    being measured, so all of them point into a temporary directory.
+    Encoding stays in-process: the shared embedding service writes to the
+    real embedding cache.
+    """
+    call_command('flush', interactive=False, verbosity=0)
+    directory = tempfile.mkdtemp(prefix='matching-benchmark-')
+    try:
+        with override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': directory,
+            }},
+            MATCHING_EMBEDDING_STORE_DIR=f'{directory}/embeddings',
+            MATCHING_ANN_INDEX_DIR=f'{directory}/ann',
+            MATCHING_TFIDF_MODEL_DIR=f'{directory}/tfidf',
+            MATCHING_EMBEDDING_CACHE_DIR=f'{directory}/embedding_cache',
+            MATCHING_CF_MODEL_DIR=f'{directory}/collaborative',
+            MATCHING_PATIENT_INDEX_DIR=f'{directory}/patients',
+            MATCHING_EMBEDDING_SOCKET=None,
+        ):
+            cache.clear()
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_benchmark(
+    sizes: Iterable[int],
+    requests: int = 20,
+    seed: int = 0,
+    top_n: int = 3,
+    candidate_k: int = 0,
+    include_engine: bool = True,
+    label: str = '',
+    log: Callable[[str], None] = lambda message: None,
+) -> Dict:
+    """
+    Generate a pool per size and benchmark every matcher on it
+
+    Must run inside benchmark_database().
+
+    Returns:
+        JSON-serialisable report (see compare_reports)
+    """
+    from ..algorithm import EMBEDDINGS_AVAILABLE
+
+    report = {
+        'version': REPORT_VERSION,
+        'label': label,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'embeddings_available': EMBEDDINGS_AVAILABLE,
+        'settings': {name: getattr(settings, name, None) for name in REPORTED_SETTINGS},
+        'parameters': {'requests': requests, 'seed': seed, 'top_n': top_n, 'candidate_k': candidate_k},
+        'runs': [],
+    }
+
+    for size in sizes:
+        with isolated_matching_state():
+            log(f'Generating {size} therapists...')
+            start = time.perf_counter()
+            pool = generate_pool(size, requests=requests, seed=seed, candidate_k=candidate_k)
+            log(
+                f'  {pool.blog_posts} blog posts, {pool.history_matches} past matches '
+                f'in {time.perf_counter() - start:.1f}s'
+            )
+
+            matchers = [
+                ('TherapistMatcher', 'loop', lambda: benchmark_therapist_matcher(pool, top_n, False, candidate_k)),
+                ('TherapistMatcher', 'vectorized', lambda: benchmark_therapist_matcher(pool, top_n, True, candidate_k)),
+            ]
+            if include_engine:
+                matchers.append(('MatchingEngine', 'tfidf', lambda: benchmark_matching_engine(pool, top_n)))
+
+            for matcher, mode, benchmark in matchers:
+                log(f'  {matcher} ({mode})...')
+                result = benchmark()
+                report['runs'].append({'pool_size': size, 'matcher': matcher, 'mode': mode, **result})
+
+    return report
+
+
+def _run_key(run: Dict):
+    return run['pool_size'], run['matcher'], run['mode']
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float = 1.25) -> List[str]:
+    """
+    Regressions of ``current`` against ``baseline``
+
+    A run regresses when its p95 latency grows by more than ``threshold``
+    times, or when it issues more queries or encoder calls per request.
+    """
+    baseline_runs = {_run_key(run): run for run in baseline.get('runs', []) if 'skipped' not in run}
+    regressions = []
+
+    for run in current.get('runs', []):
+        old = baseline_runs.get(_run_key(run))
+        if old is None or 'skipped' in run:
+            continue
+
+        name = '{1} ({2}) @ {0}'.format(*_run_key(run))
+        old_p95, new_p95 = old['latency_ms']['p95'], run['latency_ms']['p95']
+        if old_p95 and new_p95 > old_p95 * threshold:
+            regressions.append(f'{name}: p95 latency {old_p95:.1f} ms -> {new_p95:.1f} ms')
+
+        for metric in ('queries', 'encoder_calls'):
+            old_value, new_value = old[metric]['max'], run[metric]['max']
+            if new_value > old_value:
+                regressions.append(f'{name}: {metric} per request {old_value:g} -> {new_value:g}')
+
+    return regressions
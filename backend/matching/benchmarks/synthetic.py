@@ -0,0 +1,285 @@
+"""
+Synthetic Matching Data
+Therapists, bios, blog posts, match history and surveys at a given scale
+
+Everything is created with bulk_create, so model signals do not fire;
+the derived matching data they would maintain (blog sections, bio
+embeddings, match statistics, ANN index) is built explicitly afterwards,
+the same way the management commands build it for an existing database.
+"""
+
+import random
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from accounts.models import TherapistProfile
+from blogs.models import BlogPost
+from surveys.models import Survey, SurveyQuestion, SurveyQuestionOption, SurveyResponse, SurveyAnswer
+from ..models import TherapistMatch
+
+User = get_user_model()
+
+SPECIALIZATIONS = [
+    'Anxiety', 'Depression', 'Trauma', 'PTSD', 'Couples Therapy', 'Family Therapy', 'Grief Counseling',
+    'Addiction', 'Substance Abuse', 'OCD', 'Eating Disorders', 'Stress Management', 'CBT', 'DBT',
+    'Mindfulness', 'Child Therapy', 'Adolescent Therapy', 'Bipolar Disorder', 'Self-Esteem', 'Insomnia',
+]
+
+BIO_PHRASES = [
+    'I help clients manage anxiety and panic through evidence-based CBT',
+    'my approach combines mindfulness and acceptance with practical coping skills',
+    'I specialise in trauma recovery and work gently at the client\'s pace',
+    'couples learn to communicate and rebuild trust in our sessions',
+    'I support people through grief, loss and major life transitions',
+    'together we explore patterns of depression and low motivation',
+    'I work with teenagers and families facing school and social stress',
+    'recovery from addiction is possible with consistent support',
+    'sessions focus on sleep, burnout and stress at work',
+    'I use DBT skills for emotion regulation and self-harm',
+]
+
+BLOG_PARAGRAPHS = [
+    'Anxiety often shows up as racing thoughts and a tight chest. Grounding techniques and slow breathing help '
+    'calm the nervous system, and CBT teaches you to challenge catastrophic predictions.',
+    'Depression can make everyday tasks feel impossible. Behavioural activation starts small: one walk, one '
+    'message to a friend, one meal. Therapy helps you notice the progress.',
+    'After trauma the body stays on alert. Trauma-focused therapy and EMDR help process memories so that '
+    'flashbacks and nightmares lose their intensity.',
+    'Healthy relationships depend on listening. Couples therapy gives partners a safe space to express needs '
+    'without blame and to repair after conflict.',
+    'Grief has no timetable. Counseling offers room to remember, to feel the loss and to slowly find meaning again.',
+    'Our clinic is open on weekdays and the waiting room has fresh coffee. Parking is available behind the building.',
+    'Sleep hygiene matters: a regular bedtime, a dark room and no screens an hour before sleep improve insomnia.',
+]
+
+PATIENT_STORIES = [
+    'I feel anxious and worried all the time, I have panic attacks before work and cannot relax',
+    'I have been sad and hopeless for months, tired, no motivation, sometimes I feel empty',
+    'I keep having flashbacks and nightmares since the accident, I was abused as a child',
+    'My partner and I argue constantly, our relationship and marriage is falling apart',
+    'My mother died last year and I am still grieving, the loss feels overwhelming',
+    'I drink too much alcohol and want to stop, my addiction is affecting my family',
+    'Stress and burnout at work, I cannot sleep, insomnia every night',
+]
+
+GENDERS = ['male', 'female', 'other', 'prefer_not_to_say']
+LANGUAGES = ['English', 'Nepali', 'Hindi', 'Newari', 'Maithili']
+PROFESSIONS = ['psychologist', 'psychiatrist', 'counselor', 'social_worker', 'therapist', 'other']
+
+
+@dataclass
+class SyntheticPool:
+    """Ids of a generated therapist pool and the survey responses to match"""
+    size: int
+    therapist_ids: List[int] = field(default_factory=list)
+    request_responses: List[SurveyResponse] = field(default_factory=list)
+    blog_posts: int = 0
+    history_matches: int = 0
+
+
+def _bio(rng: random.Random) -> str:
+    return '. '.join(rng.sample(BIO_PHRASES, rng.randint(2, 4))) + '.'
+
+
+def _blog_content(rng: random.Random) -> str:
+    return '\n\n'.join(rng.choice(BLOG_PARAGRAPHS) for _ in range(rng.randint(2, 6)))
+
+
+def _create_survey():
+    """Matching survey with the question shapes the matcher looks for"""
+    survey = Survey.objects.create(
+        title='Benchmark Matching Survey',
+        description='Synthetic survey for matching benchmarks',
+        assessment_type='custom',
+    )
+    questions = {
+        'story': SurveyQuestion.objects.create(
+            survey=survey, order=1, question_type='text',
+            question_text='What brings you to therapy? Describe how you have been feeling.',
+        ),
+        'gender': SurveyQuestion.objects.create(
+            survey=survey, order=2, question_type='multiple_choice',
+            question_text='Do you prefer a therapist of a particular gender?',
+        ),
+        'format': SurveyQuestion.objects.create(
+            survey=survey, order=3, question_type='multiple_choice',
+            question_text='Which session format do you prefer: online or in-person?',
+        ),
+        'language': SurveyQuestion.objects.create(
+            survey=survey, order=4, question_type='text',
+            question_text='Preferred language for sessions',
+        ),
+        'severity': SurveyQuestion.objects.create(
+            survey=survey, order=5, question_type='rating', rating_min=1, rating_max=10,
+            question_text='How much are these problems affecting your daily life?',
+        ),
+    }
+    options = {
+        'gender': [
+            SurveyQuestionOption.objects.create(question=questions['gender'], option_text=text, option_value=text, order=i)
+            for i, text in enumerate(['Female therapist', 'Male therapist', 'No preference'])
+        ],
+        'format': [
+            SurveyQuestionOption.objects.create(question=questions['format'], option_text=text, option_value=text, order=i)
+            for i, text in enumerate(['Online video sessions', 'In-person office visits', 'Either'])
+        ],
+    }
+    return survey, questions, options
+
+
+def _create_patients(prefix: str, count: int, survey, password: str) -> List[SurveyResponse]:
+    User.objects.bulk_create([
+        User(
+            email=f'{prefix}{i}@benchmark.example.com',
+            full_name=f'Benchmark Patient {prefix}{i}',
+            role='patient',
+            gender=GENDERS[i % 2],
+            password=password,
+        )
+        for i in range(count)
+    ], batch_size=1000)
+    patients = User.objects.filter(email__startswith=prefix, email__endswith='@benchmark.example.com')
+    SurveyResponse.objects.bulk_create([
+        SurveyResponse(patient=patient, survey=survey, status='submitted', completed_at=timezone.now())
+        for patient in patients.order_by('id')
+    ], batch_size=1000)
+    return list(SurveyResponse.objects.filter(patient__in=patients).select_related('patient').order_by('id'))
+
+
+def generate_pool(
+    size: int,
+    requests: int = 20,
+    seed: int = 0,
+    posts_per_therapist: int = 2,
+    history_ratio: float = 0.5,
+    candidate_k: Optional[int] = None,
+) -> SyntheticPool:
+    """
+    Create ``size`` therapists and ``requests`` patients to match
+
+    Args:
+        size: Number of active therapists
+        requests: Number of patients with a submitted matching survey
+        seed: Random seed (the same seed produces the same pool)
+        posts_per_therapist: Average published blog posts per therapist
+        history_ratio: Past TherapistMatch records per therapist (Layer 3)
+        candidate_k: Also build the ANN index when retrieval will be used
+    """
+    from ..algorithm import EMBEDDINGS_AVAILABLE, encode_texts
+    from ..blog_sections import refresh_post_sections
+    from ..embedding_store import get_embedding_store, bio_key
+    from ..match_stats import rebuild_match_stats
+
+    rng = random.Random(seed)
+    password = make_password(None)
+    now = timezone.now()
+    pool = SyntheticPool(size=size)
+
+    # Therapists and profiles
+    User.objects.bulk_create([
+        User(
+            email=f'therapist{i}@benchmark.example.com',
+            full_name=f'Benchmark Therapist {i}',
+            role='therapist',
+            gender=rng.choice(GENDERS[:3]),
+            password=password,
+        )
+        for i in range(size)
+    ], batch_size=1000)
+    therapists = list(User.objects.filter(role='therapist', email__endswith='@benchmark.example.com').order_by('id'))
+    pool.therapist_ids = [therapist.id for therapist in therapists]
+
+    profiles = []
+    for therapist in therapists:
+        verified = rng.random() < 0.6
+        profiles.append(TherapistProfile(
+            user=therapist,
+            profession_type=rng.choice(PROFESSIONS),
+            license_id=f'LIC-{therapist.id}' if rng.random() < 0.7 else None,
+            years_of_experience=rng.randint(0, 25),
+            specialization_tags=rng.sample(SPECIALIZATIONS, rng.randint(1, 5)),
+            languages_spoken=rng.sample(LANGUAGES, rng.randint(1, 3)),
+            consultation_mode=rng.choice(['online', 'offline', 'both']),
+            bio=_bio(rng) if rng.random() < 0.9 else '',
+            profile_completed=True,
+            is_verified=verified,
+            verified_at=now - timedelta(days=rng.randint(0, 1000)) if verified else None,
+        ))
+    TherapistProfile.objects.bulk_create(profiles, batch_size=1000)
+
+    # Blog posts
+    posts = []
+    for therapist in therapists:
+        for j in range(rng.randint(0, 2 * posts_per_therapist)):
+            published = rng.random() < 0.8
+            posts.append(BlogPost(
+                author=therapist,
+                title=f'Notes on {rng.choice(SPECIALIZATIONS).lower()} #{therapist.id}-{j}',
+                slug=f'benchmark-{therapist.id}-{j}',
+                excerpt=rng.choice(BIO_PHRASES),
+                content=_blog_content(rng),
+                status='published' if published else 'draft',
+                published_at=now - timedelta(days=rng.randint(0, 400)) if published else None,
+            ))
+    BlogPost.objects.bulk_create(posts, batch_size=1000)
+    pool.blog_posts = len(posts)
+
+    survey, questions, options = _create_survey()
+
+    # Match history for Layer 3
+    history = _create_patients('history', int(size * history_ratio), survey, password)
+    TherapistMatch.objects.bulk_create([
+        TherapistMatch(
+            patient=response.patient,
+            survey_response=response,
+            **{
+                field_name: value
+                for rank, therapist_id in enumerate(rng.sample(pool.therapist_ids, min(3, size)), 1)
+                for field_name, value in ((f'top_match_{rank}_id', therapist_id), (f'top_match_{rank}_score', rng.random()))
+            }
+        )
+        for response in history
+    ], batch_size=1000)
+    pool.history_matches = len(history)
+
+    # Patients to match
+    pool.request_responses = _create_patients('request', requests, survey, password)
+    answers = []
+    for i, response in enumerate(pool.request_responses):
+        answers.extend([
+            SurveyAnswer(response=response, question=questions['story'], answer_text=rng.choice(PATIENT_STORIES)),
+            SurveyAnswer(response=response, question=questions['gender'], answer_option=options['gender'][i % 3]),
+            SurveyAnswer(response=response, question=questions['format'], answer_option=options['format'][i % 3]),
+            SurveyAnswer(response=response, question=questions['language'], answer_text=rng.choice(LANGUAGES)),
+            SurveyAnswer(response=response, question=questions['severity'], answer_rating=rng.randint(1, 10)),
+        ])
+    SurveyAnswer.objects.bulk_create(answers, batch_size=1000)
+
+    # Derived matching data the signals would normally maintain
+    encoder = encode_texts if EMBEDDINGS_AVAILABLE else None
+    published = list(BlogPost.objects.filter(status='published', author_id__in=pool.therapist_ids).order_by('id'))
+    for start in range(0, len(published), 500):
+        refresh_post_sections(published[start:start + 500], encoder)
+
+    if EMBEDDINGS_AVAILABLE:
+        store = get_embedding_store()
+        items = [(bio_key(profile.user_id), profile.bio) for profile in profiles if profile.bio]
+        for start in range(0, len(items), 256):
+            store.ensure(items[start:start + 256], encode_texts)
+
+    if getattr(settings, 'MATCHING_MATERIALIZED_MATCH_STATS', False):
+        rebuild_match_stats()
+
+    if candidate_k and EMBEDDINGS_AVAILABLE:
+        from ..ann_index import get_ann_index, therapist_vectors
+
+        keys, owners, kinds, vectors = therapist_vectors(pool.therapist_ids)
+        get_ann_index().build(keys, owners, kinds, vectors)
+
+    return pool
@@ -0,0 +1,106 @@
+"""
+Pre-computed Blog Sections
+Therapeutic sections, relevance scores and embeddings per published post
+
+Sections are extracted and embedded once, when a post is published or
+edited, and stored in the BlogSection table. Layer 2 reads them through
+the ``matching_sections`` relation instead of re-splitting post content
+on every match request.
+"""
+
+import hashlib
+import logging
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+from django.db import transaction
+
+from .embedding_store import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+def blog_post_text(post) -> str:
+    """Full text sections are extracted from"""
+    return f"{post.title}. {post.excerpt}. {post.content}"
+
+
+def post_source_hash(post) -> str:
+    """Hash identifying the post text a set of sections was built from"""
+    return hashlib.sha1(blog_post_text(post).encode('utf-8')).hexdigest()
+
+
+def encode_embedding(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_embedding(data) -> np.ndarray:
+    return np.frombuffer(bytes(data), dtype=np.float32)
+
+
+def sections_are_current(post, sections: List, require_embeddings: bool = True) -> bool:
+    """True when stored sections match the post text (and have embeddings)"""
+    if not sections:
+        return False
+    digest = post_source_hash(post)
+    return all(
+        section.source_hash == digest and (section.embedding is not None or not require_embeddings)
+        for section in sections
+    )
+
+
+def refresh_post_sections(posts: Iterable, encoder: Optional[Callable] = None) -> int:
+    """
+    Rebuild the stored sections of several posts
+
+    Unpublished posts lose their sections. Posts whose stored sections
+    are already current are skipped. All new section texts are encoded
+    in one ``encoder`` call; without an encoder (no embedding model)
+    sections are stored without embeddings.
+
+    Returns:
+        Number of posts whose sections were rewritten
+    """
+    from .algorithm import scored_blog_post_sections
+    from .models import BlogSection
+
+    posts = list(posts)
+    stored = {}
+    for section in BlogSection.objects.filter(post__in=posts).order_by('post_id', 'position'):
+        stored.setdefault(section.post_id, []).append(section)
+
+    stale_posts = []
+    new_sections = []
+    for post in posts:
+        if post.status != 'published':
+            if post.id in stored:
+                stale_posts.append(post)
+            continue
+
+        if sections_are_current(post, stored.get(post.id, []), require_embeddings=encoder is not None):
+            continue
+
+        digest = post_source_hash(post)
+        stale_posts.append(post)
+        for position, (text, relevance) in enumerate(scored_blog_post_sections(post)):
+            new_sections.append(BlogSection(
+                post=post,
+                position=position,
+                text=text,
+                relevance=relevance,
+                source_hash=digest,
+            ))
+
+    if not stale_posts:
+        return 0
+
+    if encoder is not None and new_sections:
+        vectors = normalize_rows(encoder([section.text for section in new_sections]))
+        for section, vector in zip(new_sections, vectors):
+            section.embedding = encode_embedding(vector)
+
+    with transaction.atomic():
+        BlogSection.objects.filter(post__in=stale_posts).delete()
+        BlogSection.objects.bulk_create(new_sections)
+
+    return len(stale_posts)
@@ -0,0 +1,235 @@
+"""
+Bulk Rematch
+Recompute the matches of every patient with a submitted latest survey
+
+Responses are split into shards of ids and matched by worker processes
+(rematch_shard). Each worker loads the embedding model, the embedding
+store matrix and the whole therapist pool on its first shard and reuses
+them for every later one; workers only read. The parent process
+writes each shard's rankings with bulk_update / bulk_create
+(apply_results), so model signals do not fire: callers rebuild the
+materialized match statistics once at the end (rebuild_match_stats).
+"""
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from surveys.models import SurveyResponse
+from .match_stats import MATCH_SLOTS
+from .models import TherapistMatch
+from .result_cache import (
+    MatchInputs,
+    get_cached_matches,
+    get_pool_version,
+    match_is_current,
+    personalization,
+    survey_fingerprint,
+)
+
+# Fields rewritten on existing matches
+UPDATE_FIELDS = [
+    *MATCH_SLOTS,
+    *(f'{slot}_score' for slot in MATCH_SLOTS),
+    'survey_fingerprint',
+    'pool_version',
+    'degraded',
+    'updated_at',
+]
+
+# Per-process pool and model state, loaded by the first shard (_worker_state)
+_WORKER: Dict = {}
+
+
+class RematchResult(NamedTuple):
+    """Outcome of one survey response (picklable, returned by workers)"""
+    response_id: int
+    patient_id: int
+    current: bool
+    ranked: List[Tuple[int, float]]
+    fingerprint: str
+    pool_version: int
+
+
+class RankChange(NamedTuple):
+    """Old and new therapist ids of a match, in rank order"""
+    response_id: int
+    patient_id: int
+    old: List[int]
+    new: List[int]
+
+
+def rematch_queryset():
+    """Latest submitted survey responses, in id order (the checkpoint order)"""
+    return SurveyResponse.objects.filter(is_latest=True, status='submitted').order_by('id')
+
+
+def _load_worker_state(vectorized: bool) -> Dict:
+    from .algorithm import EMBEDDINGS_AVAILABLE, get_embedding_model, load_therapist_pool
+    from .embedding_service import service_socket_path
+    from .embedding_store import get_embedding_store
+
+    if EMBEDDINGS_AVAILABLE:
+        if not service_socket_path():
+            get_embedding_model()
+        get_embedding_store()
+
+    # The version is read with the pool so results are tagged with the
+    # version of the data they were computed from
+    _WORKER.update(
+        pool_version=get_pool_version(),
+        pool=load_therapist_pool(),
+        vectorized=vectorized,
+    )
+    return _WORKER
+
+
+def _worker_state(vectorized: bool) -> Dict:
+    if not _WORKER or _WORKER['vectorized'] != vectorized:
+        return _load_worker_state(vectorized)
+    return _WORKER
+
+
+def reset_worker_state() -> None:
+    """Drop the in-process pool (after an in-process run, or in tests)"""
+    _WORKER.clear()
+
+
+def rematch_shard(
+    response_ids: Sequence[int],
+    top_n: int = 3,
+    force: bool = False,
+    vectorized: bool = False,
+) -> List[RematchResult]:
+    """
+    Rank therapists for a shard of survey responses
+
+    Matches already computed from the same answers and pool version are
+    reported as current and not recomputed unless ``force``.
+    """
+    from .algorithm import TherapistMatcher, parse_survey_answers
+
+    state = _worker_state(vectorized)
+    pool_version = state['pool_version']
+
+    responses = SurveyResponse.objects.filter(id__in=response_ids).select_related('patient').order_by('id')
+    matches = TherapistMatch.objects.in_bulk(list(response_ids), field_name='survey_response_id')
+
+    results = []
+    for response in responses:
+        answers = parse_survey_answers(response)
+        inputs = MatchInputs(
+            answers, survey_fingerprint(answers), pool_version, *personalization(response.patient_id)
+        )
+        match = matches.get(response.id)
+
+        if match is not None and not force and match_is_current(match, inputs):
+            results.append(RematchResult(
+                response.id, response.patient_id, True, _match_ranking(match), inputs.fingerprint, pool_version,
+            ))
+            continue
+
+        cached = None if force else get_cached_matches(inputs, top_n, exclude_id=response.patient_id)
+        if cached is not None:
+            ranked = [(therapist.id, score) for therapist, score in cached[0]]
+        else:
+            matcher = TherapistMatcher(response, answers=answers)
+            top_matches = matcher.find_best_matches(top_n=top_n, vectorized=vectorized, pool=state['pool'])
+            ranked = [(therapist.id, score) for therapist, score, _ in top_matches]
+
+        results.append(RematchResult(
+            response.id, response.patient_id, False, ranked, inputs.fingerprint, pool_version,
+        ))
+
+    return results
+
+
+def _match_ranking(match: TherapistMatch) -> List[Tuple[int, float]]:
+    return [
+        (getattr(match, f'{slot}_id'), getattr(match, f'{slot}_score'))
+        for slot in MATCH_SLOTS
+        if getattr(match, f'{slot}_id') is not None
+    ]
+
+
+def rank_changes(results: List[RematchResult]) -> List[RankChange]:
+    """Results whose therapist order differs from the saved match (dry runs)"""
+    matches = TherapistMatch.objects.in_bulk(
+        [result.response_id for result in results],
+        field_name='survey_response_id',
+    )
+
+    changes = []
+    for result in results:
+        if result.current or not result.ranked:
+            continue
+        match = matches.get(result.response_id)
+        old = [therapist_id for therapist_id, _ in _match_ranking(match)] if match else []
+        new = [therapist_id for therapist_id, _ in result.ranked]
+        if old != new:
+            changes.append(RankChange(result.response_id, result.patient_id, old, new))
+    return changes
+
+
+def apply_results(results: List[RematchResult]) -> Dict[str, int]:
+    """
+    Save a shard's rankings
+
+    Existing matches are rewritten with one bulk_update and new ones are
+    inserted with one bulk_create. Responses no therapist passed the hard
+    rules for keep their previous match, as with run_matching.
+
+    Returns:
+        Counts of updated, created, current and empty results
+    """
+    counts = {'updated': 0, 'created': 0, 'current': 0, 'empty': 0}
+    pending = []
+    for result in results:
+        if result.current:
+            counts['current'] += 1
+        elif not result.ranked:
+            counts['empty'] += 1
+        else:
+            pending.append(result)
+
+    matches = TherapistMatch.objects.in_bulk(
+        [result.response_id for result in pending],
+        field_name='survey_response_id',
+    )
+    now = timezone.now()
+    to_update, to_create = [], []
+
+    for result in pending:
+        match = matches.get(result.response_id)
+        if match is None:
+            match = TherapistMatch(patient_id=result.patient_id, survey_response_id=result.response_id)
+            to_create.append(match)
+        else:
+            to_update.append(match)
+
+        for rank, slot in enumerate(MATCH_SLOTS):
+            therapist_id, score = result.ranked[rank] if rank < len(result.ranked) else (None, 0.0)
+            setattr(match, f'{slot}_id', therapist_id)
+            setattr(match, f'{slot}_score', score)
+        match.survey_fingerprint = result.fingerprint
+        match.pool_version = result.pool_version
+        match.degraded = False
+        # auto_now is not applied by bulk_update
+        match.updated_at = now
+
+    with transaction.atomic():
+        if to_update:
+            TherapistMatch.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=500)
+        if to_create:
+            TherapistMatch.objects.bulk_create(to_create, batch_size=500)
+
+    counts['updated'] = len(to_update)
+    counts['created'] = len(to_create)
+    return counts
+
+
+def shard_ids(response_ids: List[int], shard_size: int) -> List[List[int]]:
+    """Consecutive id chunks of at most ``shard_size``"""
+    shard_size = max(1, shard_size)
+    return [response_ids[start:start + shard_size] for start in range(0, len(response_ids), shard_size)]
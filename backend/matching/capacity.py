@@ -0,0 +1,232 @@
+"""
+Therapist Capacity
+Free-slot counts for capacity-aware ranking
+
+A therapist with no free slot in the booking window is a dead end for a
+patient, however well they match. The free one-hour slots and the
+earliest one are counted per therapist with the rules of the
+available-slots endpoint (booking.views.get_available_slots):
+
+- the weekly schedule in TherapistProfile.availability_slots
+  ({'Monday': ['09:00 - 12:00', ...]}) split into one-hour slots
+- minus days covered by a TimeOffPeriod
+- minus slots overlapping confirmed / awaiting-payment appointments or
+  listed in TherapistProfile.booked_slots
+- minus slots already in the past
+
+and stored as TherapistCapacity rows. Signals recount one therapist when
+their schedule, time off or appointments change; `refresh_capacity`
+rolls the window forward for everyone (run it daily).
+
+The matcher reads the rows in one query. MATCHING_CAPACITY_MODE chooses
+what it does with them: None ignores them, 'penalty' scales the final
+score down for therapists with few free slots, 'filter' drops therapists
+without any. Therapists never counted are left alone.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TherapistCapacity
+from .result_cache import bump_pool_version
+
+logger = logging.getLogger(__name__)
+
+# Days ahead counted, as in the available-slots endpoint
+BOOKING_WINDOW_DAYS = 14
+
+# Appointments that take a slot
+BLOCKING_STATUSES = ('confirmed', 'awaiting_payment')
+
+CAPACITY_MODES = (None, 'penalty', 'filter')
+
+
+def _parse_range(time_range: str) -> Optional[Tuple[time, time]]:
+    """Start and end times of a 'HH:MM - HH:MM' range; None when malformed or reversed"""
+    try:
+        start_str, end_str = time_range.split(' - ')
+        start = datetime.strptime(start_str.strip(), '%H:%M').time()
+        end = datetime.strptime(end_str.strip(), '%H:%M').time()
+    except (ValueError, AttributeError):
+        return None
+    if end < start:
+        return None
+    return start, end
+
+
+def count_free_slots(
+    schedule: Optional[Dict],
+    time_off: Iterable[Tuple[date, date]],
+    appointments: Iterable[Tuple[date, time, time]],
+    booked_slots: Optional[List[Dict]],
+    now: Optional[datetime] = None,
+    days: int = BOOKING_WINDOW_DAYS,
+) -> Tuple[int, Optional[datetime]]:
+    """
+    (free slots, start of the earliest one) of one therapist
+
+    Args:
+        schedule: TherapistProfile.availability_slots
+        time_off: (start_date, end_date) of each time-off period
+        appointments: (date, start_time, end_time) of blocking appointments
+        booked_slots: TherapistProfile.booked_slots
+        now: Aware current time (default: timezone.now())
+        days: Days after today in the window
+    """
+    now = now or timezone.now()
+    if not schedule or not isinstance(schedule, dict):
+        return 0, None
+
+    time_off = list(time_off)
+    appointments_by_day = defaultdict(list)
+    for day, start, end in appointments:
+        appointments_by_day[day].append((start, end))
+    booked = {
+        (slot.get('date'), slot.get('start_time'), slot.get('end_time'))
+        for slot in (booked_slots or []) if isinstance(slot, dict)
+    }
+
+    free, earliest = 0, None
+    start_date = now.date()
+    for offset in range(days + 1):
+        current_date = start_date + timedelta(days=offset)
+        if any(start <= current_date <= end for start, end in time_off):
+            continue
+
+        for time_range in schedule.get(current_date.strftime('%A'), None) or []:
+            parsed = _parse_range(time_range)
+            if parsed is None:
+                continue
+            window_end = timezone.make_aware(datetime.combine(current_date, parsed[1]))
+            slot_start = timezone.make_aware(datetime.combine(current_date, parsed[0]))
+
+            while slot_start + timedelta(hours=1) <= window_end:
+                slot_end = slot_start + timedelta(hours=1)
+                start_time, end_time = slot_start.time(), slot_end.time()
+                taken = (
+                    any(
+                        booked_start < end_time and booked_end > start_time
+                        for booked_start, booked_end in appointments_by_day.get(current_date, ())
+                    )
+                    or (str(current_date), str(start_time), str(end_time)) in booked
+                    or slot_start < now
+                )
+                if not taken:
+                    free += 1
+                    if earliest is None or slot_start < earliest:
+                        earliest = slot_start
+                slot_start = slot_end
+
+    return free, earliest
+
+
+def refresh_capacity(therapist_ids: Iterable[int]) -> int:
+    """
+    Recount and store the capacity of the given therapists; returns the count
+
+    Cached match results are invalidated by bumping the pool version when
+    the new counts change the ranking under MATCHING_CAPACITY_MODE: who
+    the filter lets through, or any therapist's penalty factor.
+    """
+    from accounts.models import TherapistProfile
+    from booking.models import Appointment, TimeOffPeriod
+
+    therapist_ids = list(therapist_ids)
+    if not therapist_ids:
+        return 0
+
+    now = timezone.now()
+    start_date = now.date()
+    end_date = start_date + timedelta(days=BOOKING_WINDOW_DAYS)
+
+    profiles = {
+        user_id: (schedule, booked)
+        for user_id, schedule, booked in TherapistProfile.objects.filter(user_id__in=therapist_ids).values_list(
+            'user_id', 'availability_slots', 'booked_slots'
+        )
+    }
+    time_off = defaultdict(list)
+    for therapist_id, start, end in TimeOffPeriod.objects.filter(
+        therapist_id__in=therapist_ids, end_date__gte=start_date, start_date__lte=end_date
+    ).values_list('therapist_id', 'start_date', 'end_date'):
+        time_off[therapist_id].append((start, end))
+    appointments = defaultdict(list)
+    for therapist_id, day, start, end in Appointment.objects.filter(
+        therapist_id__in=therapist_ids,
+        appointment_date__gte=start_date,
+        appointment_date__lte=end_date,
+        status__in=BLOCKING_STATUSES,
+    ).values_list('therapist_id', 'appointment_date', 'start_time', 'end_time'):
+        appointments[therapist_id].append((day, start, end))
+
+    previous = get_capacity(therapist_ids)
+    rows = []
+    for therapist_id in therapist_ids:
+        schedule, booked = profiles.get(therapist_id, (None, None))
+        free, earliest = count_free_slots(
+            schedule, time_off[therapist_id], appointments[therapist_id], booked, now=now
+        )
+        rows.append(TherapistCapacity(
+            therapist_id=therapist_id, free_slots=free, next_available_at=earliest, computed_at=now
+        ))
+
+    TherapistCapacity.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['therapist'],
+        update_fields=['free_slots', 'next_available_at', 'computed_at'],
+    )
+    old_slots = np.array([previous.get(therapist_id, (-1, None))[0] for therapist_id in therapist_ids])
+    new_slots = np.array([row.free_slots for row in rows])
+    if _ranking_changed(capacity_mode(), old_slots, new_slots):
+        bump_pool_version()
+    return len(rows)
+
+
+def _ranking_changed(mode: Optional[str], old_slots: np.ndarray, new_slots: np.ndarray) -> bool:
+    """Whether recounted free slots (-1 = never counted) affect ranking in ``mode``"""
+    if mode == 'filter':
+        # Uncounted therapists pass the filter like bookable ones
+        return bool(np.any((old_slots != 0) != (new_slots != 0)))
+    if mode == 'penalty':
+        return bool(np.any(capacity_factors(old_slots) != capacity_factors(new_slots)))
+    return False
+
+
+def get_capacity(therapist_ids: Iterable[int]) -> Dict[int, Tuple[int, Optional[datetime]]]:
+    """(free slots, next available) per counted therapist, in one query"""
+    return {
+        therapist_id: (free, earliest)
+        for therapist_id, free, earliest in TherapistCapacity.objects.filter(
+            therapist_id__in=list(therapist_ids)
+        ).values_list('therapist_id', 'free_slots', 'next_available_at')
+    }
+
+
+def capacity_mode() -> Optional[str]:
+    """MATCHING_CAPACITY_MODE, validated"""
+    mode = getattr(settings, 'MATCHING_CAPACITY_MODE', None)
+    if mode not in CAPACITY_MODES:
+        logger.warning(f"[MATCHING] Unknown MATCHING_CAPACITY_MODE {mode!r}; capacity ignored")
+        return None
+    return mode
+
+
+def capacity_factors(free_slots: np.ndarray) -> np.ndarray:
+    """
+    Final-score multipliers for free-slot counts (-1 = never counted)
+
+    Full score from MATCHING_CAPACITY_MIN_FREE_SLOTS free slots up, falling
+    linearly to 1 - MATCHING_CAPACITY_PENALTY without any.
+    """
+    penalty = getattr(settings, 'MATCHING_CAPACITY_PENALTY', 0.3)
+    min_free = max(1, getattr(settings, 'MATCHING_CAPACITY_MIN_FREE_SLOTS', 3))
+    free_slots = np.asarray(free_slots, dtype=np.float64)
+    shortfall = np.clip((min_free - free_slots) / min_free, 0.0, 1.0)
+    return np.where(free_slots < 0, 1.0, 1.0 - penalty * shortfall)
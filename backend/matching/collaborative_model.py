@@ -0,0 +1,430 @@
+"""
+Learned Collaborative Filtering
+Layer 3 from appointment outcomes, as implicit-feedback matrix factorization
+
+Layer 3 used to count how often a therapist appeared in top-3 match slots.
+This model learns from what happened after patients booked instead:
+
+- completed appointments (no-shows count as negative evidence)
+- AppointmentFeedback rating and would_recommend
+- patient AppointmentReview ratings
+- SessionReport.session_outcome
+
+Every appointment gets an outcome score in [0, 1] and every
+patient-therapist pair the mean over its appointments. Pairs scoring at
+least OUTCOME_POSITIVE are preferences, the others observed negatives;
+more appointments and clearer outcomes mean more confidence. Factors are
+fitted offline with implicit ALS (Hu, Koren & Volinsky) in NumPy by
+`python manage.py train_collaborative_model` and stored as float32 arrays
+in MATCHING_CF_MODEL_DIR.
+
+Patients without appointments have no factors of their own: a ridge
+regression from survey embeddings (PatientMatchFeatures) to the learned
+patient factors gives them one, and the mean patient factor is used when
+there is no embedding either. At request time Layer 3 is one
+matrix-vector product over the whole pool.
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .embedding_store import directory_lock, normalize_rows
+from .result_cache import bump_pool_version
+
+logger = logging.getLogger(__name__)
+
+# Outcome scores of the signals attached to an appointment
+OUTCOME_SCORES = {
+    'breakthrough': 1.0,
+    'productive': 0.8,
+    'needs_follow_up': 0.5,
+    'blocked': 0.2,
+}
+COMPLETED_SCORE = 0.6
+NO_SHOW_SCORE = 0.0
+
+# Pairs scoring at least this are treated as preferences
+OUTCOME_POSITIVE = 0.5
+
+
+class Interactions(NamedTuple):
+    """Observed patient-therapist pairs, aligned arrays"""
+    patient_ids: np.ndarray
+    therapist_ids: np.ndarray
+    scores: np.ndarray   # mean outcome score in [0, 1]
+    counts: np.ndarray   # appointments behind each pair
+
+
+def collect_interactions(patient_ids: Optional[Sequence[int]] = None) -> Interactions:
+    """Outcome score per patient-therapist pair (optionally of some patients only), in three queries"""
+    from booking.models import Appointment, AppointmentReview
+    from booking.session_reports import SessionReport
+
+    appointments = Appointment.objects.filter(status__in=['completed', 'no_show'])
+    if patient_ids is not None:
+        appointments = appointments.filter(patient_id__in=list(patient_ids))
+    appointments = list(
+        appointments.values_list(
+            'id', 'patient_id', 'therapist_id', 'status', 'feedback__rating', 'feedback__would_recommend',
+        )
+    )
+    appointment_ids = [row[0] for row in appointments]
+
+    reviews = defaultdict(list)
+    for appointment_id, rating in AppointmentReview.objects.filter(
+        appointment_id__in=appointment_ids, reviewer_type='patient'
+    ).values_list('appointment_id', 'rating'):
+        reviews[appointment_id].append(rating)
+
+    outcomes = dict(
+        SessionReport.objects.filter(appointment_id__in=appointment_ids).values_list('appointment_id', 'session_outcome')
+    )
+
+    pairs = defaultdict(list)
+    for appointment_id, patient_id, therapist_id, status, rating, would_recommend in appointments:
+        if status == 'no_show':
+            pairs[(patient_id, therapist_id)].append(NO_SHOW_SCORE)
+            continue
+
+        signals = [COMPLETED_SCORE]
+        if rating is not None:
+            signals.append(min(1.0, max(0.0, (rating - 1) / 4)))  # 1-5 stars
+        if would_recommend is not None and rating is not None:
+            signals.append(1.0 if would_recommend else 0.0)
+        signals.extend((review - 1) / 9 for review in reviews.get(appointment_id, ()))  # 1-10
+        if appointment_id in outcomes:
+            signals.append(OUTCOME_SCORES.get(outcomes[appointment_id], COMPLETED_SCORE))
+        pairs[(patient_id, therapist_id)].append(sum(signals) / len(signals))
+
+    keys = sorted(pairs)
+    return Interactions(
+        patient_ids=np.array([patient for patient, _ in keys], dtype=np.int64),
+        therapist_ids=np.array([therapist for _, therapist in keys], dtype=np.int64),
+        scores=np.array([np.mean(pairs[key]) for key in keys], dtype=np.float64),
+        counts=np.array([len(pairs[key]) for key in keys], dtype=np.float64),
+    )
+
+
+# ----------------------------------------------------------------------
+# Fitting
+# ----------------------------------------------------------------------
+
+def _als_step(fixed: np.ndarray, groups: List[Tuple[np.ndarray, np.ndarray, np.ndarray]], regularization: float) -> np.ndarray:
+    """
+    Solve every row of one side with the other side fixed
+
+    For a row with observed columns ``idx``, preferences ``p`` and
+    confidences ``c``: (FᵀF + Fᵀ(C - I)F + λI) x = FᵀCp, where FᵀF is
+    shared by all rows and only the observed columns add to it.
+    """
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed
+    ridge = regularization * np.eye(factors)
+    solved = np.zeros((len(groups), factors))
+    for row, (idx, preference, confidence) in enumerate(groups):
+        if not len(idx):
+            continue
+        observed = fixed[idx]
+        lhs = gram + (observed.T * (confidence - 1.0)) @ observed + ridge
+        rhs = (observed.T * confidence) @ preference
+        solved[row] = np.linalg.solve(lhs, rhs)
+    return solved
+
+
+def implicit_als(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    preference: np.ndarray,
+    confidence: np.ndarray,
+    shape: Tuple[int, int],
+    factors: int = 16,
+    regularization: float = 0.1,
+    iterations: int = 15,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Implicit-feedback ALS; returns (row factors, column factors)"""
+    rng = np.random.default_rng(seed)
+    row_factors = rng.normal(scale=0.1, size=(shape[0], factors))
+    col_factors = rng.normal(scale=0.1, size=(shape[1], factors))
+
+    def grouped(keys, others, count):
+        order = np.argsort(keys, kind='stable')
+        bounds = np.searchsorted(keys[order], np.arange(count + 1))
+        return [
+            (others[order[start:end]], preference[order[start:end]], confidence[order[start:end]])
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+    by_row = grouped(rows, cols, shape[0])
+    by_col = grouped(cols, rows, shape[1])
+    for _ in range(iterations):
+        row_factors = _als_step(col_factors, by_row, regularization)
+        col_factors = _als_step(row_factors, by_col, regularization)
+    return row_factors, col_factors
+
+
+def fit_cold_start(embeddings: np.ndarray, factors: np.ndarray, regularization: float = 1.0) -> np.ndarray:
+    """
+    Ridge regression from unit survey embeddings to patient factors
+
+    Returns a (dim + 1, factors) matrix; the last row is the intercept.
+    """
+    design = np.hstack([normalize_rows(embeddings), np.ones((embeddings.shape[0], 1))])
+    ridge = regularization * np.eye(design.shape[1])
+    ridge[-1, -1] = 0.0  # The intercept is not penalised
+    return np.linalg.solve(design.T @ design + ridge, design.T @ factors)
+
+
+def learned_layer3_scores(predictions: np.ndarray) -> np.ndarray:
+    """Layer 3 scores from predicted preferences, on collaborative_score()'s 0.3-1.0 range"""
+    return np.minimum(1.0, np.maximum(0.0, 0.3 + 0.7 * np.asarray(predictions, dtype=np.float64)))
+
+
+def learned_layer3_result(prediction: float, score: float) -> Dict:
+    """Layer 3 breakdown of a therapist scored by the learned model"""
+    return {
+        'score': score,
+        'predicted_preference': prediction,
+        'learned': True,
+        'match_frequency': 0,
+        'first_choice_rate': 0.0,
+        'similar_patients_matched': 0,
+    }
+
+
+# ----------------------------------------------------------------------
+# Stored model
+# ----------------------------------------------------------------------
+
+class CollaborativeModel:
+    """
+    Latent factors stored in one ``.npz`` file
+
+    - patient_ids / patient_factors:     float32 (patients, factors)
+    - therapist_ids / therapist_factors: float32 (therapists, factors)
+    - mean_patient:                      fallback patient factor
+    - cold_start:                        ridge weights (dim + 1, factors),
+                                         empty without survey embeddings
+
+    Written atomically; readers reload when the file's mtime changes.
+    """
+
+    MODEL_FILE = 'factors.npz'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.patient_factors = np.zeros((0, 0), dtype=np.float32)
+        self.therapist_factors = np.zeros((0, 0), dtype=np.float32)
+        self.mean_patient = np.zeros(0, dtype=np.float32)
+        self.cold_start = np.zeros((0, 0), dtype=np.float32)
+        self._patient_rows: Dict[int, int] = {}
+        self._therapist_rows: Dict[int, int] = {}
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, self.MODEL_FILE)
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self._path()).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+
+        try:
+            with np.load(self._path()) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load collaborative model from {self.directory}: {e}")
+            return
+
+        self._reset()
+        self.patient_factors = arrays['patient_factors']
+        self.therapist_factors = arrays['therapist_factors']
+        self.mean_patient = arrays['mean_patient']
+        self.cold_start = arrays['cold_start']
+        self._patient_rows = {int(owner): row for row, owner in enumerate(arrays['patient_ids'])}
+        self._therapist_rows = {int(owner): row for row, owner in enumerate(arrays['therapist_ids'])}
+        self._loaded_mtime = mtime
+
+    def save(
+        self,
+        patient_ids: Sequence[int],
+        patient_factors: np.ndarray,
+        therapist_ids: Sequence[int],
+        therapist_factors: np.ndarray,
+        cold_start: Optional[np.ndarray] = None,
+    ) -> None:
+        patient_factors = np.asarray(patient_factors, dtype=np.float32)
+        factors = patient_factors.shape[1]
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self._path() + '.tmp.npz'
+            np.savez(
+                temp_path,
+                patient_ids=np.asarray(patient_ids, dtype=np.int64),
+                patient_factors=patient_factors,
+                therapist_ids=np.asarray(therapist_ids, dtype=np.int64),
+                therapist_factors=np.asarray(therapist_factors, dtype=np.float32),
+                mean_patient=patient_factors.mean(axis=0) if len(patient_factors) else np.zeros(factors, np.float32),
+                cold_start=np.asarray(cold_start if cold_start is not None else np.zeros((0, factors)), dtype=np.float32),
+            )
+            os.replace(temp_path, self._path())
+            self._loaded_mtime = None
+            self._reload_if_changed()
+
+    @property
+    def exists(self) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            return bool(self._therapist_rows)
+
+    def patient_vector(
+        self,
+        patient_id: int,
+        embedding: Optional[np.ndarray] = None,
+        learned: bool = True,
+    ) -> np.ndarray:
+        """
+        Learned factors of a patient, else predicted from the survey embedding, else the mean
+
+        ``learned=False`` treats the patient as new even if the model was
+        fitted on their appointments (offline evaluation against them).
+        """
+        with self._lock:
+            self._reload_if_changed()
+            row = self._patient_rows.get(patient_id) if learned else None
+            if row is not None:
+                return self.patient_factors[row]
+            if embedding is not None and self.cold_start.shape[0] == len(embedding) + 1:
+                unit = normalize_rows(np.asarray(embedding, dtype=np.float32))[0]
+                return (np.append(unit, 1.0) @ self.cold_start).astype(np.float32)
+            return self.mean_patient
+
+    def predict(self, patient_vectors: np.ndarray, therapist_ids: Sequence[int]) -> Tuple[List[int], np.ndarray]:
+        """
+        Predicted preferences of one or more patients for the given therapists
+
+        Therapists the model has no factors for are left out. Returns
+        (therapist ids, predictions) with predictions shaped like the
+        patient vectors: (therapists,) for one patient, (patients,
+        therapists) for a stack.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            known = [therapist_id for therapist_id in therapist_ids if therapist_id in self._therapist_rows]
+            factors = self.therapist_factors[[self._therapist_rows[therapist_id] for therapist_id in known]]
+        return known, (np.asarray(patient_vectors, dtype=np.float32) @ factors.T).astype(np.float64)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._therapist_rows)
+
+
+def latest_embeddings(patient_ids: Sequence[int]) -> Dict[int, np.ndarray]:
+    """Survey embedding of each patient's most recent features"""
+    from .blog_sections import decode_embedding
+    from .models import PatientMatchFeatures
+
+    embeddings = {}
+    rows = PatientMatchFeatures.objects.filter(
+        survey_response__patient_id__in=list(patient_ids),
+        embedding__isnull=False,
+    ).order_by('survey_response__patient_id', '-updated_at').values_list('survey_response__patient_id', 'embedding')
+    for patient_id, embedding in rows:
+        if patient_id not in embeddings and embedding:
+            embeddings[patient_id] = decode_embedding(embedding)
+    return embeddings
+
+
+def train_collaborative_model(
+    factors: int = 16,
+    regularization: float = 0.1,
+    alpha: float = 10.0,
+    iterations: int = 15,
+) -> Dict:
+    """
+    Fit and store the factors from current appointment outcomes
+
+    Returns counts of patients, therapists, interactions and patients
+    used for the cold-start regression.
+    """
+    interactions = collect_interactions()
+    stats = {'interactions': len(interactions.scores), 'patients': 0, 'therapists': 0, 'cold_start_patients': 0}
+    if not len(interactions.scores):
+        return stats
+
+    patient_ids, rows = np.unique(interactions.patient_ids, return_inverse=True)
+    therapist_ids, cols = np.unique(interactions.therapist_ids, return_inverse=True)
+    preference = (interactions.scores >= OUTCOME_POSITIVE).astype(np.float64)
+    # Clear outcomes and repeated appointments weigh more
+    confidence = 1.0 + alpha * interactions.counts * np.abs(interactions.scores - OUTCOME_POSITIVE) * 2
+
+    patient_factors, therapist_factors = implicit_als(
+        rows, cols, preference, confidence,
+        shape=(len(patient_ids), len(therapist_ids)),
+        factors=factors,
+        regularization=regularization,
+        iterations=iterations,
+    )
+
+    cold_start = None
+    embeddings = latest_embeddings(patient_ids.tolist())
+    dims = {len(vector) for vector in embeddings.values()}
+    if len(embeddings) >= 2 and len(dims) == 1:
+        with_embedding = [row for row, patient_id in enumerate(patient_ids) if int(patient_id) in embeddings]
+        cold_start = fit_cold_start(
+            np.stack([embeddings[int(patient_ids[row])] for row in with_embedding]),
+            patient_factors[with_embedding],
+        )
+        stats['cold_start_patients'] = len(with_embedding)
+
+    get_collaborative_model().save(
+        patient_ids.tolist(), patient_factors, therapist_ids.tolist(), therapist_factors, cold_start,
+    )
+    # Results cached or saved with the previous factors are stale now
+    bump_pool_version()
+    stats.update(patients=len(patient_ids), therapists=len(therapist_ids))
+    return stats
+
+
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+
+
+def get_collaborative_model() -> CollaborativeModel:
+    """Process-wide collaborative model (stored in MATCHING_CF_MODEL_DIR)"""
+    global _MODEL
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            directory = getattr(
+                settings,
+                'MATCHING_CF_MODEL_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'collaborative'),
+            )
+            _MODEL = CollaborativeModel(str(directory))
+        return _MODEL
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the model when MATCHING_CF_MODEL_DIR is overridden (tests, benchmarks)"""
+    global _MODEL
+    if setting == 'MATCHING_CF_MODEL_DIR':
+        with _MODEL_LOCK:
+            _MODEL = None
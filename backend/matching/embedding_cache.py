@@ -0,0 +1,306 @@
+"""
+Shared Embedding Cache
+Text embeddings keyed by content hash in memory-mapped files
+
+Every web worker loads its own copy of the sentence-transformer, and
+without a cache each of them re-encodes the same patient and therapist
+texts. This cache keeps encoded vectors in fixed-size ``.npy`` files that
+all processes on the host map into memory, so a vector computed by one
+worker is read by the others instead of being encoded again:
+
+- vectors.npy:    float32 (capacity, dim), one slot per cached text
+- digests.npy:    content hash stored in each slot ('' for a free slot)
+- last_used.npy:  last access time per slot, for LRU eviction
+- generation.npy: bumped on every write so readers refresh their index
+
+The capacity follows MATCHING_EMBEDDING_CACHE_MAX_MB. When the cache is
+full the least recently used tenth of the slots is freed in one go.
+Writers clear a slot's digest before reusing it and store the new digest
+only after the vector; readers check the digest before and after copying
+the vector (seqlock-style), so a slot reused by another process, even
+mid-copy, is only ever a miss.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .embedding_store import directory_lock
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DTYPE = 'S40'
+
+# Fraction of slots freed when the cache is full
+EVICT_FRACTION = 0.1
+
+
+def cache_digest(model_name: str, text: str) -> bytes:
+    """Cache key of a text under one embedding model"""
+    return hashlib.sha1(f'{model_name}\0{text}'.encode('utf-8')).hexdigest().encode('ascii')
+
+
+class EmbeddingCache:
+    """
+    Host-wide cache of text embeddings in memory-mapped files
+
+    The files are created on the first write, once the embedding
+    dimension is known; a different model, dimension or capacity starts
+    a new cache.
+    """
+
+    META_FILE = 'meta.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str, model_name: str, max_bytes: int):
+        self.directory = directory
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._close()
+
+    def _close(self) -> None:
+        self._vectors: Optional[np.ndarray] = None
+        self._digests: Optional[np.ndarray] = None
+        self._last_used: Optional[np.ndarray] = None
+        self._generation: Optional[np.ndarray] = None
+        self._slots: Dict[bytes, int] = {}
+        self._seen_generation = -1
+
+    # ------------------------------------------------------------------
+    # Files
+    # ------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._path(self.META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _capacity(self, dim: int) -> int:
+        return max(1, self.max_bytes // (dim * 4))
+
+    def _matches(self, meta: Optional[Dict], dim: Optional[int] = None) -> bool:
+        if not meta or meta.get('model') != self.model_name:
+            return False
+        dim = dim or meta.get('dim')
+        return meta.get('dim') == dim and meta.get('capacity') == self._capacity(dim)
+
+    def _open(self) -> bool:
+        """Map the cache files (if they exist for this model); True when mapped"""
+        if self._vectors is not None:
+            return True
+
+        meta = self._read_meta()
+        if not self._matches(meta):
+            return False
+
+        try:
+            self._vectors = np.load(self._path('vectors.npy'), mmap_mode='r+')
+            self._digests = np.load(self._path('digests.npy'), mmap_mode='r+')
+            self._last_used = np.load(self._path('last_used.npy'), mmap_mode='r+')
+            self._generation = np.load(self._path('generation.npy'), mmap_mode='r+')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not map embedding cache in {self.directory}: {e}")
+            self._close()
+            return False
+        return True
+
+    def _create(self, dim: int) -> None:
+        """(Re)create empty cache files; caller holds the process lock"""
+        os.makedirs(self.directory, exist_ok=True)
+        capacity = self._capacity(dim)
+        self._close()
+
+        # Invalidate first so no reader maps half-created files
+        meta_path = self._path(self.META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        shapes = {
+            'vectors.npy': ((capacity, dim), np.float32),
+            'digests.npy': ((capacity,), DIGEST_DTYPE),
+            'last_used.npy': ((capacity,), np.float64),
+            'generation.npy': ((1,), np.int64),
+        }
+        for name, (shape, dtype) in shapes.items():
+            array = np.lib.format.open_memmap(self._path(name), mode='w+', dtype=dtype, shape=shape)
+            array.flush()
+            del array
+
+        meta_tmp = meta_path + '.tmp'
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'dim': dim, 'capacity': capacity}, f)
+        os.replace(meta_tmp, meta_path)
+
+    def _refresh_slots(self) -> None:
+        """Rebuild digest -> slot after another process wrote"""
+        generation = int(self._generation[0])
+        if generation == self._seen_generation:
+            return
+        digests = np.asarray(self._digests)
+        used = np.flatnonzero(digests != b'')
+        self._slots = {bytes(digests[slot]): int(slot) for slot in used}
+        self._seen_generation = generation
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get_many(self, digests: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Cached vectors for the given digests (misses are left out)"""
+        with self._lock:
+            if not self._open():
+                return {}
+            self._refresh_slots()
+
+            found = {}
+            now = time.time()
+            for digest in digests:
+                slot = self._slots.get(digest)
+                # The slot may have been reused by another process since
+                if slot is None or self._digests[slot] != digest:
+                    continue
+                vector = np.array(self._vectors[slot])
+                # Reused while copying: the vector may be torn or someone else's
+                if self._digests[slot] != digest:
+                    continue
+                found[digest] = vector
+                self._last_used[slot] = now
+            return found
+
+    def put_many(self, digests: List[bytes], vectors: np.ndarray) -> None:
+        """Store vectors, evicting the least recently used slots when full"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not digests or vectors.ndim != 2:
+            return
+
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            dim = vectors.shape[1]
+            if not self._matches(self._read_meta(), dim):
+                self._create(dim)
+            if not self._open():
+                return
+            # Writes from other processes are visible through the mapping
+            self._seen_generation = -1
+            self._refresh_slots()
+
+            capacity = self._digests.shape[0]
+            pending = [
+                (digest, vector)
+                for digest, vector in zip(digests, vectors)
+                if digest not in self._slots
+            ][:capacity]
+            if not pending:
+                return
+
+            free = np.flatnonzero(self._digests == b'')
+            if len(free) < len(pending):
+                free = self._evict(len(pending) - len(free))
+
+            now = time.time()
+            # Free slots have an empty digest; set the new one only after the vector
+            for slot, (digest, vector) in zip(free, pending):
+                self._vectors[slot] = vector
+                self._digests[slot] = digest
+                self._last_used[slot] = now
+                self._slots[digest] = int(slot)
+
+            self._vectors.flush()
+            self._digests.flush()
+            self._generation[0] += 1
+            self._generation.flush()
+            self._seen_generation = int(self._generation[0])
+
+    def _evict(self, needed: int) -> np.ndarray:
+        """Free the least recently used slots; returns every free slot"""
+        capacity = self._digests.shape[0]
+        count = min(capacity, max(needed, int(capacity * EVICT_FRACTION)))
+        used = np.flatnonzero(self._digests != b'')
+        oldest = used[np.argsort(self._last_used[used], kind='stable')[:count]]
+        for slot in oldest:
+            self._slots.pop(bytes(self._digests[slot]), None)
+        self._digests[oldest] = b''
+        logger.info(f"Embedding cache full: evicted {len(oldest)} of {capacity} entries")
+        return np.flatnonzero(self._digests == b'')
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings of ``texts``; only texts no process has cached are encoded
+
+        ``encoder`` receives each missing text once, in a single batch.
+        """
+        digests = [cache_digest(self.model_name, text) for text in texts]
+        try:
+            cached = self.get_many(digests)
+        except OSError as e:
+            logger.warning(f"Embedding cache unavailable: {e}")
+            return np.asarray(encoder(texts))
+
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+
+        if missing:
+            encoded = np.asarray(encoder(list(missing.values())), dtype=np.float32)
+            cached.update(zip(missing.keys(), encoded))
+            try:
+                self.put_many(list(missing.keys()), encoded)
+            except OSError as e:
+                logger.warning(f"Could not write embedding cache: {e}")
+
+        if not digests:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([cached[digest] for digest in digests])
+
+    def __len__(self) -> int:
+        with self._lock:
+            if not self._open():
+                return 0
+            self._refresh_slots()
+            return len(self._slots)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache(model_name: str) -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache, or None when MATCHING_EMBEDDING_CACHE_MAX_MB is 0"""
+    global _CACHE
+    max_mb = getattr(settings, 'MATCHING_EMBEDDING_CACHE_MAX_MB', 64)
+    if not max_mb:
+        return None
+
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.model_name != model_name:
+            directory = getattr(
+                settings,
+                'MATCHING_EMBEDDING_CACHE_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'embedding_cache'),
+            )
+            _CACHE = EmbeddingCache(str(directory), model_name, int(max_mb * 1024 * 1024))
+        return _CACHE
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the cache when its settings are overridden (tests, benchmarks)"""
+    global _CACHE
+    if setting in ('MATCHING_EMBEDDING_CACHE_DIR', 'MATCHING_EMBEDDING_CACHE_MAX_MB'):
+        with _CACHE_LOCK:
+            _CACHE = None
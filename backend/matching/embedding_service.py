@@ -0,0 +1,267 @@
+"""
+Embedding Service
+One sentence-transformer per host, shared by every worker over a Unix socket
+
+`python manage.py run_embedding_service` loads the model once and listens
+on MATCHING_EMBEDDING_SOCKET. Web and job workers send their texts there
+(encode_remote) instead of loading their own copy of the model. Requests
+arriving within MATCHING_EMBEDDING_BATCH_WINDOW_MS of each other are
+coalesced into one micro-batch of up to MATCHING_EMBEDDING_MAX_BATCH
+texts, so concurrent requests share a single forward pass.
+
+Wire format (both directions): a 4-byte big-endian length and a JSON
+header; responses are followed by the float32 vectors, row-major.
+- request:  {"texts": [...]}
+- response: {"rows": n, "dim": d} or {"error": "..."}
+
+When the service is not configured or not reachable, algorithm.encode_texts
+falls back to the in-process model.
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+class EmbeddingServiceError(Exception):
+    """The embedding service could not be reached or failed to encode"""
+    pass
+
+
+def _send_message(sock: socket.socket, header: dict, payload: bytes = b'') -> None:
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed mid-message')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_header(sock: socket.socket) -> dict:
+    (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return json.loads(_recv_exact(sock, length).decode('utf-8'))
+
+
+# ----------------------------------------------------------------------
+# Server
+# ----------------------------------------------------------------------
+
+class MicroBatcher:
+    """
+    Collect encode requests from many connections into shared batches
+
+    A batch is closed when ``max_batch`` texts are waiting or ``window``
+    seconds have passed since its first request, whichever comes first.
+    """
+
+    def __init__(self, encoder: Encoder, max_batch: int = 64, window: float = 0.005):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: 'queue.Queue[Optional[Tuple[List[str], Future]]]' = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self.batches = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _collect(self, first) -> Tuple[list, bool]:
+        """The requests of one batch, and whether stop was requested"""
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            size += len(item[0])
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+            self._encode(batch)
+
+    def _encode(self, batch) -> None:
+        # Each distinct text is encoded once per batch
+        unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+        try:
+            vectors = np.asarray(self.encoder(unique), dtype=np.float32) if unique else None
+        except Exception as e:
+            logger.exception("[EMBEDDING] Batch encode failed")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        rows = {text: row for row, text in enumerate(unique)}
+        for texts, future in batch:
+            if texts:
+                future.set_result(vectors[[rows[text] for text in texts]])
+            else:
+                future.set_result(np.zeros((0, 0), dtype=np.float32))
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                request = _recv_header(sock)
+            except (ConnectionError, struct.error, ValueError):
+                return
+
+            try:
+                vectors = self.server.batcher.submit(list(request['texts'])).result()
+            except Exception as e:
+                _send_message(sock, {'error': f'{type(e).__name__}: {e}'})
+                continue
+
+            rows, dim = vectors.shape if vectors.size else (0, 0)
+            _send_message(sock, {'rows': rows, 'dim': dim}, vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server; one thread per connection, one shared MicroBatcher"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, encoder: Encoder, max_batch: int = 64, window: float = 0.005):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Left over from a previous run
+        self.batcher = MicroBatcher(encoder, max_batch=max_batch, window=window)
+        super().__init__(socket_path, _RequestHandler)
+        self.batcher.start()
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+
+_LOCAL = threading.local()
+_RETRY_AFTER = 30.0
+_UNAVAILABLE_UNTIL = 0.0
+
+
+def service_socket_path() -> Optional[str]:
+    """MATCHING_EMBEDDING_SOCKET, or None when the service is not used"""
+    return getattr(settings, 'MATCHING_EMBEDDING_SOCKET', None)
+
+
+def _connection(socket_path: str, timeout: float) -> socket.socket:
+    """A persistent connection per thread"""
+    sock = getattr(_LOCAL, 'sock', None)
+    if sock is not None and getattr(_LOCAL, 'path', None) != socket_path:
+        _drop_connection()
+        sock = None
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        _LOCAL.sock, _LOCAL.path = sock, socket_path
+    return sock
+
+
+def _drop_connection() -> None:
+    sock = getattr(_LOCAL, 'sock', None)
+    if sock is not None:
+        try:
+            sock.close()
+        except OSError:
+            pass
+    _LOCAL.sock = None
+
+
+def encode_remote(texts: List[str], socket_path: str, timeout: Optional[float] = None) -> np.ndarray:
+    """
+    Encode texts with the embedding service
+
+    Raises:
+        EmbeddingServiceError: service unreachable, timed out or failed
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'MATCHING_EMBEDDING_SERVICE_TIMEOUT', 5.0)
+
+    try:
+        sock = _connection(socket_path, timeout)
+        _send_message(sock, {'texts': list(texts)})
+        header = _recv_header(sock)
+        if 'error' in header:
+            raise EmbeddingServiceError(header['error'])
+        rows, dim = header['rows'], header['dim']
+        payload = _recv_exact(sock, rows * dim * 4)
+    except (OSError, ConnectionError, struct.error, ValueError, KeyError) as e:
+        _drop_connection()
+        raise EmbeddingServiceError(str(e)) from e
+
+    return np.frombuffer(payload, dtype=np.float32).reshape(rows, dim)
+
+
+def try_encode_remote(texts: List[str]) -> Optional[np.ndarray]:
+    """
+    Vectors from the embedding service, or None to encode in-process
+
+    After a failure the service is not tried again for a short while, so
+    an outage costs one timeout rather than one per request.
+    """
+    global _UNAVAILABLE_UNTIL
+    socket_path = service_socket_path()
+    if not socket_path or time.monotonic() < _UNAVAILABLE_UNTIL:
+        return None
+
+    try:
+        return encode_remote(texts, socket_path)
+    except EmbeddingServiceError as e:
+        logger.warning(f"[EMBEDDING] Service at {socket_path} unavailable, encoding in-process: {e}")
+        _UNAVAILABLE_UNTIL = time.monotonic() + _RETRY_AFTER
+        return None
@@ -0,0 +1,317 @@
+"""
+Persistent Therapist Embedding Store
+Keeps pre-computed embeddings for therapist bios and blog sections on disk
+
+Vectors are stored L2-normalised in a single NumPy matrix, keyed by a
+string id ('bio:<therapist_id>', 'blog:<post_id>:<section>') together with
+a hash of the text they were computed from. A key whose text changed is
+re-encoded, everything else is reused, so a match request only needs one
+matrix product against the patient vector.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+try:
+    import fcntl  # POSIX only, used to serialise writers across processes
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of the text an embedding was computed from"""
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+def bio_key(therapist_id: int) -> str:
+    """Store key for a therapist's bio (therapist = User id)"""
+    return f'bio:{therapist_id}'
+
+
+def blog_post_prefix(post_id: int) -> str:
+    """Key prefix shared by all sections of a blog post"""
+    return f'blog:{post_id}:'
+
+
+def blog_section_key(post_id: int, section_index: int) -> str:
+    """Store key for one therapeutic section of a blog post"""
+    return f'{blog_post_prefix(post_id)}{section_index}'
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise each row so that a dot product is a cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@contextmanager
+def directory_lock(directory: str, lock_file: str = '.lock'):
+    """Exclusive cross-process lock on a data directory (no-op without fcntl)"""
+    if fcntl is None:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, lock_file), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """
+    Disk-backed matrix of normalised embeddings
+
+    Layout inside ``directory``:
+    - vectors.npy: float32 matrix, one row per key
+    - index.json:  {key: [row, content_hash]}
+
+    Writes are atomic (write to a temp file, then ``os.replace``) and are
+    serialised across processes with a lock file where ``fcntl`` exists.
+    Readers pick up changes made by other processes by checking the
+    index file's modification time.
+    """
+
+    VECTORS_FILE = 'vectors.npy'
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._vectors: Optional[np.ndarray] = None
+        self._index: Dict[str, Tuple[int, str]] = {}
+        self._loaded_mtime: Optional[int] = None
+
+    # ------------------------------------------------------------------
+    # Loading / saving
+    # ------------------------------------------------------------------
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, self.VECTORS_FILE)
+
+    def _index_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        """Reload from disk when another process has written the store"""
+        mtime = self._index_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                raw_index = json.load(f)
+            vectors = np.load(self._vectors_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load embedding store from {self.directory}: {e}")
+            return
+
+        self._index = {key: (row, digest) for key, (row, digest) in raw_index.items()}
+        self._vectors = vectors.astype(np.float32, copy=False)
+        self._loaded_mtime = mtime
+
+    def _save(self) -> None:
+        """Atomically persist the current matrix and index"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        vectors_tmp = self._vectors_path + '.tmp.npy'
+        index_tmp = self._index_path + '.tmp'
+
+        vectors = self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        np.save(vectors_tmp, vectors)
+        with open(index_tmp, 'w', encoding='utf-8') as f:
+            json.dump({key: [row, digest] for key, (row, digest) in self._index.items()}, f)
+
+        # Vectors first so a reader never sees an index pointing past the matrix
+        os.replace(vectors_tmp, self._vectors_path)
+        os.replace(index_tmp, self._index_path)
+        self._loaded_mtime = self._index_mtime()
+
+    def _process_lock(self):
+        """Hold the cross-process write lock (no-op without fcntl)"""
+        return directory_lock(self.directory, self.LOCK_FILE)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def missing(self, items: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Return the (key, text) pairs that are absent or out of date"""
+        with self._lock:
+            self._reload_if_changed()
+            stale = []
+            for key, text in items:
+                entry = self._index.get(key)
+                if entry is None or entry[1] != content_hash(text):
+                    stale.append((key, text))
+            return stale
+
+    def ensure(self, items: Iterable[Tuple[str, str]], encoder: Encoder) -> int:
+        """
+        Make sure every (key, text) pair has an up-to-date vector
+
+        Only absent or stale entries are passed to ``encoder`` (in one
+        batch). Returns the number of texts that had to be encoded.
+        """
+        items = list(items)
+        if not items:
+            return 0
+
+        with self._lock:
+            stale = self.missing(items)
+            if not stale:
+                return 0
+
+            # Deduplicate while keeping the last text seen for each key
+            pending = dict(stale)
+            encoded = normalize_rows(encoder(list(pending.values())))
+
+            with self._process_lock():
+                # Another process may have written while we were encoding
+                self._reload_if_changed()
+                self._upsert_rows(list(pending.keys()), list(pending.values()), encoded)
+                self._save()
+
+            return len(pending)
+
+    def _upsert_rows(self, keys: List[str], texts: List[str], vectors: np.ndarray) -> None:
+        if self._vectors is None or self._vectors.size == 0:
+            self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        new_rows = []
+        for key, text, vector in zip(keys, texts, vectors):
+            entry = self._index.get(key)
+            if entry is not None:
+                self._vectors[entry[0]] = vector
+                self._index[key] = (entry[0], content_hash(text))
+            else:
+                new_rows.append((key, text, vector))
+
+        if new_rows:
+            start = self._vectors.shape[0]
+            self._vectors = np.vstack([self._vectors, np.stack([v for _, _, v in new_rows])])
+            for offset, (key, text, _) in enumerate(new_rows):
+                self._index[key] = (start + offset, content_hash(text))
+
+    def remove(self, keys: Iterable[str] = (), prefix: Optional[str] = None) -> int:
+        """
+        Drop keys (and/or every key starting with ``prefix``) from the store
+
+        The matrix is compacted so no dead rows are kept on disk.
+        """
+        with self._lock, self._process_lock():
+            self._reload_if_changed()
+            doomed = set(keys)
+            if prefix:
+                doomed.update(key for key in self._index if key.startswith(prefix))
+            doomed &= set(self._index)
+            if not doomed:
+                return 0
+
+            keep = sorted(
+                ((row, key, digest) for key, (row, digest) in self._index.items() if key not in doomed),
+            )
+            rows = [row for row, _, _ in keep]
+            self._vectors = self._vectors[rows] if self._vectors is not None else None
+            self._index = {key: (new_row, digest) for new_row, (_, key, digest) in enumerate(keep)}
+            self._save()
+            return len(doomed)
+
+    def keys_with_prefix(self, prefix: str) -> List[str]:
+        with self._lock:
+            self._reload_if_changed()
+            return [key for key in self._index if key.startswith(prefix)]
+
+    def vectors(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of the given keys (missing keys are skipped)"""
+        with self._lock:
+            self._reload_if_changed()
+            return {
+                key: self._vectors[self._index[key][0]].copy()
+                for key in keys
+                if key in self._index
+            }
+
+    def score(self, query: np.ndarray) -> Tuple[np.ndarray, Dict[str, int]]:
+        """
+        Cosine similarity of ``query`` against every stored vector
+
+        One matrix product over the whole store. Returns the similarity
+        array and a snapshot of key -> row so callers can look up the
+        entries they care about.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if self._vectors is None or self._vectors.shape[0] == 0:
+                return np.zeros(0, dtype=np.float32), {}
+
+            query = normalize_rows(query)[0]
+            similarities = self._vectors @ query
+            rows = {key: row for key, (row, _) in self._index.items()}
+            return similarities, rows
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            return key in self._index
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._index)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Process-wide embedding store (directory from MATCHING_EMBEDDING_STORE_DIR)"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            directory = getattr(
+                settings,
+                'MATCHING_EMBEDDING_STORE_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'embeddings'),
+            )
+            _STORE = EmbeddingStore(str(directory))
+        return _STORE
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the store when MATCHING_EMBEDDING_STORE_DIR is overridden (tests, benchmarks)"""
+    global _STORE
+    if setting == 'MATCHING_EMBEDDING_STORE_DIR':
+        with _STORE_LOCK:
+            _STORE = None
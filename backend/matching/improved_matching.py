@@ -5,9 +5,14 @@ No database changes required - works with existing TherapistProfile model
 """
 
 import re
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
 import logging
 
+from django.core.cache import cache
+
+from .keyword_automaton import KeywordAutomaton
+from .specialization_index import SpecializationIndex
+
 logger = logging.getLogger(__name__)
 
 
@@ -148,6 +153,9 @@ SPECIALIZATION_SYNONYMS = {
     'act': ['act', 'acceptance and commitment', 'values-based'],
 }
 
+# Synonym -> category bitsets, built once at import
+SPECIALIZATION_INDEX = SpecializationIndex(SPECIALIZATION_SYNONYMS)
+
 # Profession type scoring (for quality assessment)
 PROFESSION_SCORES = {
     'psychologist': 0.90,      # PhD or PsyD required
@@ -158,6 +166,81 @@ PROFESSION_SCORES = {
     'other': 0.50,              # Unknown credentials
 }
 
+# Base weights of the composite score (same as TherapistMatcher.WEIGHTS)
+COMPOSITE_WEIGHTS = {
+    'layer2_semantic': 0.60,
+    'layer3_collaborative': 0.15,
+    'specialization': 0.25,
+}
+
+
+def _compile_issue_matchers(mapping: Dict):
+    """
+    Build the keyword automaton and combined pattern regex for an issue mapping
+    
+    Each pattern becomes an optional lookahead at the start of the text, so
+    one match call reports every pattern that re.search() would find,
+    independently of the others.
+    """
+    keyword_issues: Dict[str, List[str]] = {}
+    pattern_issues: Dict[str, str] = {}
+    lookaheads = []
+    
+    for issue_type, issue_config in mapping.items():
+        # Duplicate keywords count once per listing, like the original loop
+        for keyword in issue_config['keywords']:
+            keyword_issues.setdefault(keyword, []).append(issue_type)
+        for pattern in issue_config['patterns']:
+            group = f'p{len(pattern_issues)}'
+            pattern_issues[group] = issue_type
+            lookaheads.append(rf'(?:(?=[\s\S]*?(?P<{group}>{pattern})))?')
+    
+    automaton = KeywordAutomaton(keyword_issues)
+    combined = re.compile(''.join(lookaheads))
+    return automaton, keyword_issues, combined, pattern_issues
+
+
+# Compiled once at import; rebuild if COMPREHENSIVE_ISSUE_MAPPING changes
+_ISSUE_AUTOMATON, _KEYWORD_ISSUES, _ISSUE_PATTERNS, _PATTERN_ISSUES = _compile_issue_matchers(
+    COMPREHENSIVE_ISSUE_MAPPING
+)
+
+
+def build_answer_text(answers: Dict) -> str:
+    """Lower-cased text of all answers, as scanned for issues"""
+    return ' '.join([
+        f"{a.get('answer_text', '')} {a.get('answer_option_text', '')}"
+        for a in answers.values()
+    ]).lower()
+
+
+def extract_issue_signals(text: str) -> Dict[str, Dict[str, int]]:
+    """
+    Per-issue keyword and pattern signal counts in one pass over the text
+    
+    Args:
+        text: Lower-cased text (see build_answer_text)
+    
+    Returns:
+        {issue_type: {'keywords': n, 'patterns': m}} for every issue in
+        COMPREHENSIVE_ISSUE_MAPPING, in mapping order
+    """
+    signals = {
+        issue_type: {'keywords': 0, 'patterns': 0}
+        for issue_type in COMPREHENSIVE_ISSUE_MAPPING
+    }
+    
+    for keyword in _ISSUE_AUTOMATON.find_all(text):
+        for issue_type in _KEYWORD_ISSUES[keyword]:
+            signals[issue_type]['keywords'] += 1
+    
+    match = _ISSUE_PATTERNS.match(text)
+    for group, matched in match.groupdict().items():
+        if matched is not None:
+            signals[_PATTERN_ISSUES[group]]['patterns'] += 1
+    
+    return signals
+
 
 def extract_patient_issues_enhanced(answers: Dict) -> List[str]:
     """
@@ -169,45 +252,29 @@ def extract_patient_issues_enhanced(answers: Dict) -> List[str]:
     Returns:
         List of detected issues/concerns
     """
-    issues_found = set()
-    
-    # Build full text from answers
-    all_text = ' '.join([
-        f"{a.get('answer_text', '')} {a.get('answer_option_text', '')}"
-        for a in answers.values()
-    ]).lower()
+    issues_found = []
     
-    # For each issue type, check multiple signals
-    for issue_type, issue_config in COMPREHENSIVE_ISSUE_MAPPING.items():
-        keyword_matches = 0
-        pattern_matches = 0
-        
-        # Check keywords
-        for keyword in issue_config['keywords']:
-            if keyword in all_text:
-                keyword_matches += 1
-        
-        # Check regex patterns
-        for pattern in issue_config['patterns']:
-            if re.search(pattern, all_text):
-                pattern_matches += 1
+    for issue_type, counts in extract_issue_signals(build_answer_text(answers)).items():
+        keyword_matches = counts['keywords']
+        pattern_matches = counts['patterns']
         
         # Score: multiple signals = issue detected
         total_signals = keyword_matches + pattern_matches
         
         # If 2+ signals match, include the issue
         if total_signals >= 2:
-            issues_found.add(issue_type)
+            issues_found.append(issue_type)
         # Or if 3+ keywords match
         elif keyword_matches >= 3:
-            issues_found.add(issue_type)
+            issues_found.append(issue_type)
     
-    return list(issues_found)
+    return issues_found
 
 
 def calculate_semantic_specialization_match(
     patient_issues: List[str],
-    therapist_tags: List[str]
+    therapist_tags: List[str],
+    therapist_mask: Optional[int] = None
 ) -> float:
     """
     Semantic specialization matching with synonym awareness
@@ -216,9 +283,15 @@ def calculate_semantic_specialization_match(
     - Patient has 'PTSD' but therapist specializes in 'trauma' → should match
     - Patient needs 'couples therapy' and therapist does 'relationship counseling' → should match
     
+    An issue matches when it equals, contains or is contained in one of
+    the tags, or when it shares a synonym category with any tag (a bitset
+    intersection against SPECIALIZATION_INDEX).
+    
     Args:
         patient_issues: List of detected patient issues
         therapist_tags: List of therapist specialization tags from TherapistProfile
+        therapist_mask: Pre-computed category mask of the tags
+            (see therapist_specialization_masks)
     
     Returns:
         Match score between 0.0 and 1.0
@@ -230,40 +303,25 @@ def calculate_semantic_specialization_match(
     if not patient_issues:
         return 0.5  # Neutral score if no issues detected
     
-    matches = 0
+    tags_lower = [tag.lower() for tag in therapist_tags]
+    if therapist_mask is None:
+        therapist_mask = SPECIALIZATION_INDEX.tags_mask(tags_lower)
+    
     matched_issues = set()
     
     for issue in patient_issues:
+        if issue in matched_issues:
+            continue
         issue_lower = issue.lower()
         
-        for tag in therapist_tags:
-            tag_lower = tag.lower()
-            
-            # Exact match (case-insensitive)
-            if issue_lower == tag_lower:
-                if issue not in matched_issues:
-                    matches += 1
-                    matched_issues.add(issue)
-                break
-            
-            # Substring match (issue in tag or tag in issue)
-            if issue_lower in tag_lower or tag_lower in issue_lower:
-                if issue not in matched_issues:
-                    matches += 1
-                    matched_issues.add(issue)
-                break
-            
-            # Semantic synonym matching
-            for category, synonyms in SPECIALIZATION_SYNONYMS.items():
-                issue_in_synonyms = any(syn in issue_lower for syn in synonyms)
-                tag_in_synonyms = any(syn in tag_lower for syn in synonyms)
-                
-                # If both issue and tag match the same category
-                if issue_in_synonyms and tag_in_synonyms:
-                    if issue not in matched_issues:
-                        matches += 1
-                        matched_issues.add(issue)
-                    break
+        # Semantic synonym matching: issue and some tag share a category
+        if SPECIALIZATION_INDEX.term_mask(issue_lower) & therapist_mask:
+            matched_issues.add(issue)
+        # Exact or substring match (issue in tag or tag in issue)
+        elif any(issue_lower in tag or tag in issue_lower for tag in tags_lower):
+            matched_issues.add(issue)
+    
+    matches = len(matched_issues)
     
     # Calculate match percentage
     max_possible = max(len(patient_issues), len(therapist_tags))
@@ -273,6 +331,51 @@ def calculate_semantic_specialization_match(
     return min(1.0, score * 1.2)
 
 
+def specialization_mask_cache_key(therapist_id: int) -> str:
+    """Cache key of a therapist's tag category mask (therapist = User id)"""
+    return f'matching:specialization:{therapist_id}'
+
+
+def refresh_therapist_specialization_mask(therapist_id: int, tags) -> int:
+    """Compute a therapist's tag mask and store it in the cache"""
+    tags = [tag.lower() for tag in tags] if isinstance(tags, list) else []
+    mask = SPECIALIZATION_INDEX.tags_mask(tags)
+    cache.set(specialization_mask_cache_key(therapist_id), (tags, mask), None)
+    return mask
+
+
+def therapist_specialization_masks(therapists) -> Dict[int, int]:
+    """
+    Tag category masks for many therapists
+    
+    Masks are written when specialization_tags are saved; a missing or
+    outdated cache entry is recomputed here.
+    
+    Args:
+        therapists: User objects with therapist_profile loaded
+    
+    Returns:
+        {therapist_id: mask}
+    """
+    tags_by_id = {}
+    for therapist in therapists:
+        profile = getattr(therapist, 'therapist_profile', None)
+        tags = profile.specialization_tags if profile else None
+        tags_by_id[therapist.id] = [tag.lower() for tag in tags] if isinstance(tags, list) else []
+    
+    keys = {therapist_id: specialization_mask_cache_key(therapist_id) for therapist_id in tags_by_id}
+    cached = cache.get_many(list(keys.values()))
+    
+    masks = {}
+    for therapist_id, tags in tags_by_id.items():
+        entry = cached.get(keys[therapist_id])
+        if entry is not None and entry[0] == tags:
+            masks[therapist_id] = entry[1]
+        else:
+            masks[therapist_id] = refresh_therapist_specialization_mask(therapist_id, tags)
+    return masks
+
+
 def extract_therapeutic_sections(text: str) -> List[str]:
     """
     Extract only meaningful therapeutic content from blog posts
@@ -285,6 +388,19 @@ def extract_therapeutic_sections(text: str) -> List[str]:
     Returns:
         List of therapeutic sections, sorted by relevance
     """
+    return [para for para, _ in score_therapeutic_sections(text)]
+
+
+def score_therapeutic_sections(text: str) -> List[tuple]:
+    """
+    Therapeutic sections of a blog post with their relevance scores
+    
+    Args:
+        text: Full blog post content
+    
+    Returns:
+        Up to 10 (paragraph, score) pairs, most relevant first
+    """
     # Split into paragraphs
     paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
     
@@ -320,7 +436,7 @@ def extract_therapeutic_sections(text: str) -> List[str]:
     
     # Sort by relevance score (descending) and return top paragraphs
     scored_paragraphs.sort(key=lambda x: x[1], reverse=True)
-    return [para for para, _ in scored_paragraphs[:10]]
+    return scored_paragraphs[:10]
 
 
 def get_profession_quality_score(profession_type: str) -> float:
@@ -347,41 +463,73 @@ def calculate_therapist_activity_score(therapist_user) -> float:
     Args:
         therapist_user: User object with therapist_profile relation
     
+    Returns:
+        Activity score between 0.0 and 1.0
+    """
+    return calculate_therapist_activity_scores([therapist_user])[therapist_user.id]
+
+
+def calculate_therapist_activity_scores(therapists, blog_stats: Dict = None) -> Dict[int, float]:
+    """
+    Activity scores for many therapists with a single blog query
+    
+    Args:
+        therapists: User objects
+        blog_stats: Optional {therapist_id: (blog_count, latest_published_at)}
+            from quality_scorer.fetch_blog_stats, to share one query
+    
+    Returns:
+        {therapist_id: activity score}
+    """
+    from .quality_scorer import fetch_blog_stats
+    
+    therapists = list(therapists)
+    
+    if blog_stats is None:
+        try:
+            blog_stats = fetch_blog_stats([therapist.id for therapist in therapists])
+        except Exception as e:
+            logger.warning(f"Error calculating therapist activity score: {e}")
+            return {therapist.id: 0.5 for therapist in therapists}
+    
+    return {
+        therapist.id: activity_score_from_stats(*blog_stats.get(therapist.id, (0, None)))
+        for therapist in therapists
+    }
+
+
+def activity_score_from_stats(blog_count: int, latest_published_at) -> float:
+    """
+    Activity score from published blog count and latest publish date
+    
+    Args:
+        blog_count: Number of published posts
+        latest_published_at: Most recent published_at (None if unknown)
+    
     Returns:
         Activity score between 0.0 and 1.0
     """
     from django.utils import timezone
-    from datetime import timedelta
     
-    try:
-        blogs = therapist_user.blog_posts.filter(status='published')
-        
-        if not blogs.exists():
-            return 0.2  # Inactive
-        
-        # Get latest blog post
-        latest = blogs.order_by('-published_at').first()
-        
-        if not latest:
-            return 0.2
-        
-        days_ago = (timezone.now() - latest.published_at).days
-        
-        # Score based on recency
-        if days_ago < 30:
-            return 1.0  # Very active
-        elif days_ago < 90:
-            return 0.8
-        elif days_ago < 180:
-            return 0.5
-        elif days_ago < 365:
-            return 0.3
-        else:
-            return 0.1  # Inactive
+    if not blog_count:
+        return 0.2  # Inactive
+    
+    if latest_published_at is None:
+        return 0.5  # Published posts without a date
     
-    except Exception as e:
-        logger.warning(f"Error calculating therapist activity score: {e}")
+    days_ago = (timezone.now() - latest_published_at).days
+    
+    # Score based on recency
+    if days_ago < 30:
+        return 1.0  # Very active
+    elif days_ago < 90:
+        return 0.8
+    elif days_ago < 180:
         return 0.5
+    elif days_ago < 365:
+        return 0.3
+    else:
+        return 0.1  # Inactive
 
 
 def calculate_verification_bonus(therapist_profile) -> float:
@@ -416,6 +564,7 @@ def calculate_composite_score(
     spec_score: float,
     therapist_activity: float,
     survey_completion: float,
+    weights: Optional[Dict[str, float]] = None,
 ) -> float:
     """
     Calculate composite final score with confidence and activity bonuses
@@ -426,15 +575,18 @@ def calculate_composite_score(
         spec_score: Specialization matching score (0-1)
         therapist_activity: Activity score (0-1)
         survey_completion: Survey completion percentage (0-1)
+        weights: Base weights per layer (default: COMPOSITE_WEIGHTS)
     
     Returns:
         Final composite score between 0.0 and 1.0
     """
+    weights = weights or COMPOSITE_WEIGHTS
+    
     # Base weighted score
     base_score = (
-        0.60 * layer2_score +
-        0.15 * layer3_score +
-        0.25 * spec_score
+        weights['layer2_semantic'] * layer2_score +
+        weights['layer3_collaborative'] * layer3_score +
+        weights['specialization'] * spec_score
     )
     
     # Confidence boost: if all scores agree, boost the result
@@ -0,0 +1,253 @@
+"""
+Matching Instrumentation
+Wall time, SQL queries, encoder calls and memory per matching stage
+
+A MatchingInstrumentation is passed to TherapistMatcher (or activated
+around any matching code) and collects, per named stage:
+
+- wall time (summed when a stage runs more than once, e.g. per therapist)
+- SQL queries, counted with a connection execute wrapper
+- encoder calls and encoded texts (reported by algorithm.encode_texts)
+- optionally the tracemalloc peak above the stage's starting memory
+
+Without an instrumentation object the matcher pays for nothing but a
+null context per stage. Sampled production requests are persisted as
+MatchingLog rows (save_matching_log) and summarised into rolling
+percentiles for the ops stats endpoint (summarize_matching_logs).
+"""
+
+import logging
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Stages in pipeline order (TherapistMatcher uses all of them)
+STAGES = ('preferences', 'layer1', 'layer2', 'layer3', 'spec', 'composite', 'reasons')
+
+_ACTIVE: ContextVar[Optional['MatchingInstrumentation']] = ContextVar('matching_instrumentation', default=None)
+
+NO_STAGE = nullcontext()
+
+
+@dataclass
+class StageStats:
+    wall_ms: float = 0.0
+    queries: int = 0
+    encoder_calls: int = 0
+    encoded_texts: int = 0
+    peak_kb: Optional[float] = None
+
+
+class MatchingInstrumentation:
+    """
+    Per-stage counters for one matching request
+
+    Usage:
+        instrumentation = MatchingInstrumentation()
+        with instrumentation.activate():
+            matcher = TherapistMatcher(response, instrumentation=instrumentation)
+            matcher.find_best_matches()
+        instrumentation.as_dict()
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, StageStats] = {}
+        self.total = StageStats()
+        self._current: Optional[StageStats] = None
+
+    @contextmanager
+    def activate(self) -> Iterator['MatchingInstrumentation']:
+        """Count queries and encoder calls made inside the block"""
+        if _ACTIVE.get() is self:
+            # Already active further up the stack (e.g. a benchmark around a matcher)
+            yield self
+            return
+
+        token = _ACTIVE.set(self)
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._count_query):
+                yield self
+        finally:
+            self.total.wall_ms += (time.perf_counter() - start) * 1000
+            if started_tracing:
+                tracemalloc.stop()
+            _ACTIVE.reset(token)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """Attribute everything inside the block to stage ``name``"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+
+        outer = self._current
+        self._current = stats
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall_ms += (time.perf_counter() - start) * 1000
+            if tracing:
+                peak_kb = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+                stats.peak_kb = max(stats.peak_kb or 0.0, peak_kb)
+            self._current = outer
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.total.queries += 1
+        if self._current is not None:
+            self._current.queries += 1
+        return execute(sql, params, many, context)
+
+    def record_encode(self, text_count: int) -> None:
+        for stats in (self.total, self._current):
+            if stats is not None:
+                stats.encoder_calls += 1
+                stats.encoded_texts += text_count
+
+    def as_dict(self) -> Dict:
+        """JSON-serialisable summary (stored in MatchingLog / benchmark output)"""
+        return {
+            'total': asdict(self.total),
+            'stages': {name: asdict(stats) for name, stats in self.stages.items()},
+        }
+
+
+def sampled_instrumentation() -> Optional[MatchingInstrumentation]:
+    """A new instrumentation for MATCHING_LOG_SAMPLE_RATE of requests, else None"""
+    rate = getattr(settings, 'MATCHING_LOG_SAMPLE_RATE', 1.0)
+    if rate <= 0 or random.random() >= rate:
+        return None
+    return MatchingInstrumentation()
+
+
+def activated(instrumentation: Optional[MatchingInstrumentation]):
+    """``instrumentation.activate()``, or a null context for None"""
+    return instrumentation.activate() if instrumentation is not None else NO_STAGE
+
+
+def current_instrumentation() -> Optional[MatchingInstrumentation]:
+    """The instrumentation activated in this context, if any"""
+    return _ACTIVE.get()
+
+
+def record_encoder_call(text_count: int) -> None:
+    """Report one encoder call to the active instrumentation"""
+    instrumentation = _ACTIVE.get()
+    if instrumentation is not None:
+        instrumentation.record_encode(text_count)
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    """p50 / p95 / p99 / mean / max of a sample"""
+    values = np.asarray(list(values), dtype=np.float64)
+    if values.size == 0:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'mean': 0.0, 'max': 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'mean': round(float(values.mean()), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def summarize_samples(samples: List[Dict], memory_sample: Optional[Dict] = None) -> Dict:
+    """Aggregate MatchingInstrumentation.as_dict() samples of one matcher"""
+    stage_names = []
+    for sample in samples:
+        for name in sample['stages']:
+            if name not in stage_names:
+                stage_names.append(name)
+
+    stages = {}
+    for name in stage_names:
+        rows = [sample['stages'].get(name) for sample in samples]
+        rows = [row for row in rows if row is not None]
+        stages[name] = {
+            'wall_ms': summarize(row['wall_ms'] for row in rows),
+            'queries': summarize(row['queries'] for row in rows),
+            'encoder_calls': summarize(row['encoder_calls'] for row in rows),
+        }
+        if memory_sample and name in memory_sample['stages']:
+            stages[name]['peak_memory_kb'] = round(memory_sample['stages'][name]['peak_kb'] or 0.0, 1)
+
+    summary = {
+        'requests': len(samples),
+        'latency_ms': summarize(sample['total']['wall_ms'] for sample in samples),
+        'queries': summarize(sample['total']['queries'] for sample in samples),
+        'encoder_calls': summarize(sample['total']['encoder_calls'] for sample in samples),
+        'stages': stages,
+    }
+    if memory_sample:
+        peaks = [stage['peak_kb'] or 0.0 for stage in memory_sample['stages'].values()]
+        summary['peak_memory_kb'] = round(max(peaks, default=0.0), 1)
+    return summary
+
+
+def save_matching_log(
+    instrumentation: MatchingInstrumentation,
+    matcher: str,
+    patient=None,
+    eligible_count: int = 0,
+    matches_count: int = 0,
+    filters: Optional[Dict] = None,
+) -> None:
+    """Persist one instrumented request as a MatchingLog (never raises)"""
+    from .models import MatchingLog
+
+    try:
+        with transaction.atomic():
+            MatchingLog.objects.create(
+                patient=patient,
+                matcher=matcher,
+                eligible_therapists_count=eligible_count,
+                matches_generated=matches_count,
+                processing_time_ms=int(round(instrumentation.total.wall_ms)),
+                query_count=instrumentation.total.queries,
+                encoder_calls=instrumentation.total.encoder_calls,
+                filters_applied=filters or {},
+                stage_timings=instrumentation.as_dict()['stages'],
+            )
+    except Exception as e:
+        logger.warning(f"[MATCHING] Could not write matching log: {e}")
+
+
+def summarize_matching_logs(rows: Iterable[Dict]) -> Dict[str, Dict]:
+    """
+    Rolling percentiles per matcher from MatchingLog rows
+
+    ``rows`` are dicts with matcher, processing_time_ms, query_count,
+    encoder_calls and stage_timings (a ``.values()`` queryset).
+    """
+    samples: Dict[str, List[Dict]] = {}
+    for row in rows:
+        samples.setdefault(row['matcher'], []).append({
+            'total': {
+                'wall_ms': row['processing_time_ms'],
+                'queries': row['query_count'],
+                'encoder_calls': row['encoder_calls'],
+            },
+            'stages': row['stage_timings'] or {},
+        })
+    return {matcher: summarize_samples(matcher_samples) for matcher, matcher_samples in samples.items()}
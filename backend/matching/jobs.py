@@ -0,0 +1,291 @@
+"""
+Matching Jobs
+Run the therapist matcher outside the HTTP request
+
+find_matches / rematch can record a MatchJob and return immediately; the
+job is then claimed and executed by dedicated worker processes
+(`python manage.py run_match_jobs`, MATCHING_JOB_RUNNER = 'worker', the
+default) or, in development, by a small thread pool inside the web
+process (MATCHING_JOB_RUNNER = 'thread'). The thread runner puts the ML
+work back on the web workers' CPU and memory, so it logs a warning when
+used with DEBUG off. Claiming is an atomic status update, so any number
+of runners can share the queue.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import MatchJob, TherapistMatch
+from .instrumentation import NO_STAGE, activated, sampled_instrumentation, save_matching_log
+from .result_cache import MatchInputs, matching_inputs, match_is_current, get_cached_matches, cache_matches
+
+logger = logging.getLogger(__name__)
+
+
+def run_matching(
+    survey_response,
+    match: Optional[TherapistMatch] = None,
+    top_n: int = 3,
+    inputs: Optional[MatchInputs] = None,
+    latency_budget_ms: Optional[float] = None,
+) -> Tuple[Optional[TherapistMatch], List[Dict]]:
+    """
+    Run the matcher for a survey response and save the top matches
+
+    Creates a TherapistMatch, or updates ``match`` in place for a rematch.
+    Identical answers against an unchanged therapist pool reuse a cached
+    ranking, and a rematch whose inputs have not changed is left as is
+    while its results are still cached (see matching.result_cache);
+    once they expire the match is recomputed so callers get results.
+
+    With a latency budget the matcher may fall back to cheaper Layer 2
+    signals; such a match is saved as degraded, kept out of the result
+    cache and upgraded by a 'rematch' job running without a budget.
+
+    Returns:
+        (saved match, ranked results with reasons and breakdown), or
+        (None, []) when no therapist passed the hard rules
+    """
+    if inputs is None:
+        inputs = matching_inputs(survey_response)
+
+    cached = get_cached_matches(inputs, top_n, exclude_id=survey_response.patient_id)
+
+    if match is not None and cached is not None and match_is_current(match, inputs):
+        return match, cached[1]
+
+    degraded = False
+    if cached is not None:
+        ranked, match_results = cached
+    else:
+        ranked, match_results, degraded = _compute_matches(survey_response, inputs, top_n, latency_budget_ms)
+        if not ranked:
+            return None, []
+        if not degraded:
+            cache_matches(inputs, top_n, ranked, match_results)
+
+    match_data = {
+        'survey_fingerprint': inputs.fingerprint,
+        'pool_version': inputs.pool_version,
+        'degraded': degraded,
+    }
+    for i, (therapist, score) in enumerate(ranked, 1):
+        match_data[f'top_match_{i}'] = therapist
+        match_data[f'top_match_{i}_score'] = score
+
+    if match is None:
+        match = TherapistMatch.objects.create(
+            patient=survey_response.patient,
+            survey_response=survey_response,
+            **match_data
+        )
+    else:
+        for field, value in match_data.items():
+            setattr(match, field, value)
+        match.save()
+
+    if degraded:
+        # Full computation off the request path; match_is_current() is False until then
+        enqueue_match_job(survey_response, kind='rematch', match=match)
+
+    return match, match_results
+
+
+def match_result_entry(matcher, rank: int, therapist, score: float, breakdown: Dict) -> Dict:
+    """One ranked therapist as returned by the API (scores in percent)"""
+    return {
+        'rank': rank,
+        'therapist_id': therapist.id,
+        'therapist_name': therapist.full_name,
+        'score': round(score * 100, 1),  # Convert to percentage
+        'reasons': matcher.generate_match_reasons(therapist, breakdown),
+        'breakdown': {
+            'semantic_score': round(breakdown['layer2_semantic']['score'] * 100, 1),
+            'collaborative_score': round(breakdown['layer3_collaborative']['score'] * 100, 1),
+            'specialization_score': round(breakdown['specialization_score'] * 100, 1),
+        },
+        'degraded': breakdown.get('degraded', False),
+    }
+
+
+def _compute_matches(
+    survey_response,
+    inputs: MatchInputs,
+    top_n: int,
+    latency_budget_ms: Optional[float] = None,
+) -> Tuple[List, List[Dict], bool]:
+    """
+    Run the matcher; sampled runs are logged with per-stage timings (MatchingLog)
+
+    Returns (ranked, match results, degraded).
+    """
+    from .algorithm import TherapistMatcher
+    from .patient_features import get_patient_features
+
+    instrumentation = sampled_instrumentation()
+    ranked = []
+    match_results = []
+
+    with activated(instrumentation):
+        # Text, embedding, preferences and issues stored at submission, if current
+        with instrumentation.stage('preferences') if instrumentation is not None else NO_STAGE:
+            features = get_patient_features(survey_response, inputs.fingerprint)
+        matcher = TherapistMatcher(
+            survey_response,
+            answers=inputs.answers,
+            instrumentation=instrumentation,
+            features=features,
+            latency_budget_ms=latency_budget_ms,
+        )
+        top_matches = matcher.find_best_matches(top_n=top_n)
+
+        for i, (therapist, score, breakdown) in enumerate(top_matches, 1):
+            ranked.append((therapist, score))
+            match_results.append(match_result_entry(matcher, i, therapist, score, breakdown))
+
+    if instrumentation is not None:
+        save_matching_log(
+            instrumentation,
+            'therapist_matcher',
+            patient=survey_response.patient,
+            eligible_count=matcher.eligible_count,
+            matches_count=len(ranked),
+            filters=matcher.preferences,
+        )
+
+    return ranked, match_results, matcher.degraded
+
+
+# ----------------------------------------------------------------------
+# Queue
+# ----------------------------------------------------------------------
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            if not settings.DEBUG:
+                logger.warning(
+                    "[MATCHING] MATCHING_JOB_RUNNER = 'thread' runs matching jobs inside the web "
+                    "process; it is meant for development, use 'worker' with run_match_jobs"
+                )
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MATCHING_JOB_THREADS', 2),
+                thread_name_prefix='match-job',
+            )
+        return _EXECUTOR
+
+
+def _run_in_thread(job_id) -> None:
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def enqueue_match_job(survey_response, kind: str = 'find', match: Optional[TherapistMatch] = None) -> MatchJob:
+    """Record a pending job; with the thread runner it starts after commit"""
+    job = MatchJob.objects.create(
+        patient=survey_response.patient,
+        survey_response=survey_response,
+        kind=kind,
+        match=match,
+    )
+
+    if getattr(settings, 'MATCHING_JOB_RUNNER', 'worker') == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.id))
+
+    return job
+
+
+def claim_job(job_id) -> bool:
+    """Atomically move a pending job to running; False if someone else got it"""
+    return MatchJob.objects.filter(id=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now(),
+    ) == 1
+
+
+def claim_next_job() -> Optional[MatchJob]:
+    """Claim the oldest pending job, if any"""
+    while True:
+        job_id = MatchJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        if claim_job(job_id):
+            return MatchJob.objects.select_related('survey_response', 'match').get(id=job_id)
+
+
+def execute_job(job: MatchJob) -> MatchJob:
+    """Run a claimed job and store its outcome"""
+    if job.kind == 'features':
+        return _execute_features_job(job)
+
+    try:
+        match = job.match
+        if match is None:
+            # A survey response has at most one match record
+            match = TherapistMatch.objects.filter(survey_response=job.survey_response).first()
+        if job.kind == 'find' and match is not None:
+            job.match, job.results = match, []
+        else:
+            job.match, job.results = run_matching(job.survey_response, match=match)
+
+        if job.match is None:
+            job.status = 'failed'
+            job.error = 'No matching therapists found'
+        else:
+            job.status = 'completed'
+    except Exception as e:
+        logger.exception(f"[MATCHING] Job {job.id} failed")
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['match', 'results', 'status', 'error', 'finished_at'])
+    return job
+
+
+def _execute_features_job(job: MatchJob) -> MatchJob:
+    """Pre-compute the patient features of a submitted response"""
+    from .patient_features import compute_patient_features
+
+    try:
+        compute_patient_features(job.survey_response)
+        job.status = 'completed'
+    except Exception as e:
+        logger.exception(f"[MATCHING] Features job {job.id} failed")
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def run_job(job_id) -> Optional[MatchJob]:
+    """Claim and execute one job by id (no-op if already taken)"""
+    if not claim_job(job_id):
+        return None
+    job = MatchJob.objects.select_related('survey_response', 'match').get(id=job_id)
+    return execute_job(job)
+
+
+def requeue_stale_jobs(older_than_seconds: int) -> int:
+    """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    return MatchJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='pending',
+        started_at=None,
+    )
@@ -0,0 +1,93 @@
+"""
+Keyword Automaton
+Aho-Corasick multi-pattern substring search
+
+Finds which of many keywords occur anywhere in a text in a single pass,
+with the same result as running ``keyword in text`` for every keyword.
+Used by improved_matching to detect patient issues without one substring
+scan per keyword.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of keywords
+
+    Build once (e.g. at import time) and reuse for every text. Matching is
+    case-sensitive; lower-case both keywords and text for case-insensitive
+    search.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # Unique, non-empty keywords in first-seen order
+        self.keywords: List[str] = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            self._add(keyword, keyword_id)
+        self._build_failure_links()
+
+    def _add(self, keyword: str, keyword_id: int) -> None:
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] = self._output[node] + (keyword_id,)
+
+    def _build_failure_links(self) -> None:
+        """Breadth-first pass linking each node to its longest proper suffix"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                suffix = self._goto[fallback].get(char, 0)
+
+                self._fail[child] = suffix if suffix != child else 0
+                # A node also reports every keyword ending at its suffix
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (end_index, keyword_id) for every occurrence in ``text``"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword_id in output[node]:
+                yield index, keyword_id
+
+    def find_all(self, text: str) -> Set[str]:
+        """Set of keywords that occur at least once in ``text``"""
+        found: Set[int] = set()
+        remaining = len(self.keywords)
+
+        for _, keyword_id in self.iter_matches(text):
+            if keyword_id not in found:
+                found.add(keyword_id)
+                remaining -= 1
+                if not remaining:
+                    break
+
+        return {self.keywords[keyword_id] for keyword_id in found}
@@ -0,0 +1,95 @@
+# matching/management/commands/benchmark_matching.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.benchmarks.runner import benchmark_database, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the matchers on synthetic therapist pools (runs on a throwaway test database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma-separated therapist pool sizes'
+        )
+        parser.add_argument('--requests', type=int, default=20, help='Match requests measured per pool')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--top-n', type=int, default=3, help='Matches returned per request')
+        parser.add_argument(
+            '--candidates',
+            type=int,
+            default=0,
+            help='ANN candidates scored per request (0 scores the whole pool)'
+        )
+        parser.add_argument('--skip-engine', action='store_true', help='Do not benchmark MatchingEngine')
+        parser.add_argument('--label', default='', help='Name stored in the report (e.g. a git revision)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to check for regressions')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=1.25,
+            help='Allowed p95 latency growth factor against the baseline'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+
+        with benchmark_database():
+            report = run_benchmark(
+                sizes,
+                requests=options['requests'],
+                seed=options['seed'],
+                top_n=options['top_n'],
+                candidate_k=options['candidates'],
+                include_engine=not options['skip_engine'],
+                label=options['label'],
+                log=self.stdout.write,
+            )
+
+        self._print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare_reports(baseline, report, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(self.style.ERROR(f'❌ {regression}'))
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS('✅ No regressions against the baseline'))
+
+    def _print_report(self, report):
+        if not report['embeddings_available']:
+            self.stdout.write(self.style.WARNING('⚠️ sentence-transformers not installed, Layer 2 is not exercised'))
+
+        for run in report['runs']:
+            name = f"{run['matcher']} ({run['mode']}) @ {run['pool_size']}"
+            if 'skipped' in run:
+                self.stdout.write(self.style.WARNING(f"{name}: skipped ({run['skipped']})"))
+                continue
+
+            latency = run['latency_ms']
+            self.stdout.write(
+                f"{name}: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+                f"{run['queries']['max']:g} queries, peak {run.get('peak_memory_kb', 0):.0f} KB"
+            )
+            for stage, stats in run['stages'].items():
+                self.stdout.write(
+                    f"    {stage:<12} p50 {stats['wall_ms']['p50']:8.2f} ms  p95 {stats['wall_ms']['p95']:8.2f} ms  "
+                    f"{stats['queries']['max']:4g} queries  {stats.get('peak_memory_kb', 0):8.0f} KB"
+                )
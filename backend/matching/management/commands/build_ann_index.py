@@ -0,0 +1,36 @@
+# matching/management/commands/build_ann_index.py
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from matching.ann_index import get_ann_index, therapist_vectors
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Build the ANN candidate index from stored bio and blog-section embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clusters',
+            type=int,
+            default=None,
+            help='Number of IVF clusters (default: square root of the vector count)'
+        )
+
+    def handle(self, *args, **options):
+        therapist_ids = list(
+            User.objects.filter(role='therapist', is_active=True).values_list('id', flat=True)
+        )
+        keys, owners, kinds, vectors = therapist_vectors(therapist_ids)
+
+        index = get_ann_index()
+        index.build(keys, owners, kinds, vectors, n_clusters=options['clusters'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ ANN index built: {len(keys)} vectors for {len(set(owners))} therapists, '
+                f'{index.centroids.shape[0]} clusters'
+            )
+        )
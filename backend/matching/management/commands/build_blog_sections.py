@@ -0,0 +1,65 @@
+# matching/management/commands/build_blog_sections.py
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blogs.models import BlogPost
+from matching.algorithm import EMBEDDINGS_AVAILABLE, encode_texts
+from matching.blog_sections import refresh_post_sections
+
+
+def _refresh_batch(post_ids, encoder):
+    """Worker: rebuild the sections of one batch of posts"""
+    try:
+        posts = BlogPost.objects.filter(id__in=post_ids)
+        return refresh_post_sections(posts, encoder)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Extract, score and embed therapeutic sections of published blog posts for matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Number of posts processed (and encoded together) per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of batches processed in parallel'
+        )
+
+    def handle(self, *args, **options):
+        encoder = encode_texts if EMBEDDINGS_AVAILABLE else None
+        if encoder is None:
+            self.stdout.write(self.style.WARNING(
+                '⚠️ sentence-transformers is not installed, storing sections without embeddings'
+            ))
+
+        post_ids = list(
+            BlogPost.objects.filter(status='published', author__role='therapist')
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        batch_size = max(1, options['batch_size'])
+        batches = [post_ids[start:start + batch_size] for start in range(0, len(post_ids), batch_size)]
+
+        refreshed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = [executor.submit(_refresh_batch, batch, encoder) for batch in batches]
+            for done, future in enumerate(as_completed(futures), 1):
+                refreshed += future.result()
+                self.stdout.write(f'  batch {done}/{len(batches)} done')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Blog sections up to date: {len(post_ids)} posts checked, {refreshed} rebuilt'
+            )
+        )
@@ -0,0 +1,53 @@
+# matching/management/commands/build_embedding_store.py
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from matching.algorithm import EMBEDDINGS_AVAILABLE, encode_texts
+from matching.embedding_store import get_embedding_store, bio_key
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Encode therapist bios into the matching embedding store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Number of texts encoded per model call'
+        )
+
+    def handle(self, *args, **options):
+        if not EMBEDDINGS_AVAILABLE:
+            self.stderr.write(self.style.ERROR('sentence-transformers is not installed'))
+            return
+
+        store = get_embedding_store()
+        items = []
+
+        therapists = User.objects.filter(
+            role='therapist',
+            is_active=True
+        ).select_related('therapist_profile')
+
+        for therapist in therapists:
+            profile = getattr(therapist, 'therapist_profile', None)
+            if profile and profile.bio:
+                items.append((bio_key(therapist.id), profile.bio))
+
+        # Blog sections are stored in BlogSection (see build_blog_sections)
+
+        batch_size = options['batch_size']
+        encoded = 0
+        for start in range(0, len(items), batch_size):
+            encoded += store.ensure(items[start:start + batch_size], encode_texts)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Embedding store up to date: {len(items)} texts checked, {encoded} encoded, '
+                f'{len(store)} vectors stored'
+            )
+        )
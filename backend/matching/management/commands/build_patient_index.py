@@ -0,0 +1,23 @@
+# matching/management/commands/build_patient_index.py
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from matching.patient_index import get_patient_index
+
+
+class Command(BaseCommand):
+    help = 'Build the similar-patient index from survey embeddings and appointment outcomes'
+
+    def handle(self, *args, **options):
+        index = get_patient_index()
+        patients = index.build()
+
+        size_kb = os.path.getsize(os.path.join(index.directory, index.DATA_FILE)) / 1024
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Similar-patient index built: {patients} patients, '
+                f'{len(index.therapist_ids)} therapist outcomes ({size_kb:.1f} KB)'
+            )
+        )
@@ -0,0 +1,23 @@
+# matching/management/commands/build_tfidf_model.py
+
+from django.core.management.base import BaseCommand
+
+from matching.tfidf_model import get_tfidf_model, refit_tfidf_model
+
+
+class Command(BaseCommand):
+    help = 'Fit the persisted TF-IDF model over every completed therapist profile'
+
+    def handle(self, *args, **options):
+        documents = refit_tfidf_model()
+        model = get_tfidf_model()
+
+        if not model.vocabulary:
+            self.stdout.write(self.style.WARNING(f'⚠️ No vocabulary fitted from {documents} therapist documents'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ TF-IDF model fitted: {documents} therapist documents, {len(model.vocabulary)} terms'
+            )
+        )
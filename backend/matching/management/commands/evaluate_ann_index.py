@@ -0,0 +1,68 @@
+# matching/management/commands/evaluate_ann_index.py
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from matching.ann_index import get_ann_index
+from surveys.models import SurveyResponse
+
+
+class Command(BaseCommand):
+    help = 'Report recall@K of the ANN candidate index against exhaustive search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=50, help='Candidates retrieved per query')
+        parser.add_argument('--nprobe', type=int, default=8, help='Clusters probed per query')
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=100,
+            help='Number of recent survey responses used as queries'
+        )
+
+    def handle(self, *args, **options):
+        from matching.algorithm import TherapistMatcher
+
+        index = get_ann_index()
+        if not len(index):
+            self.stderr.write(self.style.ERROR('ANN index is empty, run build_ann_index first'))
+            return
+
+        queries = []
+        responses = SurveyResponse.objects.filter(status='submitted').order_by('-id')[:options['queries']]
+        for response in responses:
+            embedding = TherapistMatcher(response).patient_embedding
+            if embedding is not None:
+                queries.append(embedding)
+
+        if not queries:
+            # No encodable patients: probe with noisy copies of indexed vectors
+            rng = np.random.default_rng(0)
+            rows = rng.choice(len(index), min(options['queries'], len(index)), replace=False)
+            base = index.vectors[rows]
+            queries = list(base + rng.normal(scale=0.1, size=base.shape).astype(np.float32))
+            self.stdout.write(self.style.WARNING('⚠️ No patient embeddings available, using synthetic queries'))
+
+        queries = np.stack(queries)
+        k, nprobe = options['k'], options['nprobe']
+
+        recall = index.recall_at_k(queries, k, nprobe)
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, k, nprobe)
+        ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        for query in queries:
+            index.exhaustive_search(query, k)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ recall@{k} = {recall:.3f} over {len(queries)} queries (nprobe={nprobe}); '
+                f'{ann_ms:.2f} ms/query vs {exact_ms:.2f} ms exhaustive'
+            )
+        )
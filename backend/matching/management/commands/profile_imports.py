@@ -0,0 +1,114 @@
+# matching/management/commands/profile_imports.py
+
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: what a worker does before its first request
+STARTUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = (time.perf_counter() - start) * 1000
+import sys
+print(json.dumps({'total_ms': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+def parse_importtime(stderr: str):
+    """(module, self ms, cumulative ms) for each line of ``python -X importtime``"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+        except ValueError:
+            continue
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Profile the import cost of starting Django and loading the URLconf; fail over the startup budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=getattr(settings, 'STARTUP_IMPORT_BUDGET_MS', None),
+            help='Fail when startup takes longer (default: STARTUP_IMPORT_BUDGET_MS)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Fresh interpreters to time; the fastest run is reported'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Slowest individual imports to list'
+        )
+
+    def handle(self, *args, **options):
+        runs = [self._profile_once() for _ in range(max(1, options['repeat']))]
+        total_ms, rows, modules = min(runs, key=lambda run: run[0])
+
+        apps = {app.split('.')[0] for app in settings.INSTALLED_APPS}
+        per_package = defaultdict(float)
+        for name, self_ms, _ in rows:
+            per_package[name.split('.')[0]] += self_ms
+
+        self.stdout.write(f'Startup (django.setup() + URLconf): {total_ms:.0f} ms')
+        self.stdout.write('\nImport time per package (self time, * = installed app):')
+        for package, self_ms in sorted(per_package.items(), key=lambda item: -item[1])[:options['top']]:
+            marker = '*' if package in apps else ' '
+            self.stdout.write(f'  {marker} {package:<28} {self_ms:8.1f} ms')
+
+        self.stdout.write('\nSlowest imports (cumulative):')
+        for name, _, cumulative_ms in sorted(rows, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'    {name:<50} {cumulative_ms:8.1f} ms')
+
+        forbidden = [
+            name for name in getattr(settings, 'STARTUP_FORBIDDEN_IMPORTS', [])
+            if name in modules
+        ]
+        if forbidden:
+            raise CommandError(
+                f"Imported at startup but should load lazily: {', '.join(forbidden)} "
+                f"(see backend.lazy_imports)"
+            )
+
+        budget_ms = options['budget_ms']
+        if budget_ms is not None and total_ms > budget_ms:
+            raise CommandError(f'Startup took {total_ms:.0f} ms, over the {budget_ms:.0f} ms budget')
+
+        budget = f' (budget {budget_ms:.0f} ms)' if budget_ms is not None else ''
+        self.stdout.write(self.style.SUCCESS(f'✅ Startup in {total_ms:.0f} ms{budget}'))
+
+    def _profile_once(self):
+        """(total ms, importtime rows, loaded module names) of one fresh interpreter"""
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=str(settings.BASE_DIR),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        return report['total_ms'], parse_importtime(result.stderr), set(report['modules'])
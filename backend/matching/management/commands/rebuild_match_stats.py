@@ -0,0 +1,13 @@
+# matching/management/commands/rebuild_match_stats.py
+
+from django.core.management.base import BaseCommand
+
+from matching.match_stats import rebuild_match_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized per-therapist match statistics used by Layer 3'
+
+    def handle(self, *args, **options):
+        written = rebuild_match_stats()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt match statistics for {written} therapists'))
@@ -0,0 +1,25 @@
+# matching/management/commands/refresh_capacity.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from matching.capacity import BOOKING_WINDOW_DAYS, refresh_capacity
+from matching.models import TherapistCapacity
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recount the free slots of every active therapist over the booking window (run daily)'
+
+    def handle(self, *args, **options):
+        therapist_ids = list(User.objects.filter(role='therapist', is_active=True).values_list('id', flat=True))
+        counted = refresh_capacity(therapist_ids)
+        fully_booked = TherapistCapacity.objects.filter(therapist_id__in=therapist_ids, free_slots=0).count()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Capacity refreshed for {counted} therapists '
+                f'({fully_booked} without a free slot in the next {BOOKING_WINDOW_DAYS} days)'
+            )
+        )
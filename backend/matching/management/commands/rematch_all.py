@@ -0,0 +1,160 @@
+# matching/management/commands/rematch_all.py
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from matching.bulk_rematch import (
+    apply_results,
+    rank_changes,
+    rematch_queryset,
+    rematch_shard,
+    reset_worker_state,
+    shard_ids,
+)
+from matching.match_stats import MATCH_SLOTS, rebuild_match_stats, use_materialized_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute matches for every patient whose latest survey response is submitted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes (0 runs every shard in this process)'
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=200,
+            help='Survey responses per shard'
+        )
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=len(MATCH_SLOTS),
+            choices=range(1, len(MATCH_SLOTS) + 1),
+            help='Matches saved per patient'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute matches that are already up to date'
+        )
+        parser.add_argument(
+            '--vectorized',
+            action='store_true',
+            help='Use the vectorized scoring path'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print rank changes without saving anything'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the last completed response id; an existing file resumes the run'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        dry_run = options['dry_run']
+
+        queryset = rematch_queryset()
+        resume_after = self._read_checkpoint(checkpoint) if checkpoint else None
+        if resume_after is not None:
+            queryset = queryset.filter(id__gt=resume_after)
+            self.stdout.write(f'Resuming after survey response {resume_after}')
+
+        shards = shard_ids(list(queryset.values_list('id', flat=True)), options['shard_size'])
+        if not shards:
+            self.stdout.write(self.style.SUCCESS('✅ Nothing to rematch'))
+            return
+
+        total = sum(len(shard) for shard in shards)
+        self.stdout.write(f'Rematching {total} survey responses in {len(shards)} shards...')
+
+        shard_args = (options['top_n'], options['force'], options['vectorized'])
+        counts = {'updated': 0, 'created': 0, 'current': 0, 'empty': 0, 'changed': 0}
+        done = 0
+
+        for shard, results in self._run_shards(shards, shard_args, options['workers']):
+            done += len(shard)
+            if dry_run:
+                changes = rank_changes(results)
+                for change in changes:
+                    self.stdout.write(
+                        f'  response {change.response_id} (patient {change.patient_id}): '
+                        f'{change.old or "no match"} -> {change.new}'
+                    )
+                counts['changed'] += len(changes)
+                counts['current'] += sum(1 for result in results if result.current)
+                counts['empty'] += sum(1 for result in results if not result.current and not result.ranked)
+            else:
+                for key, value in apply_results(results).items():
+                    counts[key] += value
+                if checkpoint:
+                    self._write_checkpoint(checkpoint, shard[-1])
+            self.stdout.write(f'  {done}/{total}')
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Dry run: {counts['changed']} rankings would change, "
+                f"{counts['current']} up to date, {counts['empty']} without matches"
+            ))
+            return
+
+        # bulk_update / bulk_create skip the signals that maintain the statistics
+        if use_materialized_stats():
+            rebuild_match_stats()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rematched: {counts['updated']} updated, {counts['created']} created, "
+            f"{counts['current']} up to date, {counts['empty']} without matches"
+        ))
+
+    def _run_shards(self, shards, shard_args, workers):
+        """Yield (shard, results) in shard order"""
+        if workers <= 0:
+            try:
+                for shard in shards:
+                    yield shard, rematch_shard(shard, *shard_args)
+            finally:
+                reset_worker_state()
+            return
+
+        # Spawned workers set Django up themselves and open their own
+        # connections, so no connection or model weights are inherited
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(shards)),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as executor:
+            futures = [executor.submit(rematch_shard, shard, *shard_args) for shard in shards]
+            for shard, future in zip(shards, futures):
+                yield shard, future.result()
+
+    def _read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return int(json.load(f)['last_response_id'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'Invalid checkpoint file {path}: {e}')
+
+    def _write_checkpoint(self, path, last_response_id):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'last_response_id': last_response_id}, f)
+        os.replace(temp_path, path)
@@ -0,0 +1,121 @@
+# matching/management/commands/replay_matching.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.benchmarks.replay import MATCHERS, collect_replay_cases, compare_replays, run_replay
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay historical survey responses through the matchers and score them against '
+        'the therapists actually booked (NDCG/recall@K, latency, queries)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='Most recent cases replayed (0 = all)')
+        parser.add_argument('--k', type=int, default=3, help='Cut-off of NDCG@K and recall@K')
+        parser.add_argument(
+            '--matchers',
+            default=','.join(MATCHERS),
+            help=f"Comma-separated matchers to replay ({', '.join(MATCHERS)})"
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes replaying cases in parallel')
+        parser.add_argument('--chunk-size', type=int, default=25, help='Cases per worker task')
+        parser.add_argument(
+            '--weights',
+            default='',
+            help='TherapistMatcher weight overrides, e.g. layer2_semantic=0.5,specialization=0.35'
+        )
+        parser.add_argument('--label', default='', help='Name stored in the report (e.g. a git revision)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to check for regressions')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=1.25,
+            help='Allowed p95 latency growth factor against the baseline'
+        )
+        parser.add_argument(
+            '--max-drop',
+            type=float,
+            default=0.02,
+            help='Allowed absolute NDCG / recall drop against the baseline'
+        )
+
+    def handle(self, *args, **options):
+        matchers = [name.strip() for name in options['matchers'].split(',') if name.strip()]
+        unknown = sorted(set(matchers) - set(MATCHERS))
+        if unknown:
+            raise CommandError(f"Unknown matchers: {', '.join(unknown)}")
+        if options['k'] < 1:
+            raise CommandError('--k must be at least 1')
+        weights = self._parse_weights(options['weights'])
+
+        cases = collect_replay_cases(limit=options['limit'] or None)
+        if not cases:
+            raise CommandError('No submitted survey responses followed by a booking to replay')
+        self.stdout.write(f'Replaying {len(cases)} cases at K={options["k"]}...')
+
+        report = run_replay(
+            cases,
+            matchers=matchers,
+            k=options['k'],
+            workers=max(1, options['workers']),
+            chunk_size=max(1, options['chunk_size']),
+            weights=weights,
+            label=options['label'],
+            log=self.stdout.write,
+        )
+        self._print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare_replays(baseline, report, options['threshold'], options['max_drop'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(self.style.ERROR(f'❌ {regression}'))
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS('✅ No regressions against the baseline'))
+
+    def _parse_weights(self, raw):
+        from matching.algorithm import TherapistMatcher
+
+        weights = {}
+        for item in filter(None, (part.strip() for part in raw.split(','))):
+            name, _, value = item.partition('=')
+            if name not in TherapistMatcher.WEIGHTS:
+                raise CommandError(f"Unknown weight {name!r} (one of {', '.join(TherapistMatcher.WEIGHTS)})")
+            try:
+                weights[name] = float(value)
+            except ValueError:
+                raise CommandError(f'Weight {name} must be a number')
+        return weights
+
+    def _print_report(self, report):
+        if not report['embeddings_available']:
+            self.stdout.write(self.style.WARNING('⚠️ sentence-transformers not installed, Layer 2 is not exercised'))
+
+        k = report['parameters']['k']
+        for run in report['runs']:
+            if 'skipped' in run:
+                self.stdout.write(self.style.WARNING(f"{run['matcher']}: skipped ({run['skipped']})"))
+                continue
+
+            latency = run['latency_ms']
+            errors = f", {run['errors']} errors" if run['errors'] else ''
+            self.stdout.write(
+                f"{run['matcher']}: NDCG@{k} {run['ndcg']:.3f}, recall@{k} {run['recall']:.3f}, "
+                f"hit rate {run['hit_rate']:.3f} over {run['cases']} cases{errors}"
+            )
+            self.stdout.write(
+                f"    p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+                f"{run['queries']['max']:g} queries, {run['encoder_calls']['max']:g} encoder calls per request"
+            )
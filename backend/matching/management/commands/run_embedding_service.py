@@ -0,0 +1,54 @@
+# matching/management/commands/run_embedding_service.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.algorithm import EMBEDDINGS_AVAILABLE, get_embedding_model
+from matching.embedding_service import EmbeddingServer
+
+
+class Command(BaseCommand):
+    help = 'Serve sentence-transformer embeddings to all workers on this host over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=getattr(settings, 'MATCHING_EMBEDDING_SOCKET', None),
+            help='Socket path (default: MATCHING_EMBEDDING_SOCKET)'
+        )
+        parser.add_argument(
+            '--window-ms',
+            type=float,
+            default=getattr(settings, 'MATCHING_EMBEDDING_BATCH_WINDOW_MS', 5),
+            help='Milliseconds to wait for more requests before encoding a batch'
+        )
+        parser.add_argument(
+            '--max-batch',
+            type=int,
+            default=getattr(settings, 'MATCHING_EMBEDDING_MAX_BATCH', 64),
+            help='Maximum texts encoded in one batch'
+        )
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('No socket path: pass --socket or set MATCHING_EMBEDDING_SOCKET')
+        if not EMBEDDINGS_AVAILABLE:
+            raise CommandError('sentence-transformers is not installed')
+
+        model = get_embedding_model()
+        max_batch = options['max_batch']
+
+        server = EmbeddingServer(
+            options['socket'],
+            lambda texts: model.encode(texts, batch_size=max_batch),
+            max_batch=max_batch,
+            window=options['window_ms'] / 1000,
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Embedding service listening on {options['socket']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Stopped after {server.batcher.batches} batches')
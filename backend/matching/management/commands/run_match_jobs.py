@@ -0,0 +1,81 @@
+# matching/management/commands/run_match_jobs.py
+
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from matching.jobs import claim_next_job, execute_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued asynchronous matching jobs (use with MATCHING_JOB_RUNNER = "worker")'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=2,
+            help='Number of jobs run concurrently by this worker'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--requeue-after',
+            type=int,
+            default=600,
+            help='Return jobs running longer than this many seconds to the queue on startup'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty instead of waiting for new jobs'
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['requeue_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'⚠️ Requeued {requeued} stale jobs'))
+
+        stop = threading.Event()
+        counts = {'completed': 0, 'failed': 0}
+        counts_lock = threading.Lock()
+
+        def work():
+            try:
+                while not stop.is_set():
+                    job = claim_next_job()
+                    if job is None:
+                        if options['once']:
+                            return
+                        stop.wait(options['poll_interval'])
+                        continue
+
+                    job = execute_job(job)
+                    with counts_lock:
+                        counts[job.status] = counts.get(job.status, 0) + 1
+                    self.stdout.write(f'  job {job.id} {job.status}')
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(max(1, options['threads']))]
+        for thread in threads:
+            thread.start()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Matching worker started with {len(threads)} threads'))
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Worker stopped: {counts['completed']} completed, {counts['failed']} failed")
+        )
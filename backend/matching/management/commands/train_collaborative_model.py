@@ -0,0 +1,44 @@
+# matching/management/commands/train_collaborative_model.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from matching.collaborative_model import train_collaborative_model
+
+
+class Command(BaseCommand):
+    help = 'Fit the learned Layer 3 model (implicit ALS) on appointment outcomes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=16, help='Latent factors per patient and therapist')
+        parser.add_argument('--iterations', type=int, default=15, help='ALS sweeps')
+        parser.add_argument('--regularization', type=float, default=0.1, help='L2 penalty on the factors')
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=10.0,
+            help='Confidence added per appointment with a clear outcome'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stats = train_collaborative_model(
+            factors=options['factors'],
+            regularization=options['regularization'],
+            alpha=options['alpha'],
+            iterations=options['iterations'],
+        )
+        elapsed = time.perf_counter() - start
+
+        if not stats['interactions']:
+            self.stdout.write(self.style.WARNING('⚠️ No completed appointments to learn from; model not written'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Collaborative model trained in {elapsed:.1f}s: {stats['interactions']} patient-therapist pairs, "
+                f"{stats['patients']} patients, {stats['therapists']} therapists, "
+                f"{stats['cold_start_patients']} patients for cold start"
+            )
+        )
@@ -0,0 +1,162 @@
+"""
+Layer 3 Match Statistics
+How often each therapist appears in saved matches, for all candidates at once
+
+Layer 3 only needs two numbers per therapist: in how many TherapistMatch
+rows they appear (any of the three slots) and in how many they are the
+first choice. They are either aggregated live with one grouped count per
+slot, or read from the TherapistMatchStats table when
+MATCHING_MATERIALIZED_MATCH_STATS is enabled. Either way the number of
+queries does not depend on the pool size.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import TherapistMatch, TherapistMatchStats
+
+MATCH_SLOTS = ('top_match_1', 'top_match_2', 'top_match_3')
+
+
+def collaborative_score(total_matches: int, first_choice_matches: int) -> Dict:
+    """
+    Layer 3 result from a therapist's match statistics
+    
+    More matches and a higher first-choice rate give a better score;
+    therapists without history get the neutral 0.5.
+    """
+    result = {
+        'score': 0.5,  # Default neutral score
+        'match_frequency': total_matches,
+        'first_choice_rate': 0.0,
+        'similar_patients_matched': 0,
+    }
+    
+    if total_matches > 0:
+        result['first_choice_rate'] = first_choice_matches / total_matches
+        result['similar_patients_matched'] = total_matches
+        
+        frequency_score = min(1.0, total_matches / 20)  # Cap at 20 matches
+        first_choice_score = result['first_choice_rate']
+        
+        result['score'] = 0.3 + (frequency_score * 0.3) + (first_choice_score * 0.4)
+    
+    return result
+
+
+def aggregate_match_stats(therapist_ids: Optional[Iterable[int]] = None) -> Dict[int, Tuple[int, int]]:
+    """
+    {therapist_id: (match_count, first_choice_count)} from grouped counts
+    
+    One GROUP BY per slot column, summed here, so TherapistMatch is
+    scanned per slot rather than per therapist. A match counts once per
+    therapist even if they somehow occupy more than one slot (those rare
+    rows are corrected from one more query). Pass None to aggregate
+    every therapist who appears in a match.
+    """
+    if therapist_ids is not None:
+        therapist_ids = list(therapist_ids)
+    
+    matches = TherapistMatch.objects.order_by()
+    totals, first_choices = Counter(), Counter()
+    for slot in MATCH_SLOTS:
+        rows = matches.filter(**{f'{slot}__isnull': False})
+        if therapist_ids is not None:
+            rows = rows.filter(**{f'{slot}__in': therapist_ids})
+        for therapist_id, count in rows.values_list(slot).annotate(count=Count('pk')):
+            totals[therapist_id] += count
+            if slot == 'top_match_1':
+                first_choices[therapist_id] += count
+    
+    repeated = (
+        Q(top_match_1=F('top_match_2')) | Q(top_match_1=F('top_match_3')) | Q(top_match_2=F('top_match_3'))
+    )
+    for slots in matches.filter(repeated).values_list(*MATCH_SLOTS):
+        for therapist_id, count in Counter(slot for slot in slots if slot is not None).items():
+            if count > 1 and therapist_id in totals:
+                totals[therapist_id] -= count - 1
+    
+    owners = therapist_ids if therapist_ids is not None else list(totals)
+    return {therapist_id: (totals[therapist_id], first_choices[therapist_id]) for therapist_id in owners}
+
+
+def use_materialized_stats() -> bool:
+    return getattr(settings, 'MATCHING_MATERIALIZED_MATCH_STATS', False)
+
+
+def get_match_stats(therapist_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """Match statistics for the given therapists (missing ones are (0, 0))"""
+    therapist_ids = list(therapist_ids)
+    if not therapist_ids:
+        return {}
+    
+    if use_materialized_stats():
+        rows = TherapistMatchStats.objects.filter(therapist_id__in=therapist_ids).values_list(
+            'therapist_id', 'match_count', 'first_choice_count'
+        )
+        stats = {therapist_id: (total, first) for therapist_id, total, first in rows}
+    else:
+        stats = aggregate_match_stats(therapist_ids)
+    
+    return {therapist_id: stats.get(therapist_id, (0, 0)) for therapist_id in therapist_ids}
+
+
+def match_slots(match: TherapistMatch) -> Tuple[Set[int], Optional[int]]:
+    """(therapists appearing in the match, first-choice therapist)"""
+    therapists = {getattr(match, f'{slot}_id') for slot in MATCH_SLOTS} - {None}
+    return therapists, match.top_match_1_id
+
+
+def apply_match_change(
+    old: Tuple[Set[int], Optional[int]],
+    new: Tuple[Set[int], Optional[int]],
+) -> None:
+    """
+    Incrementally update TherapistMatchStats for a created/rematched/deleted match
+    
+    ``old`` and ``new`` are match_slots() before and after the change
+    (empty for a creation or deletion respectively). Counts never go
+    below zero, so a match saved before the table was filled cannot
+    break the save; rebuild_match_stats() restores exact numbers.
+    """
+    old_therapists, old_first = old
+    new_therapists, new_first = new
+    
+    deltas: Dict[int, list] = {}
+    for therapist_id in new_therapists - old_therapists:
+        deltas.setdefault(therapist_id, [0, 0])[0] += 1
+    for therapist_id in old_therapists - new_therapists:
+        deltas.setdefault(therapist_id, [0, 0])[0] -= 1
+    if old_first != new_first:
+        if new_first is not None:
+            deltas.setdefault(new_first, [0, 0])[1] += 1
+        if old_first is not None:
+            deltas.setdefault(old_first, [0, 0])[1] -= 1
+    
+    with transaction.atomic():
+        for therapist_id, (total_delta, first_delta) in deltas.items():
+            if not total_delta and not first_delta:
+                continue
+            TherapistMatchStats.objects.get_or_create(therapist_id=therapist_id)
+            TherapistMatchStats.objects.filter(therapist_id=therapist_id).update(
+                match_count=Greatest(F('match_count') + total_delta, 0),
+                first_choice_count=Greatest(F('first_choice_count') + first_delta, 0),
+            )
+
+
+def rebuild_match_stats() -> int:
+    """Recompute the whole TherapistMatchStats table; returns rows written"""
+    stats = aggregate_match_stats()
+    with transaction.atomic():
+        TherapistMatchStats.objects.all().delete()
+        TherapistMatchStats.objects.bulk_create([
+            TherapistMatchStats(therapist_id=therapist_id, match_count=total, first_choice_count=first)
+            for therapist_id, (total, first) in stats.items()
+            if total
+        ])
+    return sum(1 for total, _ in stats.values() if total)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_remove_therapistprofile_certificates_and_more'),
+        ('matching', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TherapistMatchStats',
+            fields=[
+                ('therapist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='match_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('match_count', models.PositiveIntegerField(default=0)),
+                ('first_choice_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Therapist Match Stats',
+                'verbose_name_plural': 'Therapist Match Stats',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0002_alter_blogpost_cover_image'),
+        ('matching', '0004_therapistmatchstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(help_text='Rank of the section by relevance')),
+                ('text', models.TextField()),
+                ('relevance', models.FloatField(default=0.0)),
+                ('source_hash', models.CharField(help_text='Hash of the post text the section was extracted from', max_length=40)),
+                ('embedding', models.BinaryField(blank=True, help_text='L2-normalised float32 embedding', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matching_sections', to='blogs.blogpost')),
+            ],
+            options={
+                'verbose_name': 'Blog Section',
+                'verbose_name_plural': 'Blog Sections',
+                'ordering': ['post', 'position'],
+                'unique_together': {('post', 'position')},
+            },
+        ),
+    ]
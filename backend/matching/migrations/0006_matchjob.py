@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:35
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0005_blogsection'),
+        ('surveys', '0006_alter_conditionalsurveytrigger_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('find', 'Find matches'), ('rematch', 'Rematch')], default='find', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('results', models.JSONField(blank=True, default=list, help_text='Ranked results with reasons and score breakdown')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('match', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='matching.therapistmatch')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_jobs', to=settings.AUTH_USER_MODEL)),
+                ('survey_response', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_jobs', to='surveys.surveyresponse')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='matching_ma_status_e5c8d1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0006_matchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TherapistPoolVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Therapist Pool Version',
+                'verbose_name_plural': 'Therapist Pool Version',
+            },
+        ),
+        migrations.AddField(
+            model_name='therapistmatch',
+            name='pool_version',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Therapist pool version at matching time', null=True),
+        ),
+        migrations.AddField(
+            model_name='therapistmatch',
+            name='survey_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Hash of the parsed survey answers', max_length=64),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0007_therapistpoolversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchingLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matcher', models.CharField(choices=[('therapist_matcher', 'TherapistMatcher'), ('matching_engine', 'MatchingEngine')], default='therapist_matcher', max_length=30)),
+                ('eligible_therapists_count', models.IntegerField(default=0)),
+                ('matches_generated', models.IntegerField(default=0)),
+                ('processing_time_ms', models.IntegerField(help_text='Time taken to generate matches in milliseconds')),
+                ('query_count', models.PositiveIntegerField(default=0)),
+                ('encoder_calls', models.PositiveIntegerField(default=0)),
+                ('filters_applied', models.JSONField(blank=True, default=dict, help_text='Which filters were applied')),
+                ('stage_timings', models.JSONField(blank=True, default=dict, help_text='Per stage: wall_ms, queries, encoder_calls, encoded_texts')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='matching_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'matching_logs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['matcher', 'created_at'], name='matching_lo_matcher_b40ca5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0008_matchinglog'),
+        ('surveys', '0006_alter_conditionalsurveytrigger_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='matchjob',
+            name='kind',
+            field=models.CharField(choices=[('find', 'Find matches'), ('rematch', 'Rematch'), ('features', 'Precompute patient features')], default='find', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='PatientMatchFeatures',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('survey_fingerprint', models.CharField(help_text='Hash of the parsed survey answers the features were computed from', max_length=64)),
+                ('patient_text', models.TextField(blank=True)),
+                ('embedding', models.BinaryField(blank=True, help_text='float32 embedding of patient_text', null=True)),
+                ('preferences', models.JSONField(blank=True, default=dict, help_text='Layer 1 hard preferences')),
+                ('issues', models.JSONField(blank=True, default=list, help_text='Extracted patient issues')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('survey_response', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='match_features', to='surveys.surveyresponse')),
+            ],
+            options={
+                'verbose_name': 'Patient Match Features',
+                'verbose_name_plural': 'Patient Match Features',
+            },
+        ),
+    ]
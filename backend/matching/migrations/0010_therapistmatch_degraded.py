@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0009_patientmatchfeatures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='therapistmatch',
+            name='degraded',
+            field=models.BooleanField(default=False, help_text='Computed with Layer 2 fallbacks after the latency budget ran out; upgraded by a rematch job'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_remove_therapistprofile_certificates_and_more'),
+        ('matching', '0010_therapistmatch_degraded'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TherapistCapacity',
+            fields=[
+                ('therapist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='match_capacity', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('free_slots', models.PositiveIntegerField(default=0, help_text='Free one-hour slots in the booking window')),
+                ('next_available_at', models.DateTimeField(blank=True, help_text='Start of the earliest free slot', null=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Therapist Capacity',
+                'verbose_name_plural': 'Therapist Capacity',
+            },
+        ),
+    ]
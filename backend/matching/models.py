@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
@@ -49,6 +51,23 @@ class TherapistMatch(models.Model):
     )
     top_match_3_score = models.FloatField(default=0.0)
     
+    # Inputs the matches were computed from (see matching.result_cache)
+    survey_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Hash of the parsed survey answers"
+    )
+    pool_version = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Therapist pool version at matching time"
+    )
+    degraded = models.BooleanField(
+        default=False,
+        help_text="Computed with Layer 2 fallbacks after the latency budget ran out; upgraded by a rematch job"
+    )
+    
     matched_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -87,3 +106,258 @@ class TherapistMatch(models.Model):
         help_text="Stores match reasons for each therapist"
         )
         return matches
+
+
+class TherapistMatchStats(models.Model):
+    """
+    Materialized Layer 3 statistics for one therapist
+    
+    While MATCHING_MATERIALIZED_MATCH_STATS is enabled, kept up to date by
+    signals whenever a TherapistMatch is created, rematched or deleted
+    (see matching.match_stats); rebuilt from scratch with
+    `python manage.py rebuild_match_stats`.
+    """
+    therapist = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='match_stats'
+    )
+    match_count = models.PositiveIntegerField(default=0)
+    first_choice_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Therapist Match Stats'
+        verbose_name_plural = 'Therapist Match Stats'
+    
+    def __str__(self):
+        return f"{self.therapist_id}: {self.match_count} matches, {self.first_choice_count} first"
+
+
+class TherapistCapacity(models.Model):
+    """
+    Free bookable slots of one therapist over the booking window
+
+    Counted with the rules of the available-slots endpoint and kept up
+    to date by signals on availability, time off and appointments (see
+    matching.capacity); `python manage.py refresh_capacity` rolls the
+    window forward for everyone.
+    """
+    therapist = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='match_capacity'
+    )
+    free_slots = models.PositiveIntegerField(default=0, help_text="Free one-hour slots in the booking window")
+    next_available_at = models.DateTimeField(null=True, blank=True, help_text="Start of the earliest free slot")
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Therapist Capacity'
+        verbose_name_plural = 'Therapist Capacity'
+
+    def __str__(self):
+        return f"{self.therapist_id}: {self.free_slots} free slots"
+
+
+class BlogSection(models.Model):
+    """
+    Therapeutic section of a published blog post, pre-computed for Layer 2
+    
+    Written when a post is published or edited (see matching.blog_sections)
+    so match requests never re-split or re-embed blog content.
+    """
+    post = models.ForeignKey(
+        'blogs.BlogPost',
+        on_delete=models.CASCADE,
+        related_name='matching_sections'
+    )
+    position = models.PositiveSmallIntegerField(help_text="Rank of the section by relevance")
+    text = models.TextField()
+    relevance = models.FloatField(default=0.0)
+    source_hash = models.CharField(
+        max_length=40,
+        help_text="Hash of the post text the section was extracted from"
+    )
+    embedding = models.BinaryField(
+        null=True,
+        blank=True,
+        help_text="L2-normalised float32 embedding"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['post', 'position']
+        unique_together = ('post', 'position')
+        verbose_name = 'Blog Section'
+        verbose_name_plural = 'Blog Sections'
+    
+    def __str__(self):
+        return f"Post {self.post_id} section {self.position} ({self.relevance:.2f})"
+
+
+class MatchJob(models.Model):
+    """
+    A queued run of the matcher for a survey response
+    
+    Created by the async mode of find_matches / rematch and executed by a
+    worker (see matching.jobs), so web requests never wait on ML work.
+    """
+    KIND_CHOICES = [
+        ('find', 'Find matches'),
+        ('rematch', 'Rematch'),
+        ('features', 'Precompute patient features'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='match_jobs'
+    )
+    survey_response = models.ForeignKey(
+        'surveys.SurveyResponse',
+        on_delete=models.CASCADE,
+        related_name='match_jobs'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='find')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Outcome
+    match = models.ForeignKey(
+        TherapistMatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs'
+    )
+    results = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Ranked results with reasons and score breakdown"
+    )
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+
+class PatientMatchFeatures(models.Model):
+    """
+    Matcher inputs pre-computed when a survey response is submitted
+    
+    Written by a background job (see matching.patient_features) so a
+    match request starts from the patient text, embedding, hard
+    preferences and issues instead of encoding on the request path.
+    """
+    survey_response = models.OneToOneField(
+        'surveys.SurveyResponse',
+        on_delete=models.CASCADE,
+        related_name='match_features'
+    )
+    survey_fingerprint = models.CharField(
+        max_length=64,
+        help_text="Hash of the parsed survey answers the features were computed from"
+    )
+    patient_text = models.TextField(blank=True)
+    embedding = models.BinaryField(
+        null=True,
+        blank=True,
+        help_text="float32 embedding of patient_text"
+    )
+    preferences = models.JSONField(default=dict, blank=True, help_text="Layer 1 hard preferences")
+    issues = models.JSONField(default=list, blank=True, help_text="Extracted patient issues")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Patient Match Features'
+        verbose_name_plural = 'Patient Match Features'
+    
+    def __str__(self):
+        return f"Features for response {self.survey_response_id}"
+
+
+class TherapistPoolVersion(models.Model):
+    """
+    Counter bumped whenever the therapist pool changes
+    
+    A single row. Profile, verification, blog and availability signals
+    increment it, so cached match results keyed by the version go stale
+    exactly when the therapists they were computed from change.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Therapist Pool Version'
+        verbose_name_plural = 'Therapist Pool Version'
+    
+    def __str__(self):
+        return f"Therapist pool v{self.version}"
+
+
+class MatchingLog(models.Model):
+    """
+    Timing and query counts of one matching request
+    
+    Written by both matchers (TherapistMatcher via matching.jobs and
+    MatchingEngine) with per-stage counters from
+    matching.instrumentation; aggregated by the ops stats endpoint.
+    """
+    MATCHER_CHOICES = [
+        ('therapist_matcher', 'TherapistMatcher'),
+        ('matching_engine', 'MatchingEngine'),
+    ]
+    
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='matching_logs'
+    )
+    matcher = models.CharField(max_length=30, choices=MATCHER_CHOICES, default='therapist_matcher')
+    eligible_therapists_count = models.IntegerField(default=0)
+    matches_generated = models.IntegerField(default=0)
+    processing_time_ms = models.IntegerField(help_text="Time taken to generate matches in milliseconds")
+    query_count = models.PositiveIntegerField(default=0)
+    encoder_calls = models.PositiveIntegerField(default=0)
+    filters_applied = models.JSONField(default=dict, blank=True, help_text="Which filters were applied")
+    stage_timings = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Per stage: wall_ms, queries, encoder_calls, encoded_texts"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'matching_logs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['matcher', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.matcher} {self.processing_time_ms} ms ({self.created_at:%Y-%m-%d %H:%M})"
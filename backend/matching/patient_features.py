@@ -0,0 +1,61 @@
+"""
+Patient Match Features
+Matcher inputs computed once at survey submission, off the request path
+
+submit_assessment enqueues a 'features' job (see matching.jobs) that
+parses the answers, builds the patient text, encodes it and extracts the
+hard preferences and issues, storing them as PatientMatchFeatures. A later
+match request passes the stored row to TherapistMatcher, which then skips
+all of that work, including the encoder. Features computed from different
+answers (identified by the survey fingerprint) are ignored.
+"""
+
+import logging
+from typing import Optional
+
+from django.db import transaction
+
+from .blog_sections import encode_embedding
+from .models import PatientMatchFeatures
+from .result_cache import survey_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def compute_patient_features(survey_response) -> PatientMatchFeatures:
+    """Compute and store the features of a survey response"""
+    from .algorithm import TherapistMatcher
+
+    matcher = TherapistMatcher(survey_response)
+    embedding = matcher.patient_embedding
+
+    features, _ = PatientMatchFeatures.objects.update_or_create(
+        survey_response=survey_response,
+        defaults={
+            'survey_fingerprint': survey_fingerprint(matcher.answers),
+            'patient_text': matcher.patient_text,
+            'embedding': encode_embedding(embedding) if embedding is not None else None,
+            'preferences': matcher._extract_preferences(),
+            'issues': list(matcher._patient_issues()),
+        }
+    )
+    return features
+
+
+def get_patient_features(survey_response, fingerprint: str) -> Optional[PatientMatchFeatures]:
+    """Stored features computed from answers with this fingerprint, if any"""
+    return PatientMatchFeatures.objects.filter(
+        survey_response=survey_response,
+        survey_fingerprint=fingerprint,
+    ).first()
+
+
+def enqueue_patient_features(survey_response) -> None:
+    """Queue the features job for a submitted response (never fails the caller)"""
+    from .jobs import enqueue_match_job
+
+    try:
+        with transaction.atomic():
+            enqueue_match_job(survey_response, kind='features')
+    except Exception as e:
+        logger.warning(f"[MATCHING] Could not queue features for response {survey_response.id}: {e}")
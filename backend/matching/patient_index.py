@@ -0,0 +1,327 @@
+"""
+Similar-Patient Index
+Nearest past patients and how their therapists worked out for them
+
+Each indexed patient has their latest survey embedding (PatientMatchFeatures)
+and the outcome score of every therapist they saw (see
+matching.collaborative_model.collect_interactions). At match time the K
+patients closest to the new patient are found with one matrix product and
+their outcomes are averaged per therapist, weighted by similarity. Layer 3
+blends that average into its score: the more similar patients saw a
+therapist, the more it counts.
+
+The index stays compact: float16 unit vectors, plus outcomes in CSR form
+(offsets into flat therapist-id / float16-outcome arrays). It is built by
+`python manage.py build_patient_index` and then kept current one patient
+at a time as appointments complete and feedback arrives (matching.signals).
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .collaborative_model import collect_interactions, latest_embeddings
+from .embedding_store import directory_lock, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# Weight of the neutral prior against the similarity-weighted support of a
+# therapist when blending into Layer 3
+SIMILAR_PATIENT_PRIOR = 2.0
+
+# Neighbours less similar than this are ignored
+MIN_SIMILARITY = 0.2
+
+
+def blend_similar_patients(score: float, outcome: float, support: float) -> float:
+    """Layer 3 score moved towards the outcome of similar patients, by their support"""
+    weight = support / (support + SIMILAR_PATIENT_PRIOR)
+    return (1 - weight) * score + weight * outcome
+
+
+class SimilarPatientIndex:
+    """
+    Patient embeddings and per-therapist outcomes in one ``.npz`` file
+
+    - patient_ids:   int64 (patients,)
+    - vectors:       float16 (patients, dim), unit rows
+    - offsets:       int64 (patients + 1,), row i's outcomes are
+                     [offsets[i], offsets[i + 1])
+    - therapist_ids: int64 (outcomes,)
+    - outcomes:      float16 (outcomes,), in [0, 1]
+
+    Written atomically; readers reload when the file's mtime changes.
+    """
+
+    DATA_FILE = 'patients.npz'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.patient_ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, 0), dtype=np.float16)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.therapist_ids = np.zeros(0, dtype=np.int64)
+        self.outcomes = np.zeros(0, dtype=np.float16)
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.directory, self.DATA_FILE)
+
+    def _data_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._data_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        mtime = self._data_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+
+        try:
+            with np.load(self._data_path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load similar-patient index from {self.directory}: {e}")
+            return
+
+        self.patient_ids = arrays['patient_ids']
+        self.vectors = arrays['vectors']
+        self.offsets = arrays['offsets']
+        self.therapist_ids = arrays['therapist_ids']
+        self.outcomes = arrays['outcomes']
+        self._loaded_mtime = mtime
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._data_path + '.tmp.npz'
+        np.savez(
+            temp_path,
+            patient_ids=self.patient_ids,
+            vectors=self.vectors,
+            offsets=self.offsets,
+            therapist_ids=self.therapist_ids,
+            outcomes=self.outcomes,
+        )
+        os.replace(temp_path, self._data_path)
+        self._loaded_mtime = self._data_mtime()
+
+    @staticmethod
+    def _rows(
+        patient_ids: List[int],
+        embeddings: Dict[int, np.ndarray],
+        outcomes: Dict[int, List[Tuple[int, float]]],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Index arrays for the patients that have both an embedding and outcomes"""
+        kept = [patient_id for patient_id in patient_ids if patient_id in embeddings and outcomes.get(patient_id)]
+        flat = [pair for patient_id in kept for pair in outcomes[patient_id]]
+        vectors = (
+            normalize_rows(np.stack([embeddings[patient_id] for patient_id in kept]))
+            if kept else np.zeros((0, 0), dtype=np.float32)
+        )
+        return (
+            np.array(kept, dtype=np.int64),
+            vectors.astype(np.float16),
+            np.concatenate([[0], np.cumsum([len(outcomes[patient_id]) for patient_id in kept])]).astype(np.int64),
+            np.array([therapist_id for therapist_id, _ in flat], dtype=np.int64),
+            np.array([outcome for _, outcome in flat], dtype=np.float16),
+        )
+
+    # ------------------------------------------------------------------
+    # Building and incremental updates
+    # ------------------------------------------------------------------
+
+    def build(self) -> int:
+        """Index every patient with outcomes and a survey embedding; returns the count"""
+        patient_ids, outcomes = _patient_outcomes()
+        embeddings = latest_embeddings(patient_ids)
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reset()
+            (self.patient_ids, self.vectors, self.offsets,
+             self.therapist_ids, self.outcomes) = self._rows(patient_ids, embeddings, outcomes)
+            self._save()
+            return len(self.patient_ids)
+
+    def refresh_patient(self, patient_id: int) -> bool:
+        """
+        Replace one patient's row (dropped when they no longer qualify)
+
+        Returns False, without rewriting the file, when the row is unchanged
+        (e.g. a new survey from a patient without outcomes).
+        """
+        _, outcomes = _patient_outcomes([patient_id])
+        embeddings = latest_embeddings([patient_id])
+        new = self._rows([patient_id], embeddings, outcomes)
+
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reload_if_changed()
+            if self._row_unchanged(patient_id, new):
+                return False
+
+            keep = self.patient_ids != patient_id
+            counts = np.diff(self.offsets)
+            entries = np.repeat(keep, counts)
+            counts = counts[keep]
+            vectors = self.vectors[keep] if self.vectors.size else self.vectors
+            if len(new[0]) and vectors.size and vectors.shape[1] != new[1].shape[1]:
+                logger.warning(
+                    f"[MATCHING] Embedding size changed; rebuild the similar-patient index (patient {patient_id})"
+                )
+                return False
+
+            self.patient_ids = np.concatenate([self.patient_ids[keep], new[0]])
+            if not len(new[0]):
+                self.vectors = vectors
+            else:
+                self.vectors = np.vstack([vectors, new[1]]) if vectors.size else new[1]
+            self.offsets = np.concatenate([[0], np.cumsum(np.concatenate([counts, np.diff(new[2])]))]).astype(np.int64)
+            self.therapist_ids = np.concatenate([self.therapist_ids[entries], new[3]])
+            self.outcomes = np.concatenate([self.outcomes[entries], new[4]])
+            self._save()
+            return True
+
+    def _row_unchanged(self, patient_id: int, new: Tuple[np.ndarray, ...]) -> bool:
+        """Whether the stored row of a patient equals ``new`` (see _rows)"""
+        rows = np.flatnonzero(self.patient_ids == patient_id)
+        if not len(rows) or not len(new[0]):
+            return not len(rows) and not len(new[0])
+        row = rows[0]
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return (
+            np.array_equal(self.vectors[row], new[1][0])
+            and np.array_equal(self.therapist_ids[start:end], new[3])
+            and np.array_equal(self.outcomes[start:end], new[4])
+        )
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        return self.generation() is not None
+
+    def generation(self) -> Optional[int]:
+        """Changes on every save (the file's mtime); None before the index is built"""
+        with self._lock:
+            self._reload_if_changed()
+            return self._loaded_mtime
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self.patient_ids)
+
+    def therapist_outcomes_many(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Sequence[Optional[int]] = (),
+    ) -> List[Dict[int, Tuple[float, float, int]]]:
+        """
+        Outcomes of the ``k`` nearest patients of every query, per therapist
+
+        Returns one {therapist_id: (outcome, support, patients)} per query:
+        the similarity-weighted mean outcome, the summed similarity and
+        the number of neighbours who saw the therapist. ``exclude`` holds
+        each query's own patient id so nobody is their own neighbour.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            patient_ids, vectors = self.patient_ids, self.vectors
+            offsets, therapist_ids, outcomes = self.offsets, self.therapist_ids, self.outcomes
+
+        queries = normalize_rows(queries)
+        results = [{} for _ in range(len(queries))]
+        if not len(patient_ids) or vectors.shape[1] != queries.shape[1]:
+            return results
+
+        similarities = queries @ vectors.T.astype(np.float32)
+        for row, own_id in enumerate(list(exclude) + [None] * (len(queries) - len(exclude))):
+            scores = similarities[row]
+            if own_id is not None:
+                scores = np.where(patient_ids == own_id, -np.inf, scores)
+            top = min(k, len(scores))
+            nearest = np.argpartition(-scores, top - 1)[:top]
+            nearest = nearest[scores[nearest] >= MIN_SIMILARITY]
+            if not len(nearest):
+                continue
+
+            starts, ends = offsets[nearest], offsets[nearest + 1]
+            entries = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+            weights = np.repeat(scores[nearest], ends - starts)
+            owners, positions = np.unique(therapist_ids[entries], return_inverse=True)
+            support = np.bincount(positions, weights=weights)
+            weighted = np.bincount(positions, weights=weights * outcomes[entries].astype(np.float32))
+            patients = np.bincount(positions)
+            results[row] = {
+                int(owner): (float(weighted[i] / support[i]), float(support[i]), int(patients[i]))
+                for i, owner in enumerate(owners)
+            }
+        return results
+
+    def therapist_outcomes(
+        self,
+        query: np.ndarray,
+        k: int,
+        exclude: Optional[int] = None,
+    ) -> Dict[int, Tuple[float, float, int]]:
+        """therapist_outcomes_many() for a single patient"""
+        return self.therapist_outcomes_many(np.asarray(query).reshape(1, -1), k, [exclude])[0]
+
+
+def _patient_outcomes(patient_ids: Optional[Sequence[int]] = None) -> Tuple[List[int], Dict[int, List[Tuple[int, float]]]]:
+    """(patient ids, {patient: [(therapist, outcome), ...]}) from appointment outcomes"""
+    interactions = collect_interactions(patient_ids)
+    outcomes = {}
+    for patient_id, therapist_id, score in zip(
+        interactions.patient_ids.tolist(), interactions.therapist_ids.tolist(), interactions.scores.tolist()
+    ):
+        outcomes.setdefault(patient_id, []).append((therapist_id, score))
+    return list(outcomes), outcomes
+
+
+def refresh_similar_patient(patient_id: int) -> None:
+    """Re-index one patient after an appointment outcome or their features changed"""
+    index = get_patient_index()
+    if not index.exists():
+        return  # Index not built yet (see build_patient_index)
+    index.refresh_patient(patient_id)
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_patient_index() -> SimilarPatientIndex:
+    """Process-wide similar-patient index (stored in MATCHING_PATIENT_INDEX_DIR)"""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            directory = getattr(
+                settings,
+                'MATCHING_PATIENT_INDEX_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'patients'),
+            )
+            _INDEX = SimilarPatientIndex(str(directory))
+        return _INDEX
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the index when MATCHING_PATIENT_INDEX_DIR is overridden (tests, benchmarks)"""
+    global _INDEX
+    if setting == 'MATCHING_PATIENT_INDEX_DIR':
+        with _INDEX_LOCK:
+            _INDEX = None
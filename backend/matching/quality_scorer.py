@@ -4,12 +4,58 @@ Rates therapist quality based on existing profile data (no DB changes)
 """
 
 import logging
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
 from django.utils import timezone
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+QUALITY_CACHE_PREFIX = 'matching:quality:'
+
+
+def quality_cache_key(therapist_id: int, pool_version: Optional[int] = None) -> str:
+    """
+    Cache key of a therapist's quality score (therapist = User id)
+    
+    Keys include the therapist pool version, which the profile,
+    verification and blog signals bump on commit. That invalidates the
+    score in every process, whatever the cache backend.
+    """
+    if pool_version is None:
+        from .result_cache import get_pool_version
+        
+        pool_version = get_pool_version()
+    return f'{QUALITY_CACHE_PREFIX}{pool_version}:{therapist_id}'
+
+
+def invalidate_quality_score(therapist_id: int) -> None:
+    """Drop a cached quality score right away in this process (the version bump follows on commit)"""
+    cache.delete(quality_cache_key(therapist_id))
+
+
+def fetch_blog_stats(therapist_ids: Iterable[int]) -> Dict[int, Tuple[int, Optional[object]]]:
+    """
+    Published blog count and latest published_at for many therapists
+    
+    One grouped query; therapists without published posts are absent.
+    
+    Returns:
+        {therapist_id: (blog_count, latest_published_at)}
+    """
+    from blogs.models import BlogPost
+    
+    rows = BlogPost.objects.filter(
+        status='published',
+        author_id__in=list(therapist_ids)
+    ).order_by().values('author_id').annotate(
+        blog_count=Count('id'),
+        latest_published_at=Max('published_at'),
+    )
+    return {row['author_id']: (row['blog_count'], row['latest_published_at']) for row in rows}
+
 
 class TherapistQualityScorer:
     """
@@ -59,6 +105,69 @@ class TherapistQualityScorer:
         if not profile:
             return 0.3  # Default for incomplete profile
         
+        return self._score_profile(profile, self._get_blog_activity_score(therapist_user))
+    
+    def score_many(self, therapists, blog_stats: Optional[Dict] = None) -> Dict[int, float]:
+        """
+        Quality scores for a whole candidate pool
+        
+        Cached scores are reused; for the rest, blog counts and latest
+        publish dates come from a single grouped query. Same values as
+        calling calculate_quality_score() for each therapist.
+        
+        Args:
+            therapists: User objects with therapist_profile loaded
+            blog_stats: Optional result of fetch_blog_stats() covering the
+                pool, to share the query with other scorers
+        
+        Returns:
+            {therapist_id: quality score}
+        """
+        therapists = list(therapists)
+        if not therapists:
+            return {}
+        
+        from .result_cache import get_pool_version
+        
+        pool_version = get_pool_version()
+        keys = {therapist.id: quality_cache_key(therapist.id, pool_version) for therapist in therapists}
+        cached = cache.get_many(list(keys.values()))
+        scores = {
+            therapist_id: cached[key]
+            for therapist_id, key in keys.items()
+            if key in cached
+        }
+        
+        pending = [therapist for therapist in therapists if therapist.id not in scores]
+        if not pending:
+            return scores
+        
+        if blog_stats is None:
+            try:
+                blog_stats = fetch_blog_stats([therapist.id for therapist in pending])
+            except Exception as e:
+                logger.warning(f"Error fetching blog statistics: {e}")
+                blog_stats = {}
+        
+        computed = {}
+        for therapist in pending:
+            profile = getattr(therapist, 'therapist_profile', None)
+            if not profile:
+                computed[therapist.id] = 0.3  # Default for incomplete profile
+                continue
+            
+            blog_activity_score = self._blog_activity_from_stats(*blog_stats.get(therapist.id, (0, None)))
+            computed[therapist.id] = self._score_profile(profile, blog_activity_score)
+        
+        cache.set_many(
+            {keys[therapist_id]: score for therapist_id, score in computed.items()},
+            getattr(settings, 'MATCHING_QUALITY_CACHE_TIMEOUT', 3600),
+        )
+        scores.update(computed)
+        return scores
+    
+    def _score_profile(self, profile, blog_activity_score: float) -> float:
+        """Weighted quality score from a profile and its blog activity score"""
         score = 0.2  # Baseline score
         
         # 1. Profession Type Score (0-0.30)
@@ -74,7 +183,6 @@ class TherapistQualityScorer:
         score += verification_score * 0.15
         
         # 4. Blog Activity Score (0-0.15)
-        blog_activity_score = self._get_blog_activity_score(therapist_user)
         score += blog_activity_score * 0.15
         
         # 5. Specialization Depth Score (0-0.15)
@@ -218,48 +326,54 @@ class TherapistQualityScorer:
         """
         
         try:
-            blogs = therapist_user.blog_posts.filter(status='published')
-            
-            if not blogs.exists():
-                return 0.0  # No blogs
-            
-            blog_count = blogs.count()
-            
-            # Post count score
-            if blog_count >= 20:
-                post_score = 1.0
-            elif blog_count >= 10:
-                post_score = 0.6
-            elif blog_count >= 5:
-                post_score = 0.3
-            else:
-                post_score = 0.1
-            
-            # Recency score
-            latest_blog = blogs.order_by('-published_at').first()
-            
-            if not latest_blog:
-                return 0.0
-            
-            days_since_post = (timezone.now() - latest_blog.published_at).days
-            
-            if days_since_post < 30:
-                recency_score = 1.0  # Very active
-            elif days_since_post < 90:
-                recency_score = 0.8
-            elif days_since_post < 180:
-                recency_score = 0.5
-            elif days_since_post < 365:
-                recency_score = 0.3
-            else:
-                recency_score = 0.1  # Inactive
-            
-            # Combine: weight recency more (60%) than count (40%)
-            return (post_score * 0.4) + (recency_score * 0.6)
-        
+            stats = fetch_blog_stats([therapist_user.id]).get(therapist_user.id, (0, None))
         except Exception as e:
             logger.warning(f"Error calculating blog activity score: {e}")
             return 0.0
+        
+        return self._blog_activity_from_stats(*stats)
+    
+    def _blog_activity_from_stats(self, blog_count: int, latest_published_at) -> float:
+        """
+        Blog activity score from a therapist's published post statistics
+        
+        Args:
+            blog_count: Number of published posts
+            latest_published_at: Most recent published_at (None if unknown)
+        
+        Returns:
+            Score between 0.0 and 1.0
+        """
+        
+        if not blog_count or latest_published_at is None:
+            return 0.0  # No blogs
+        
+        # Post count score
+        if blog_count >= 20:
+            post_score = 1.0
+        elif blog_count >= 10:
+            post_score = 0.6
+        elif blog_count >= 5:
+            post_score = 0.3
+        else:
+            post_score = 0.1
+        
+        # Recency score
+        days_since_post = (timezone.now() - latest_published_at).days
+        
+        if days_since_post < 30:
+            recency_score = 1.0  # Very active
+        elif days_since_post < 90:
+            recency_score = 0.8
+        elif days_since_post < 180:
+            recency_score = 0.5
+        elif days_since_post < 365:
+            recency_score = 0.3
+        else:
+            recency_score = 0.1  # Inactive
+        
+        # Combine: weight recency more (60%) than count (40%)
+        return (post_score * 0.4) + (recency_score * 0.6)
     
     def _get_specialization_score(self, specialization_tags) -> float:
         """
@@ -0,0 +1,179 @@
+"""
+Match Result Cache
+Reuse match results for identical survey answers and an unchanged therapist pool
+
+Results are cached under a hash of the parsed survey answers plus the
+therapist pool version (TherapistPoolVersion), which signals bump on
+every profile, verification, blog and availability change. A new version
+makes every older entry unreachable, so nothing has to be invalidated
+explicitly. Layer 3 match counts are not part of the version: new
+matches only shift collaborative scores slightly, and cached entries
+expire after MATCHING_RESULT_CACHE_TIMEOUT anyway.
+
+The learned collaborative model and the similar-patient index are
+different: their Layer 3 depends on who the patient is, not only on
+their answers. While either exists the key includes the patient id.
+Training the model bumps the pool version (it is rare and changes every
+score). The index changes one patient row at a time as outcomes arrive,
+so instead of the pool version its generation is part of the key: cached
+results follow the index while saved matches stay current.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import TherapistPoolVersion
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+RESULT_CACHE_PREFIX = 'matching:results:'
+POOL_VERSION_ID = 1
+
+
+class MatchInputs(NamedTuple):
+    """Everything a match result depends on besides the therapist data"""
+    answers: Dict
+    fingerprint: str
+    pool_version: int
+    # Set when results are specific to the patient (see personalization)
+    patient_id: Optional[int] = None
+    # Similar-patient index generation blended into Layer 3, if any
+    index_generation: Optional[int] = None
+
+
+def get_pool_version() -> int:
+    """Current therapist pool version (0 before the first change)"""
+    version = TherapistPoolVersion.objects.filter(pk=POOL_VERSION_ID).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_pool_version() -> None:
+    """Increment the therapist pool version"""
+    if TherapistPoolVersion.objects.filter(pk=POOL_VERSION_ID).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            TherapistPoolVersion.objects.create(pk=POOL_VERSION_ID, version=1)
+    except IntegrityError:
+        # Created concurrently
+        TherapistPoolVersion.objects.filter(pk=POOL_VERSION_ID).update(version=F('version') + 1)
+
+
+def bump_pool_version_on_commit() -> None:
+    """
+    Bump the version once the current transaction commits
+
+    Bumping earlier would let a concurrent request compute results from
+    the old data and cache them under the new version.
+    """
+    transaction.on_commit(bump_pool_version)
+
+
+def survey_fingerprint(answers: Dict) -> str:
+    """Stable hash of parsed survey answers (TherapistMatcher.answers)"""
+    payload = json.dumps(
+        sorted([str(question_id), answer] for question_id, answer in answers.items()),
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def personalization(patient_id: int) -> Tuple[Optional[int], Optional[int]]:
+    """
+    (patient id, similar-patient index generation) of MatchInputs
+
+    Both None while Layer 3 depends on the answers only; the patient id
+    alone with a collaborative model but no index.
+    """
+    from .collaborative_model import get_collaborative_model
+    from .patient_index import get_patient_index
+
+    generation = get_patient_index().generation()
+    if generation is None and not get_collaborative_model().exists:
+        return None, None
+    return patient_id, generation
+
+
+def matching_inputs(survey_response) -> MatchInputs:
+    """Parse the answers of a survey response and read the pool version"""
+    from .algorithm import parse_survey_answers
+
+    answers = parse_survey_answers(survey_response)
+    return MatchInputs(
+        answers, survey_fingerprint(answers), get_pool_version(), *personalization(survey_response.patient_id)
+    )
+
+
+def match_is_current(match, inputs: MatchInputs) -> bool:
+    """True when a saved match was fully computed from exactly these inputs"""
+    return (
+        match.pool_version == inputs.pool_version
+        and match.survey_fingerprint == inputs.fingerprint
+        and inputs.patient_id in (None, match.patient_id)
+        and not match.degraded
+    )
+
+
+def result_cache_key(inputs: MatchInputs, top_n: int) -> str:
+    key = f'{RESULT_CACHE_PREFIX}{inputs.pool_version}:{top_n}:{inputs.fingerprint}'
+    if inputs.patient_id is not None:
+        key += f':{inputs.patient_id}'
+    if inputs.index_generation is not None:
+        key += f':{inputs.index_generation}'
+    return key
+
+
+def get_cached_matches(
+    inputs: MatchInputs,
+    top_n: int,
+    exclude_id: Optional[int] = None,
+) -> Optional[Tuple[List[Tuple[User, float]], List[Dict]]]:
+    """
+    Cached (therapist, score) ranking and result dicts, or None on a miss
+
+    Entries that rank ``exclude_id`` (the patient, who is never their own
+    match) or a therapist that no longer exists count as misses.
+    """
+    entry = cache.get(result_cache_key(inputs, top_n))
+    if entry is None:
+        return None
+
+    therapist_ids = [therapist_id for therapist_id, _ in entry['ranked']]
+    if exclude_id in therapist_ids:
+        return None
+
+    therapists = User.objects.in_bulk(therapist_ids)
+    if len(therapists) != len(therapist_ids):
+        return None
+
+    ranked = [(therapists[therapist_id], score) for therapist_id, score in entry['ranked']]
+    return ranked, entry['results']
+
+
+def cache_matches(
+    inputs: MatchInputs,
+    top_n: int,
+    ranked: List[Tuple[User, float]],
+    results: List[Dict],
+) -> None:
+    """Store a ranking computed from ``inputs``"""
+    entry = {
+        'ranked': [(therapist.id, score) for therapist, score in ranked],
+        'results': results,
+    }
+    cache.set(
+        result_cache_key(inputs, top_n),
+        entry,
+        getattr(settings, 'MATCHING_RESULT_CACHE_TIMEOUT', 3600),
+    )
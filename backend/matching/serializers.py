@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import TherapistMatch
+from .models import TherapistMatch, MatchJob
 from accounts.models import TherapistProfile
 
 User = get_user_model()
@@ -82,10 +82,11 @@ class TherapistMatchSerializer(serializers.ModelSerializer):
             'top_match_3_score',
             'top_match_3_details',
             'matches',
+            'degraded',
             'matched_at',
             'updated_at',
         ]
-        read_only_fields = ['matched_at', 'updated_at']
+        read_only_fields = ['matched_at', 'updated_at', 'degraded']
     
     def get_matches(self, obj):
         """Return structured list of matches"""
@@ -103,4 +104,25 @@ class TherapistMatchSerializer(serializers.ModelSerializer):
                     'compatibility_percentage': round(score * 100, 1),
                 })
         
-        return matches
\ No newline at end of file
+        return matches
+
+
+class MatchJobSerializer(serializers.ModelSerializer):
+    """Status of an asynchronous matching job, with the match once finished"""
+    match = TherapistMatchSerializer(read_only=True)
+    
+    class Meta:
+        model = MatchJob
+        fields = [
+            'id',
+            'kind',
+            'status',
+            'survey_response',
+            'match',
+            'results',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+        read_only_fields = fields
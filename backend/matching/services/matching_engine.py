@@ -1,9 +1,6 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from django.utils import timezone
-from datetime import datetime
 
 from accounts.models import TherapistProfile, User
 from matching.models import (
@@ -13,6 +10,14 @@ from matching.models import (
     MatchingLog
 )
 from matching.services.text_processor import TextProcessor
+from matching.improved_matching import SPECIALIZATION_INDEX
+from matching.instrumentation import MatchingInstrumentation, NO_STAGE, save_matching_log
+from matching.tfidf_model import VECTORIZER_PARAMS, get_tfidf_model
+from backend.lazy_imports import lazy_import
+
+# Imported on first use (see backend.lazy_imports)
+sklearn_text = lazy_import('sklearn.feature_extraction.text')
+sklearn_pairwise = lazy_import('sklearn.metrics.pairwise')
 
 
 class MatchingEngine:
@@ -22,68 +27,76 @@ class MatchingEngine:
     
     def __init__(self):
         self.text_processor = TextProcessor()
-        self.vectorizer = TfidfVectorizer(
-            max_features=500,
-            stop_words='english',
-            ngram_range=(1, 2),  # Consider single words and bigrams
-            min_df=1,
-            max_df=0.8
-        )
+        # Per-request fallback until the persisted model is fitted
+        self.vectorizer = sklearn_text.TfidfVectorizer(**VECTORIZER_PARAMS)
+        self.instrumentation = None
+    
+    def _stage(self, name: str):
+        """Attribute work to a stage of the current request's instrumentation"""
+        if self.instrumentation is None:
+            return NO_STAGE
+        return self.instrumentation.stage(name)
     
     def generate_matches(
         self, 
         patient: User, 
-        top_n: int = 10
+        top_n: int = 10,
+        instrumentation: Optional[MatchingInstrumentation] = None
     ) -> List[TherapistMatch]:
         """
         Main method to generate therapist matches for a patient.
-        """
-        start_time = datetime.now()
-        
-        # Get patient's match profile
-        try:
-            patient_profile = PatientMatchProfile.objects.get(patient=patient)
-        except PatientMatchProfile.DoesNotExist:
-            raise ValueError("Patient must complete survey before matching")
-        
-        # Step 1: Apply hard filters
-        eligible_therapists = self._apply_hard_filters(patient_profile)
-        
-        if not eligible_therapists:
-            return []
         
-        # Step 2: Get or create therapist match profiles
-        therapist_profiles = []
-        for therapist in eligible_therapists:
-            profile, created = TherapistMatchProfile.objects.get_or_create(
-                therapist=therapist
-            )
-            therapist_profiles.append(profile)
-        
-        # Step 3: Calculate similarity scores
-        matches_data = self._calculate_similarities(
-            patient_profile,
-            therapist_profiles
-        )
-        
-        # Step 4: Apply weighted scoring
-        final_matches = self._apply_weighted_scoring(matches_data)
-        
-        # Step 5: Generate explanations and save matches
-        saved_matches = self._save_matches(
-            patient,
-            final_matches[:top_n]
-        )
+        Per-stage timings and query counts are collected in
+        ``instrumentation`` (a new one by default) and logged to MatchingLog.
+        """
+        self.instrumentation = instrumentation or MatchingInstrumentation()
+        
+        with self.instrumentation.activate():
+            # Get patient's match profile
+            with self._stage('preferences'):
+                try:
+                    patient_profile = PatientMatchProfile.objects.get(patient=patient)
+                except PatientMatchProfile.DoesNotExist:
+                    raise ValueError("Patient must complete survey before matching")
+            
+            with self._stage('layer1'):
+                # Step 1: Apply hard filters
+                eligible_therapists = self._apply_hard_filters(patient_profile)
+                
+                # Step 2: Get or create therapist match profiles
+                therapist_profiles = []
+                for therapist in eligible_therapists:
+                    profile, created = TherapistMatchProfile.objects.get_or_create(
+                        therapist=therapist
+                    )
+                    therapist_profiles.append(profile)
+            
+            if not eligible_therapists:
+                return []
+            
+            # Step 3: Calculate similarity scores
+            with self._stage('layer2'):
+                matches_data = self._calculate_similarities(
+                    patient_profile,
+                    therapist_profiles
+                )
+            
+            # Step 4: Apply weighted scoring
+            final_matches = self._apply_weighted_scoring(matches_data)
+            
+            # Step 5: Generate explanations and save matches
+            with self._stage('reasons'):
+                saved_matches = self._save_matches(
+                    patient,
+                    final_matches[:top_n]
+                )
         
         # Log the matching request
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds() * 1000
-        
         self._log_matching_request(
             patient=patient,
             eligible_count=len(eligible_therapists),
             matches_count=len(saved_matches),
-            processing_time=processing_time,
+            processing_time=self.instrumentation.total.wall_ms,
             filters=self._get_applied_filters(patient_profile)
         )
         
@@ -126,26 +139,20 @@ class MatchingEngine:
     ) -> List[Dict]:
         """
         Calculate TF-IDF cosine similarity between patient and therapists.
-        """
-        # Prepare documents
-        documents = [patient_profile.needs_text]
-        documents.extend([tp.profile_text for tp in therapist_profiles])
-        
-        # Generate TF-IDF vectors
-        try:
-            tfidf_matrix = self.vectorizer.fit_transform(documents)
-        except Exception as e:
-            print(f"Error in vectorization: {e}")
-            return []
-        
-        # Patient vector is the first one
-        patient_vector = tfidf_matrix[0:1]
-        
-        # Therapist vectors are the rest
-        therapist_vectors = tfidf_matrix[1:]
         
-        # Calculate cosine similarities
-        similarities = cosine_similarity(patient_vector, therapist_vectors)[0]
+        Uses the persisted model (matching.tfidf_model): only the patient
+        text is transformed. Therapists not in the model yet are scored
+        from their profile_text under the stored vocabulary.
+        """
+        similarities = get_tfidf_model().similarities(
+            patient_profile.needs_text,
+            [tp.therapist.user_id for tp in therapist_profiles],
+            [tp.profile_text for tp in therapist_profiles],
+        )
+        if similarities is None:
+            similarities = self._fit_similarities(patient_profile, therapist_profiles)
+            if similarities is None:
+                return []
         
         # Combine with therapist data
         matches_data = []
@@ -158,6 +165,28 @@ class MatchingEngine:
         
         return matches_data
     
+    def _fit_similarities(
+        self,
+        patient_profile: PatientMatchProfile,
+        therapist_profiles: List[TherapistMatchProfile]
+    ) -> Optional[np.ndarray]:
+        """
+        Fit a vectorizer over this request's documents (no persisted model yet).
+        """
+        # Prepare documents
+        documents = [patient_profile.needs_text]
+        documents.extend([tp.profile_text for tp in therapist_profiles])
+        
+        # Generate TF-IDF vectors
+        try:
+            tfidf_matrix = self.vectorizer.fit_transform(documents)
+        except Exception as e:
+            print(f"Error in vectorization: {e}")
+            return None
+        
+        # Patient vector is the first one, therapist vectors are the rest
+        return sklearn_pairwise.cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
+    
     def _calculate_specialty_match(
         self,
         patient_issues: List[str],
@@ -165,6 +194,10 @@ class MatchingEngine:
     ) -> float:
         """
         Calculate how well therapist specializations match patient issues.
+        
+        An issue matches a specialization containing it (or contained in
+        it), or one in the same synonym category (e.g. 'ptsd' and
+        'trauma') according to the shared SPECIALIZATION_INDEX bitsets.
         """
         if not patient_issues or not therapist_specializations:
             return 0.0
@@ -173,9 +206,14 @@ class MatchingEngine:
         patient_issues_lower = [issue.lower() for issue in patient_issues]
         therapist_spec_lower = [spec.lower() for spec in therapist_specializations]
         
+        therapist_mask = SPECIALIZATION_INDEX.tags_mask(therapist_spec_lower)
+        
         # Count matches
         matches = 0
         for issue in patient_issues_lower:
+            if therapist_mask and SPECIALIZATION_INDEX.term_mask(issue) & therapist_mask:
+                matches += 1
+                continue
             for spec in therapist_spec_lower:
                 if issue in spec or spec in issue:
                     matches += 1
@@ -195,24 +233,27 @@ class MatchingEngine:
             therapist = match['therapist']
             
             # Calculate specialty match score
-            specialty_score = self._calculate_specialty_match(
-                patient_issues=match.get('patient_issues', []),
-                therapist_specializations=therapist.specialization_tags or []
-            )
+            with self._stage('spec'):
+                specialty_score = self._calculate_specialty_match(
+                    patient_issues=match.get('patient_issues', []),
+                    therapist_specializations=therapist.specialization_tags or []
+                )
             
             match['specialty_match_score'] = specialty_score
             
             # Weighted final score
             # 60% TF-IDF similarity, 40% specialty match
-            final_score = (
-                0.6 * match['similarity_score'] +
-                0.4 * specialty_score
-            )
+            with self._stage('composite'):
+                final_score = (
+                    0.6 * match['similarity_score'] +
+                    0.4 * specialty_score
+                )
             
             match['final_score'] = final_score
         
         # Sort by final score
-        matches_data.sort(key=lambda x: x['final_score'], reverse=True)
+        with self._stage('composite'):
+            matches_data.sort(key=lambda x: x['final_score'], reverse=True)
         
         return matches_data
     
@@ -302,8 +343,20 @@ class MatchingEngine:
         """
         Log matching request for analytics.
         """
+        if self.instrumentation is not None:
+            save_matching_log(
+                self.instrumentation,
+                'matching_engine',
+                patient=patient,
+                eligible_count=eligible_count,
+                matches_count=matches_count,
+                filters=filters
+            )
+            return
+        
         MatchingLog.objects.create(
             patient=patient,
+            matcher='matching_engine',
             eligible_therapists_count=eligible_count,
             matches_generated=matches_count,
             processing_time_ms=int(processing_time),
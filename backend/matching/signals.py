@@ -0,0 +1,209 @@
+"""
+Matching Signals
+Keep pre-computed matching data in sync with therapist profiles and blogs
+"""
+
+import logging
+from threading import Thread
+
+from django.db import close_old_connections, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import User, TherapistProfile, VerificationDocument
+from blogs.models import BlogPost
+from booking.models import Appointment, AppointmentFeedback, AppointmentReview, TherapistAvailability, TimeOffPeriod
+from booking.session_reports import SessionReport
+from .match_stats import match_slots, apply_match_change, use_materialized_stats
+from .quality_scorer import invalidate_quality_score
+from .improved_matching import refresh_therapist_specialization_mask
+from .models import TherapistMatch, BlogSection, PatientMatchFeatures
+from .blog_sections import refresh_post_sections
+from .ann_index import refresh_ann_therapist
+from .patient_index import get_patient_index, refresh_similar_patient
+from .capacity import capacity_mode, refresh_capacity
+from .result_cache import bump_pool_version_on_commit
+from .tfidf_model import get_tfidf_model, refresh_tfidf_therapist
+from .embedding_store import (
+    get_embedding_store,
+    bio_key,
+    blog_post_prefix,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _run_after_commit(func, *args):
+    """Run ``func`` in a background thread once the current transaction commits"""
+    def target():
+        try:
+            func(*args)
+        except Exception as e:
+            logger.warning(f"[MATCHING] Background refresh {func.__name__}{args} failed: {e}")
+        finally:
+            close_old_connections()
+
+    transaction.on_commit(lambda: Thread(target=target, daemon=True).start())
+
+
+def _refresh_capacity_on_commit(therapist_id: int) -> None:
+    """Recount a therapist's free slots once the change commits (only when the matcher uses them)"""
+    if capacity_mode() is not None:
+        _run_after_commit(refresh_capacity, [therapist_id])
+
+
+def refresh_bio_embedding(therapist_id: int, bio: str) -> None:
+    """Encode (or drop) a therapist's bio in the embedding store"""
+    from .algorithm import EMBEDDINGS_AVAILABLE, encode_texts
+
+    store = get_embedding_store()
+    if not bio:
+        store.remove([bio_key(therapist_id)])
+    elif EMBEDDINGS_AVAILABLE:
+        store.ensure([(bio_key(therapist_id), bio)], encode_texts)
+
+    refresh_ann_therapist(therapist_id)
+
+
+def refresh_blog_sections(post_id: int, author_id: int) -> None:
+    """Rebuild the stored sections of a post (removed if it is no longer published)"""
+    from .algorithm import EMBEDDINGS_AVAILABLE, encode_texts
+
+    post = BlogPost.objects.filter(id=post_id).first()
+    if post is not None:
+        refresh_post_sections([post], encode_texts if EMBEDDINGS_AVAILABLE else None)
+
+    # Sections used to live in the embedding store; drop any leftovers
+    store = get_embedding_store()
+    prefix = blog_post_prefix(post_id)
+    if store.keys_with_prefix(prefix):
+        store.remove(prefix=prefix)
+
+    refresh_ann_therapist(author_id)
+    refresh_tfidf_therapist(author_id)
+
+
+@receiver(post_save, sender=TherapistProfile)
+def therapist_profile_saved(sender, instance, **kwargs):
+    """Refresh cached profile data; re-embed the bio only when its text changed"""
+    invalidate_quality_score(instance.user_id)
+    refresh_therapist_specialization_mask(instance.user_id, instance.specialization_tags)
+    bump_pool_version_on_commit()
+    _refresh_capacity_on_commit(instance.user_id)
+
+    key = bio_key(instance.user_id)
+    store = get_embedding_store()
+
+    if instance.bio:
+        if store.missing([(key, instance.bio)]):
+            _run_after_commit(refresh_bio_embedding, instance.user_id, instance.bio)
+    elif key in store:
+        _run_after_commit(refresh_bio_embedding, instance.user_id, '')
+    
+    if get_tfidf_model().exists():
+        _run_after_commit(refresh_tfidf_therapist, instance.user_id)
+
+
+@receiver(post_save, sender=BlogPost)
+def blog_post_saved(sender, instance, **kwargs):
+    """Published or edited posts get their sections rebuilt, unpublished ones lose them"""
+    invalidate_quality_score(instance.author_id)
+    if instance.status == 'published' or BlogSection.objects.filter(post_id=instance.id).exists():
+        bump_pool_version_on_commit()
+        _run_after_commit(refresh_blog_sections, instance.id, instance.author_id)
+
+
+@receiver(post_delete, sender=BlogPost)
+def blog_post_deleted(sender, instance, **kwargs):
+    invalidate_quality_score(instance.author_id)
+    bump_pool_version_on_commit()
+    _run_after_commit(refresh_blog_sections, instance.id, instance.author_id)
+
+
+@receiver(post_save, sender=VerificationDocument)
+def verification_document_saved(sender, instance, **kwargs):
+    """Verification feeds the quality score"""
+    invalidate_quality_score(instance.therapist_profile.user_id)
+    bump_pool_version_on_commit()
+
+
+@receiver(post_save, sender=User)
+def therapist_user_saved(sender, instance, update_fields=None, **kwargs):
+    """Gender and active status feed the hard rules; logins change nothing"""
+    if instance.role != 'therapist' or update_fields == frozenset(['last_login']):
+        return
+    bump_pool_version_on_commit()
+
+
+@receiver(post_save, sender=TherapistAvailability)
+@receiver(post_delete, sender=TherapistAvailability)
+@receiver(post_save, sender=TimeOffPeriod)
+@receiver(post_delete, sender=TimeOffPeriod)
+def therapist_availability_changed(sender, instance, **kwargs):
+    bump_pool_version_on_commit()
+    if sender is TimeOffPeriod:
+        _refresh_capacity_on_commit(instance.therapist_id)
+
+
+@receiver(pre_save, sender=TherapistMatch)
+def therapist_match_saving(sender, instance, **kwargs):
+    """Remember the previous slots so a rematch can be applied as a delta"""
+    if not use_materialized_stats():
+        return
+    previous = None
+    if instance.pk:
+        previous = TherapistMatch.objects.filter(pk=instance.pk).first()
+    instance._previous_slots = match_slots(previous) if previous else (set(), None)
+
+
+@receiver(post_save, sender=TherapistMatch)
+def therapist_match_saved(sender, instance, **kwargs):
+    """Keep TherapistMatchStats in step (only maintained while it is read)"""
+    if not use_materialized_stats():
+        return
+    apply_match_change(getattr(instance, '_previous_slots', (set(), None)), match_slots(instance))
+    instance._previous_slots = match_slots(instance)
+
+
+@receiver(post_delete, sender=TherapistMatch)
+def therapist_match_deleted(sender, instance, **kwargs):
+    if not use_materialized_stats():
+        return
+    apply_match_change(match_slots(instance), (set(), None))
+
+
+def _refresh_similar_patient_on_commit(patient_id: int) -> None:
+    if get_patient_index().exists():
+        _run_after_commit(refresh_similar_patient, patient_id)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    """
+    Bookings and cancellations change the therapist's free slots; completed
+    appointments and no-shows are outcomes for the similar-patient index
+    """
+    _refresh_capacity_on_commit(instance.therapist_id)
+    if instance.status in ('completed', 'no_show'):
+        _refresh_similar_patient_on_commit(instance.patient_id)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    _refresh_capacity_on_commit(instance.therapist_id)
+
+
+@receiver(post_save, sender=AppointmentFeedback)
+@receiver(post_save, sender=AppointmentReview)
+@receiver(post_save, sender=SessionReport)
+def appointment_outcome_saved(sender, instance, **kwargs):
+    """New feedback updates that patient's row of the similar-patient index"""
+    if get_patient_index().exists():
+        _run_after_commit(refresh_similar_patient, instance.appointment.patient_id)
+
+
+@receiver(post_save, sender=PatientMatchFeatures)
+def patient_features_saved(sender, instance, **kwargs):
+    """A new survey embedding moves the patient in the similar-patient index"""
+    if get_patient_index().exists():
+        _run_after_commit(refresh_similar_patient, instance.survey_response.patient_id)
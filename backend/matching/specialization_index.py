@@ -0,0 +1,54 @@
+"""
+Specialization Synonym Index
+Maps free-text issues and tags to synonym categories as bitsets
+
+A term belongs to a category when any of the category's synonyms occurs
+in it (substring match, as in calculate_semantic_specialization_match).
+Each category gets one bit, so "issue and tag share a category" becomes
+``issue_mask & tag_mask``, and a therapist's tags can be folded into a
+single mask.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+from .keyword_automaton import KeywordAutomaton
+
+
+class SpecializationIndex:
+    """
+    Inverted index from synonyms to category bits
+
+    Build once from a {category: [synonyms]} mapping (see
+    improved_matching.SPECIALIZATION_SYNONYMS) and reuse.
+    """
+
+    def __init__(self, synonyms: Dict[str, List[str]], cache_size: int = 4096):
+        self.categories: List[str] = list(synonyms)
+
+        # synonym -> OR of the bits of every category listing it
+        self._synonym_bits: Dict[str, int] = {}
+        for category_id, category in enumerate(self.categories):
+            for synonym in synonyms[category]:
+                self._synonym_bits[synonym] = self._synonym_bits.get(synonym, 0) | (1 << category_id)
+
+        self._automaton = KeywordAutomaton(self._synonym_bits)
+        self.term_mask = lru_cache(maxsize=cache_size)(self._term_mask)
+
+    def _term_mask(self, term: str) -> int:
+        """Category bits of a lower-cased term"""
+        mask = 0
+        for synonym in self._automaton.find_all(term):
+            mask |= self._synonym_bits[synonym]
+        return mask
+
+    def tags_mask(self, tags: Iterable[str]) -> int:
+        """OR of the category bits of every (lower-cased) tag"""
+        mask = 0
+        for tag in tags:
+            mask |= self.term_mask(tag)
+        return mask
+
+    def category_names(self, mask: int) -> List[str]:
+        """Categories set in ``mask`` (for debugging and explanations)"""
+        return [category for category_id, category in enumerate(self.categories) if mask >> category_id & 1]
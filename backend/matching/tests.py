@@ -1,8 +1,14 @@
-from django.test import TestCase
+import numpy as np
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from blogs.models import BlogPost
 from surveys.models import Survey, SurveyResponse
 from .algorithm import TherapistMatcher
-from .models import TherapistMatch
+from .models import TherapistMatch, TherapistMatchStats
+from .match_stats import aggregate_match_stats, rebuild_match_stats
+from .quality_scorer import TherapistQualityScorer, quality_cache_key
 
 User = get_user_model()
 
@@ -52,3 +58,1717 @@ class TherapistMatcherTestCase(TestCase):
         matcher = TherapistMatcher(self.response)
         matches = matcher.find_best_matches(top_n=3)
         self.assertIsInstance(matches, list)
+
+
+class EmbeddingStoreTestCase(TestCase):
+    """Test the persistent therapist embedding store"""
+    
+    def setUp(self):
+        import tempfile
+        from .embedding_store import EmbeddingStore
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = EmbeddingStore(self.tmpdir.name)
+        self.encoded = []
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def fake_encoder(self, texts):
+        import numpy as np
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+    
+    def test_only_new_or_changed_texts_are_encoded(self):
+        """Unchanged texts are reused, edited texts are re-encoded"""
+        self.store.ensure([('bio:1', 'calm'), ('bio:2', 'anxiety')], self.fake_encoder)
+        self.store.ensure([('bio:1', 'calm'), ('bio:2', 'anxiety care')], self.fake_encoder)
+        self.assertEqual(self.encoded, ['calm', 'anxiety', 'anxiety care'])
+        self.assertEqual(len(self.store), 2)
+    
+    def test_store_is_persisted_and_scored(self):
+        """A second store instance reads vectors written by the first"""
+        from .embedding_store import EmbeddingStore
+        
+        self.store.ensure([('bio:1', 'a'), ('blog:5:0', 'longer text')], self.fake_encoder)
+        reopened = EmbeddingStore(self.tmpdir.name)
+        similarities, rows = reopened.score([1.0, 1.0, 0.0])
+        self.assertEqual(set(rows), {'bio:1', 'blog:5:0'})
+        self.assertAlmostEqual(float(similarities[rows['bio:1']]), 1.0, places=5)
+        self.assertLess(float(similarities[rows['blog:5:0']]), 1.0)
+    
+    def test_remove_by_prefix_compacts_rows(self):
+        """Removing a post's sections keeps remaining rows addressable"""
+        self.store.ensure(
+            [('blog:5:0', 'x'), ('bio:1', 'yy'), ('blog:5:1', 'zzz')],
+            self.fake_encoder
+        )
+        self.assertEqual(self.store.remove(prefix='blog:5:'), 2)
+        similarities, rows = self.store.score([2.0, 1.0, 0.0])
+        self.assertEqual(list(rows), ['bio:1'])
+        self.assertEqual(len(similarities), 1)
+
+
+class VectorizedScoringTestCase(TestCase):
+    """The NumPy scoring path must reproduce the per-therapist scores exactly"""
+    
+    def test_composite_scores_match_scalar_path(self):
+        import random
+        import numpy as np
+        from .improved_matching import calculate_composite_score
+        from .vectorized import composite_scores
+        
+        rng = random.Random(7)
+        rows = [[rng.random() for _ in range(4)] for _ in range(500)]
+        rows += [[0.5, 0.5, 0.5, 0.2], [1.0, 0.0, 0.3, 0.8], [0.0, 0.0, 0.0, 0.0]]
+        
+        for completion in (0.2, 0.6, 0.9):
+            layer2, layer3, spec, activity = (np.array(col) for col in zip(*rows))
+            vector = composite_scores(layer2, layer3, spec, activity, completion)
+            scalar = [calculate_composite_score(l2, l3, sp, act, completion) for l2, l3, sp, act in rows]
+            self.assertEqual([float(v) for v in vector], scalar)
+    
+    def test_top_n_keeps_stable_tie_order(self):
+        from .vectorized import top_n_indices
+        
+        scores = [0.4, 0.9, 0.7, 0.9, 0.7, 0.1, 0.7]
+        expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        for n in range(len(scores) + 1):
+            self.assertEqual(top_n_indices(scores, n), expected[:n])
+
+
+class HardRulesQueryTestCase(TestCase):
+    """Test that Layer 1 runs in the database with the same outcome"""
+    
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@example.com', password='testpass123', role='patient', gender='female'
+        )
+        self.female = User.objects.create_user(
+            email='female@example.com', password='testpass123', role='therapist', gender='female'
+        )
+        self.male = User.objects.create_user(
+            email='male@example.com', password='testpass123', role='therapist', gender='male'
+        )
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        response = SurveyResponse.objects.create(patient=self.patient, survey=survey, status='submitted')
+        self.matcher = TherapistMatcher(response)
+    
+    def test_query_agrees_with_layer1(self):
+        preferences = {'gender': 'Female', 'consultation_mode': 'online', 'languages': ['Nepali']}
+        filtered = set(
+            User.objects.filter(role='therapist').filter(self.matcher._hard_rules_query(preferences))
+        )
+        expected = {
+            therapist for therapist in (self.female, self.male)
+            if self.matcher._layer1_hard_rules(therapist, preferences)['passed']
+        }
+        self.assertEqual(filtered, expected)
+        self.assertEqual(filtered, {self.female})
+    
+    def test_no_preference_keeps_everyone(self):
+        query = self.matcher._hard_rules_query({'gender': None})
+        self.assertEqual(User.objects.filter(role='therapist').filter(query).count(), 2)
+
+    def test_whitespace_is_ignored_on_both_sides(self):
+        from .vectorized import hard_rule_mask
+        
+        User.objects.filter(pk=self.male.pk).update(gender=' Male ')
+        self.male.refresh_from_db()
+        therapists = User.objects.filter(role='therapist')
+        for gender in (' male ', '   '):
+            preferences = {'gender': gender}
+            filtered = set(therapists.filter(self.matcher._hard_rules_query(preferences)))
+            expected = {
+                therapist for therapist in (self.female, self.male)
+                if self.matcher._layer1_hard_rules(therapist, preferences)['passed']
+            }
+            mask = hard_rule_mask([therapist.gender for therapist in (self.female, self.male)], gender)
+            self.assertEqual(filtered, expected)
+            self.assertEqual(expected, {t for t, ok in zip((self.female, self.male), mask) if ok})
+        self.assertEqual(set(therapists.filter(self.matcher._hard_rules_query({'gender': ' male '}))), {self.male})
+
+
+class MatchStatsTestCase(TestCase):
+    """Test the Layer 3 match statistics and their materialized table"""
+    
+    def setUp(self):
+        self.therapists = [
+            User.objects.create_user(email=f'therapist{i}@example.com', password='testpass123', role='therapist')
+            for i in range(3)
+        ]
+        self.survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+    
+    def _create_match(self, index, first, second=None, third=None):
+        patient = User.objects.create_user(email=f'patient{index}@example.com', password='testpass123', role='patient')
+        response = SurveyResponse.objects.create(patient=patient, survey=self.survey, status='submitted')
+        return TherapistMatch.objects.create(
+            patient=patient, survey_response=response,
+            top_match_1=first, top_match_2=second, top_match_3=third,
+        )
+    
+    def _materialized(self):
+        return {
+            stats.therapist_id: (stats.match_count, stats.first_choice_count)
+            for stats in TherapistMatchStats.objects.all()
+        }
+    
+    def _expected(self):
+        return {tid: stats for tid, stats in aggregate_match_stats().items() if stats[0]}
+    
+    def test_aggregate_matches_per_therapist_counts(self):
+        a, b, c = self.therapists
+        self._create_match(1, a, b, c)
+        self._create_match(2, b, a)
+        self._create_match(3, a)
+        
+        stats = aggregate_match_stats([a.id, b.id, c.id])
+        self.assertEqual(stats, {a.id: (3, 2), b.id: (2, 1), c.id: (1, 0)})
+    
+    def test_aggregate_counts_a_repeated_therapist_once(self):
+        a, b, c = self.therapists
+        self._create_match(1, a, a, b)
+        self._create_match(2, b, a)
+        
+        with self.assertNumQueries(4):
+            stats = aggregate_match_stats([a.id, b.id, c.id])
+        self.assertEqual(stats, {a.id: (2, 1), b.id: (2, 1), c.id: (0, 0)})
+        self.assertEqual(aggregate_match_stats(), {a.id: (2, 1), b.id: (2, 1)})
+    
+    @override_settings(MATCHING_MATERIALIZED_MATCH_STATS=True)
+    def test_table_follows_create_rematch_and_delete(self):
+        a, b, c = self.therapists
+        match = self._create_match(1, a, b)
+        self._create_match(2, b, c)
+        self.assertEqual(self._materialized(), self._expected())
+        
+        match.top_match_1, match.top_match_2, match.top_match_3 = c, a, None
+        match.save()
+        self.assertEqual(self._materialized(), self._expected())
+        
+        match.delete()
+        self.assertEqual(
+            {tid: stats for tid, stats in self._materialized().items() if stats[0]},
+            self._expected(),
+        )
+        
+        rebuild_match_stats()
+        self.assertEqual(self._materialized(), self._expected())
+    
+    def test_table_untouched_while_disabled(self):
+        a, b, _ = self.therapists
+        self._create_match(1, a, b)
+        self.assertEqual(TherapistMatchStats.objects.count(), 0)
+    
+    def test_decrements_never_go_below_zero(self):
+        a, b, c = self.therapists
+        match = self._create_match(1, a, b)  # Saved before the table was maintained
+        
+        with override_settings(MATCHING_MATERIALIZED_MATCH_STATS=True):
+            match.top_match_1, match.top_match_2 = c, None
+            match.save()
+            match.delete()
+        
+        self.assertEqual(self._materialized(), {a.id: (0, 0), b.id: (0, 0), c.id: (0, 0)})
+
+
+class QualityScoreManyTestCase(TestCase):
+    """Test batch quality scoring and its cache"""
+    
+    def setUp(self):
+        cache.clear()
+        self.scorer = TherapistQualityScorer()
+        self.therapists = []
+        for i, profession in enumerate(['psychologist', 'counselor', 'other']):
+            therapist = User.objects.create_user(
+                email=f'therapist{i}@example.com', password='testpass123', role='therapist'
+            )
+            profile = therapist.therapist_profile
+            profile.profession_type = profession
+            profile.years_of_experience = i * 4
+            profile.specialization_tags = ['anxiety', 'trauma'][:i]
+            profile.save()
+            for j in range(i * 3):
+                BlogPost.objects.create(
+                    author=therapist, title=f'Post {i} {j}', content='Content', excerpt='Excerpt',
+                    status='published', published_at=timezone.now(),
+                )
+            self.therapists.append(therapist)
+    
+    def _pool(self):
+        return User.objects.filter(role='therapist').select_related('therapist_profile').order_by('id')
+    
+    def test_score_many_matches_single_scores(self):
+        therapists = list(self._pool())
+        scores = self.scorer.score_many(therapists)
+        for therapist in therapists:
+            self.assertEqual(scores[therapist.id], self.scorer.calculate_quality_score(therapist))
+    
+    def test_cache_is_invalidated_on_blog_publish(self):
+        therapist = self.therapists[0]
+        before = self.scorer.score_many(list(self._pool()))[therapist.id]
+        self.assertIn(quality_cache_key(therapist.id), cache)
+        
+        BlogPost.objects.create(
+            author=therapist, title='New post', content='Content', excerpt='Excerpt',
+            status='published', published_at=timezone.now(),
+        )
+        self.assertNotIn(quality_cache_key(therapist.id), cache)
+        self.assertGreater(self.scorer.score_many(list(self._pool()))[therapist.id], before)
+    
+    def test_pool_version_bump_invalidates_cached_scores(self):
+        from .result_cache import bump_pool_version, get_pool_version
+        
+        therapist = self.therapists[0]
+        version = get_pool_version()
+        cache.set(quality_cache_key(therapist.id, version), 0.01)  # Stale, as in another worker's local cache
+        self.assertEqual(self.scorer.score_many([therapist])[therapist.id], 0.01)
+        
+        bump_pool_version()
+        self.assertNotEqual(self.scorer.score_many([therapist])[therapist.id], 0.01)
+
+
+class IssueExtractionTestCase(TestCase):
+    """Test the compiled single-pass issue extractor"""
+    
+    def test_automaton_agrees_with_substring_checks(self):
+        from .keyword_automaton import KeywordAutomaton
+        
+        keywords = ['he', 'she', 'his', 'hers', 'sleep', 'sleep disorder', 'ptsd']
+        text = 'ushers with a sleep disorder'
+        automaton = KeywordAutomaton(keywords)
+        self.assertEqual(automaton.find_all(text), {k for k in keywords if k in text})
+    
+    def test_signal_counts_match_per_keyword_scan(self):
+        import re
+        from .improved_matching import COMPREHENSIVE_ISSUE_MAPPING, extract_issue_signals
+        
+        text = "i feel anxious and worried about the future.\\ni panic and can't sleep, insomnia"
+        signals = extract_issue_signals(text)
+        for issue, config in COMPREHENSIVE_ISSUE_MAPPING.items():
+            self.assertEqual(signals[issue], {
+                'keywords': sum(1 for keyword in config['keywords'] if keyword in text),
+                'patterns': sum(1 for pattern in config['patterns'] if re.search(pattern, text)),
+            })
+        # 'worried' is listed twice for anxiety and counts twice
+        self.assertEqual(signals['anxiety']['keywords'], 4)  # anxious, worried x2, panic
+
+
+class SpecializationIndexTestCase(TestCase):
+    """Test the synonym bitset index used for specialization matching"""
+    
+    def test_shared_category_is_a_bitset_intersection(self):
+        from .improved_matching import SPECIALIZATION_INDEX
+        
+        ptsd = SPECIALIZATION_INDEX.term_mask('ptsd')
+        self.assertIn('trauma', SPECIALIZATION_INDEX.category_names(ptsd))
+        self.assertTrue(ptsd & SPECIALIZATION_INDEX.tags_mask(['trauma-informed care']))
+        self.assertFalse(ptsd & SPECIALIZATION_INDEX.tags_mask(['grief counseling']))
+    
+    def test_cached_mask_follows_saved_tags(self):
+        from .improved_matching import (
+            therapist_specialization_masks,
+            calculate_semantic_specialization_match,
+            specialization_mask_cache_key,
+        )
+        
+        cache.clear()
+        therapist = User.objects.create_user(email='tags@example.com', password='testpass123', role='therapist')
+        profile = therapist.therapist_profile
+        profile.specialization_tags = ['Grief']
+        profile.save()
+        
+        profile.specialization_tags = ['Couples Counseling']
+        profile.save()
+        self.assertEqual(cache.get(specialization_mask_cache_key(therapist.id))[0], ['couples counseling'])
+        therapist.refresh_from_db()
+        
+        mask = therapist_specialization_masks([therapist])[therapist.id]
+        score = calculate_semantic_specialization_match(['relationship'], ['Couples Counseling'], mask)
+        self.assertEqual(score, calculate_semantic_specialization_match(['relationship'], ['Couples Counseling']))
+        self.assertEqual(score, 1.0)
+
+
+class BlogSectionTestCase(TestCase):
+    """Test pre-computed therapeutic blog sections"""
+    
+    def setUp(self):
+        self.therapist = User.objects.create_user(
+            email='writer@example.com', password='testpass123', role='therapist'
+        )
+        self.post = BlogPost.objects.create(
+            author=self.therapist, title='Coping', excerpt='Excerpt', status='published',
+            published_at=timezone.now(),
+            content='CBT can help manage anxiety.\n\nThe weather was nice.\n\nTherapy sessions support recovery.',
+        )
+        self.encoded = []
+    
+    def fake_encoder(self, texts):
+        import numpy as np
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+    
+    def test_sections_are_stored_once_and_dropped_on_unpublish(self):
+        from .blog_sections import refresh_post_sections, decode_embedding
+        from .models import BlogSection
+        
+        self.assertEqual(refresh_post_sections([self.post], self.fake_encoder), 1)
+        sections = list(BlogSection.objects.filter(post=self.post))
+        self.assertEqual(len(sections), 2)
+        self.assertGreaterEqual(sections[0].relevance, sections[1].relevance)
+        self.assertAlmostEqual(float(np.linalg.norm(decode_embedding(sections[0].embedding))), 1.0, places=5)
+        
+        # Unchanged post: nothing re-encoded
+        self.assertEqual(refresh_post_sections([self.post], self.fake_encoder), 0)
+        self.assertEqual(len(self.encoded), 2)
+        
+        self.post.status = 'draft'
+        self.assertEqual(refresh_post_sections([self.post], self.fake_encoder), 1)
+        self.assertFalse(BlogSection.objects.filter(post=self.post).exists())
+
+
+class MatchJobTestCase(TestCase):
+    """Test asynchronous matching jobs"""
+    
+    def setUp(self):
+        from rest_framework.test import APIClient
+        
+        self.patient = User.objects.create_user(email='async@example.com', password='testpass123', role='patient')
+        self.therapist = User.objects.create_user(
+            email='async-therapist@example.com', password='testpass123', role='therapist', gender='female'
+        )
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        self.response = SurveyResponse.objects.create(patient=self.patient, survey=survey, status='submitted')
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+    
+    def test_async_find_matches_returns_job_and_completes(self):
+        from .jobs import run_job
+        from .models import MatchJob
+        
+        response = self.client.post(
+            '/api/matching/matches/find_matches/',
+            {'survey_response_id': self.response.id, 'async': True},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        self.assertEqual(MatchJob.objects.get(id=job_id).status, 'pending')
+        self.assertFalse(TherapistMatch.objects.exists())
+        
+        job = run_job(job_id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.match.top_match_1, self.therapist)
+        self.assertIsNone(run_job(job_id))  # already claimed
+        
+        status_response = self.client.get(f'/api/matching/jobs/{job_id}/')
+        self.assertEqual(status_response.data['status'], 'completed')
+        self.assertEqual(status_response.data['results'][0]['therapist_id'], self.therapist.id)
+        
+        stream = self.client.get(f'/api/matching/jobs/{job_id}/stream/')
+        body = b''.join(stream.streaming_content).decode()
+        self.assertIn('retry: ', body)
+        self.assertIn('event: result', body)
+
+    def test_asgi_stream_waits_for_the_job_without_blocking(self):
+        from asgiref.sync import async_to_sync
+        from .models import MatchJob
+        from .views import _job_events
+
+        async def collect(job, timeout):
+            return [event.split('\n')[0] async for event in _job_events(MatchJob.objects.all(), job, 0.01, timeout)]
+
+        job = MatchJob.objects.create(patient=self.patient, survey_response=self.response)
+        self.assertEqual(async_to_sync(collect)(job, 0), ['event: status', 'event: timeout'])
+
+        MatchJob.objects.filter(pk=job.pk).update(status='completed')
+        self.assertEqual(
+            async_to_sync(collect)(job, 5),
+            ['event: status', 'event: status', 'event: result'],
+        )
+
+    def test_sync_find_matches_still_returns_results(self):
+        response = self.client.post(
+            '/api/matching/matches/find_matches/',
+            {'survey_response_id': self.response.id},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['therapist_id'], self.therapist.id)
+        self.assertEqual(TherapistMatch.objects.get().top_match_1, self.therapist)
+    
+    def test_submitted_assessment_precomputes_features(self):
+        from unittest import mock
+        from .jobs import run_job, run_matching
+        from .models import MatchJob, PatientMatchFeatures
+        
+        self.response.status = 'in_progress'
+        self.response.save()
+        response = self.client.post(
+            '/api/surveys/responses/submit_assessment/',
+            {'response_id': self.response.id},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        
+        job = MatchJob.objects.get(kind='features')
+        self.assertEqual(run_job(job.id).status, 'completed')
+        features = PatientMatchFeatures.objects.get(survey_response=self.response)
+        self.assertIn('gender', features.preferences)
+        
+        with mock.patch.object(TherapistMatcher, '_extract_preferences') as extract:
+            match, _ = run_matching(self.response)
+        extract.assert_not_called()
+        self.assertEqual(match.top_match_1, self.therapist)
+
+
+class IVFIndexTestCase(TestCase):
+    """Test approximate nearest-neighbour candidate retrieval"""
+    
+    def setUp(self):
+        import tempfile
+        from .ann_index import IVFIndex, KIND_BIO, KIND_SECTION
+        
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(60, 8)).astype(np.float32)
+        owners = [i // 3 for i in range(60)]
+        kinds = [KIND_BIO if i % 3 == 0 else KIND_SECTION for i in range(60)]
+        keys = [f'v:{i}' for i in range(60)]
+        
+        self.index = IVFIndex(self.directory)
+        self.index.build(keys, owners, kinds, self.vectors, n_clusters=4)
+    
+    def test_probing_every_cluster_is_exact(self):
+        queries = np.random.default_rng(1).normal(size=(10, 8))
+        self.assertEqual(self.index.recall_at_k(queries, k=5, nprobe=4), 1.0)
+        self.assertEqual(self.index.search(queries[0], k=5, nprobe=4), self.index.exhaustive_search(queries[0], k=5))
+    
+    def test_allowed_restricts_results(self):
+        results = self.index.search(self.vectors[0], k=5, nprobe=4, allowed=[3, 7])
+        self.assertEqual({owner for owner, _ in results}, {3, 7})
+    
+    def test_replace_owner_is_persisted(self):
+        from .ann_index import IVFIndex, KIND_BIO
+        
+        self.index.replace_owner(0, ['v:new'], [KIND_BIO], -self.vectors[:1])
+        reloaded = IVFIndex(self.directory)
+        self.assertEqual(len(reloaded), 58)
+        self.assertNotEqual(reloaded.search(self.vectors[0], k=1, nprobe=4)[0][0], 0)
+        
+        self.index.replace_owner(1, [], [], None)
+        self.assertNotIn(1, IVFIndex(self.directory).therapist_ids())
+
+
+class ResultCacheTestCase(TestCase):
+    """Test match result reuse by survey fingerprint and pool version"""
+    
+    def setUp(self):
+        from rest_framework.test import APIClient
+        
+        cache.clear()
+        self.therapist = User.objects.create_user(
+            email='cache-therapist@example.com', password='testpass123', role='therapist', gender='female'
+        )
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        self.patients = [
+            User.objects.create_user(email=f'cache{i}@example.com', password='testpass123', role='patient')
+            for i in range(2)
+        ]
+        self.responses = [
+            SurveyResponse.objects.create(patient=patient, survey=survey, status='submitted')
+            for patient in self.patients
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.patients[0])
+    
+    def test_identical_answers_reuse_cached_ranking(self):
+        from unittest import mock
+        from .jobs import run_matching
+        
+        with mock.patch.object(TherapistMatcher, 'find_best_matches', autospec=True,
+                               side_effect=TherapistMatcher.find_best_matches) as find:
+            first, first_results = run_matching(self.responses[0])
+            second, second_results = run_matching(self.responses[1])
+        
+        self.assertEqual(find.call_count, 1)
+        self.assertEqual(second.top_match_1, self.therapist)
+        self.assertEqual(second_results, first_results)
+        self.assertEqual(second.survey_fingerprint, first.survey_fingerprint)
+    
+    def test_rematch_recomputes_only_after_pool_change(self):
+        from booking.models import TherapistAvailability
+        from .jobs import run_matching
+        from .result_cache import get_pool_version
+        
+        match, _ = run_matching(self.responses[0])
+        url = f'/api/matching/matches/{match.id}/rematch/'
+        
+        response = self.client.post(url)
+        self.assertEqual(response.data['message'], 'Matches are already up to date')
+        
+        version = get_pool_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            TherapistAvailability.objects.create(
+                therapist=self.therapist, day_of_week='monday', start_time='09:00', end_time='12:00'
+            )
+        self.assertEqual(get_pool_version(), version + 1)
+        
+        response = self.client.post(url)
+        self.assertEqual(response.data['message'], 'Matches updated')
+        match.refresh_from_db()
+        self.assertEqual(match.pool_version, version + 1)
+
+    def test_current_match_returns_results_after_cache_expiry(self):
+        from .jobs import run_matching
+
+        match, _ = run_matching(self.responses[0])
+        cache.clear()
+
+        same, results = run_matching(self.responses[0], match=match)
+        self.assertEqual(same.pk, match.pk)
+        self.assertEqual([result['therapist_id'] for result in results], [self.therapist.id])
+
+
+class InstrumentationTestCase(TestCase):
+    """Test per-stage instrumentation and benchmark reports"""
+    
+    def setUp(self):
+        self.patient = User.objects.create_user(email='timed@example.com', password='testpass123', role='patient')
+        self.therapist = User.objects.create_user(
+            email='timed-therapist@example.com', password='testpass123', role='therapist', gender='female'
+        )
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        self.response = SurveyResponse.objects.create(patient=self.patient, survey=survey, status='submitted')
+    
+    def test_matcher_records_stages_and_queries(self):
+        from .instrumentation import MatchingInstrumentation
+        
+        instrumentation = MatchingInstrumentation()
+        with instrumentation.activate():
+            matcher = TherapistMatcher(self.response, instrumentation=instrumentation)
+            therapist, _, breakdown = matcher.find_best_matches(top_n=3)[0]
+            matcher.generate_match_reasons(therapist, breakdown)
+        
+        report = instrumentation.as_dict()
+        for stage in ('preferences', 'layer1', 'layer3', 'spec', 'composite', 'reasons'):
+            self.assertIn(stage, report['stages'])
+        self.assertEqual(report['stages']['preferences']['queries'], 1)
+        self.assertGreaterEqual(report['stages']['layer1']['queries'], 1)
+        self.assertEqual(
+            report['total']['queries'],
+            sum(stats['queries'] for stats in report['stages'].values())
+        )
+    
+    def test_compare_reports_flags_regressions(self):
+        from .benchmarks.runner import compare_reports
+        from .instrumentation import summarize
+        
+        def run(latencies, queries):
+            return {
+                'pool_size': 100, 'matcher': 'TherapistMatcher', 'mode': 'loop',
+                'latency_ms': summarize(latencies), 'queries': summarize(queries),
+                'encoder_calls': summarize([0]),
+            }
+        
+        baseline = {'runs': [run([10, 12], [5, 5])]}
+        self.assertEqual(compare_reports(baseline, {'runs': [run([11, 12], [5, 5])]}), [])
+        regressions = compare_reports(baseline, {'runs': [run([10, 40], [5, 7])]})
+        self.assertEqual(len(regressions), 2)
+    
+    def test_run_matching_logs_stage_timings(self):
+        from rest_framework.test import APIClient
+        from .jobs import run_matching
+        from .models import MatchingLog
+        
+        cache.clear()
+        run_matching(self.response)
+        log = MatchingLog.objects.get()
+        self.assertEqual(log.matcher, 'therapist_matcher')
+        self.assertEqual(log.eligible_therapists_count, 1)
+        self.assertIn('layer1', log.stage_timings)
+        self.assertEqual(log.query_count, sum(stage['queries'] for stage in log.stage_timings.values()))
+        
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        self.assertEqual(client.get('/api/matching/ops/stats/').status_code, 403)
+        
+        admin = User.objects.create_user(email='ops@example.com', password='testpass123', role='admin', is_staff=True)
+        client.force_authenticate(admin)
+        response = client.get('/api/matching/ops/stats/?window=10')
+        self.assertEqual(response.status_code, 200)
+        stats = response.data['data']['therapist_matcher']
+        self.assertEqual(stats['requests'], 1)
+        self.assertIn('p95', stats['stages']['layer1']['wall_ms'])
+
+
+class BulkRematchTestCase(TestCase):
+    """Test the sharded bulk rematch command"""
+    
+    def setUp(self):
+        cache.clear()
+        self.therapists = [
+            User.objects.create_user(
+                email=f'bulk-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(2)
+        ]
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        self.responses = [
+            SurveyResponse.objects.create(
+                patient=User.objects.create_user(email=f'bulk{i}@example.com', password='testpass123', role='patient'),
+                survey=survey,
+                status='submitted',
+            )
+            for i in range(3)
+        ]
+        # In progress: not rematched
+        SurveyResponse.objects.create(
+            patient=User.objects.create_user(email='bulk-draft@example.com', password='testpass123', role='patient'),
+            survey=survey,
+        )
+        # A stale match: one therapist only, no fingerprint
+        self.stale = TherapistMatch.objects.create(
+            patient=self.responses[0].patient,
+            survey_response=self.responses[0],
+            top_match_1=self.therapists[0],
+        )
+    
+    def _rematch(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('rematch_all', '--workers', '0', '--shard-size', '2', *args, stdout=out)
+        return out.getvalue()
+    
+    def test_dry_run_reports_changes_without_saving(self):
+        output = self._rematch('--dry-run')
+        
+        self.assertIn(f'response {self.responses[0].id} ', output)
+        self.assertIn('3 rankings would change', output)
+        self.assertEqual(TherapistMatch.objects.count(), 1)
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.survey_fingerprint, '')
+    
+    def test_rematch_saves_and_resumes_from_checkpoint(self):
+        import json
+        import os
+        import tempfile
+        from .result_cache import matching_inputs
+        
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'rematch.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'last_response_id': self.responses[1].id}, f)
+        
+        output = self._rematch('--checkpoint', checkpoint)
+        self.assertIn('0 updated, 1 created', output)
+        self.assertFalse(os.path.exists(checkpoint))
+        
+        output = self._rematch()
+        self.assertIn('1 updated, 1 created, 1 up to date', output)
+        self.assertEqual(TherapistMatch.objects.count(), 3)
+        
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.survey_fingerprint, matching_inputs(self.responses[0]).fingerprint)
+        expected = TherapistMatcher(self.responses[0]).find_best_matches(top_n=3)
+        self.assertEqual(
+            [self.stale.top_match_1_id, self.stale.top_match_2_id, self.stale.top_match_3_id],
+            [therapist.id for therapist, _, _ in expected] + [None],
+        )
+
+
+class TfidfModelTestCase(TestCase):
+    """Test the persisted TF-IDF model used by MatchingEngine"""
+    
+    DOCUMENTS = [
+        'anxiety panic attacks cognitive behavioural therapy',
+        'couples therapy relationship communication trust',
+        'grief loss bereavement counseling support',
+        'trauma ptsd flashbacks emdr therapy',
+    ]
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test.utils import override_settings
+        
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(MATCHING_TFIDF_MODEL_DIR=directory, MATCHING_TFIDF_REFIT_FRACTION=0.5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def test_similarities_match_a_fresh_fit(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from .tfidf_model import VECTORIZER_PARAMS, TfidfModel, get_tfidf_model
+        
+        model = get_tfidf_model()
+        self.assertIsNone(model.similarities('panic', [1]))
+        model.fit([1, 2, 3, 4], self.DOCUMENTS)
+        
+        query = 'I have panic attacks and anxiety'
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS).fit(self.DOCUMENTS)
+        expected = (vectorizer.transform(self.DOCUMENTS) @ vectorizer.transform([query]).T).toarray().ravel()
+        
+        # Reloaded from disk by another process
+        reloaded = TfidfModel(model.directory)
+        scores = reloaded.similarities(query, [4, 3, 2, 1, 99], self.DOCUMENTS[::-1] + ['panic anxiety'])
+        np.testing.assert_allclose(scores[:4], expected[::-1])
+        self.assertGreater(scores[4], 0)
+        self.assertEqual(int(np.argmax(scores[:4])), 3)
+    
+    def test_replaced_rows_trigger_refit(self):
+        from .tfidf_model import get_tfidf_model
+        
+        model = get_tfidf_model()
+        model.fit([1, 2, 3, 4], self.DOCUMENTS)
+        
+        self.assertFalse(model.replace_owner(1, 'grief and loss'))
+        self.assertGreater(model.similarities('grief', [1])[0], 0)
+        self.assertFalse(model.replace_owner(2, None))
+        self.assertEqual(len(model), 3)
+        self.assertTrue(model.replace_owner(5, 'trauma'))
+
+
+class EmbeddingCacheTestCase(TestCase):
+    """Test the memory-mapped embedding cache shared by worker processes"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.encoded = []
+    
+    def _encoder(self, texts):
+        self.encoded.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype=np.float32)
+    
+    def _cache(self, max_bytes=1024):
+        from .embedding_cache import EmbeddingCache
+        return EmbeddingCache(self.directory, 'test-model', max_bytes)
+    
+    def test_vectors_are_shared_between_processes(self):
+        vectors = self._cache().encode(['calm', 'panic', 'calm'], self._encoder)
+        self.assertEqual(self.encoded, [['calm', 'panic']])
+        np.testing.assert_array_equal(vectors[:, 0], [4, 5, 4])
+        
+        # A second instance maps the same files, as another worker would
+        other = self._cache()
+        np.testing.assert_array_equal(other.encode(['panic', 'grief'], self._encoder)[:, 0], [5, 5])
+        self.assertEqual(self.encoded[-1], ['grief'])
+        self.assertEqual(len(other), 3)
+    
+    def test_slot_reused_during_read_is_a_miss(self):
+        from .embedding_cache import cache_digest
+        
+        cache = self._cache()
+        cache.encode(['calm'], self._encoder)
+        digest = cache_digest('test-model', 'calm')
+        slot = cache._slots[digest]
+        vectors = cache._vectors
+        
+        class ReusedWhileCopying:
+            # Another process evicts the slot and stores a new vector mid-copy
+            def __getitem__(self, index):
+                vector = np.array(vectors[index])
+                cache._digests[slot] = cache_digest('test-model', 'panic')
+                return vector
+        
+        cache._vectors = ReusedWhileCopying()
+        self.assertEqual(cache.get_many([digest]), {})
+    
+    def test_full_cache_evicts_least_recently_used(self):
+        import time
+        
+        cache = self._cache(max_bytes=4 * 4 * 10)  # 10 slots of 4 floats
+        texts = [f'text {i}' for i in range(10)]
+        cache.encode(texts, self._encoder)
+        time.sleep(0.01)
+        cache.encode(texts[1:], self._encoder)  # touch all but the first
+        
+        cache.encode(['new'], self._encoder)
+        self.assertEqual(len(cache), 10)
+        self.encoded.clear()
+        cache.encode(texts[1:], self._encoder)
+        self.assertEqual(self.encoded, [])
+        cache.encode(texts[:1], self._encoder)
+        self.assertEqual(self.encoded, [['text 0']])
+    
+    def test_encode_texts_reads_through_cache(self):
+        from unittest import mock
+        from django.test.utils import override_settings
+        from . import algorithm
+        
+        model = mock.Mock()
+        model.encode.side_effect = self._encoder
+        with override_settings(MATCHING_EMBEDDING_CACHE_DIR=self.directory), \
+                mock.patch.object(algorithm, 'get_embedding_model', return_value=model):
+            algorithm.encode_texts(['I feel anxious'])
+            vectors = algorithm.encode_texts(['I feel anxious', 'I feel sad'])
+        
+        self.assertEqual(self.encoded, [['I feel anxious'], ['I feel sad']])
+        self.assertEqual(vectors.shape, (2, 4))
+
+
+class EmbeddingServiceTestCase(TestCase):
+    """Test the Unix socket embedding service and its micro-batching"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        import threading
+        from .embedding_service import EmbeddingServer
+        
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.socket_path = f'{directory}/embeddings.sock'
+        self.batches = []
+        
+        def encoder(texts):
+            self.batches.append(list(texts))
+            return np.array([[len(text), 2.0] for text in texts], dtype=np.float32)
+        
+        self.server = EmbeddingServer(self.socket_path, encoder, max_batch=64, window=0.2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+    
+    def test_concurrent_requests_share_a_batch(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .embedding_service import encode_remote
+        
+        texts = [['a'], ['bb', 'ccc'], ['a', 'dddd']]
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(lambda batch: encode_remote(batch, self.socket_path, timeout=5), texts))
+        
+        for batch, vectors in zip(texts, results):
+            np.testing.assert_array_equal(vectors[:, 0], [len(text) for text in batch])
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(sorted(self.batches[0]), ['a', 'bb', 'ccc', 'dddd'])
+    
+    def test_encode_texts_falls_back_when_service_is_down(self):
+        from unittest import mock
+        from django.test.utils import override_settings
+        from . import algorithm, embedding_service
+        
+        model = mock.Mock()
+        model.encode.return_value = np.ones((1, 2), dtype=np.float32)
+        with override_settings(MATCHING_EMBEDDING_SOCKET=self.socket_path, MATCHING_EMBEDDING_CACHE_MAX_MB=0), \
+                mock.patch.object(algorithm, 'get_embedding_model', return_value=model):
+            np.testing.assert_array_equal(algorithm._model_encode(['hello']), [[5.0, 2.0]])
+            model.encode.assert_not_called()
+            
+            with mock.patch.object(embedding_service, '_UNAVAILABLE_UNTIL', 0.0):
+                with override_settings(MATCHING_EMBEDDING_SOCKET=f'{self.socket_path}.missing'):
+                    np.testing.assert_array_equal(algorithm._model_encode(['hello']), [[1.0, 1.0]])
+                self.assertGreater(embedding_service._UNAVAILABLE_UNTIL, 0.0)
+
+
+class LatencyBudgetTestCase(TestCase):
+    """Test Layer 2 fallbacks when encoding misses the latency budget"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        import threading
+        from django.test.utils import override_settings
+        from surveys.models import SurveyAnswer, SurveyQuestion
+        from .tfidf_model import get_tfidf_model
+        
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            MATCHING_TFIDF_MODEL_DIR=f'{directory}/tfidf',
+            MATCHING_EMBEDDING_STORE_DIR=f'{directory}/embeddings',
+            MATCHING_EMBEDDING_CACHE_MAX_MB=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.therapists = [
+            User.objects.create_user(
+                email=f'budget-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(2)
+        ]
+        get_tfidf_model().fit(
+            [therapist.id for therapist in self.therapists],
+            ['grief loss bereavement counseling', 'anxiety panic attacks cognitive behavioural therapy'],
+        )
+        
+        patient = User.objects.create_user(email='budget@example.com', password='testpass123', role='patient')
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        question = SurveyQuestion.objects.create(survey=survey, question_text='What brings you here', question_type='text')
+        self.response = SurveyResponse.objects.create(patient=patient, survey=survey, status='submitted')
+        SurveyAnswer.objects.create(response=self.response, question=question, answer_text='panic attacks and anxiety')
+        
+        # The encoder blocks until released, like a cold or overloaded model
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+    
+    def _encoder(self, texts):
+        self.release.wait(5)
+        return np.ones((len(texts), 4), dtype=np.float32)
+    
+    def _patched(self):
+        from contextlib import ExitStack
+        from unittest import mock
+        from . import algorithm
+        
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(algorithm, 'EMBEDDINGS_AVAILABLE', True))
+        stack.enter_context(mock.patch.object(algorithm, 'encode_texts', side_effect=self._encoder))
+        return stack
+    
+    def test_slow_encoder_falls_back_to_tfidf(self):
+        with self._patched():
+            matcher = TherapistMatcher(self.response, latency_budget_ms=20)
+            matches = matcher.find_best_matches()
+            vectorized = TherapistMatcher(self.response, latency_budget_ms=20).find_best_matches(vectorized=True)
+        
+        self.assertEqual(matcher.degraded_reasons, ['patient_embedding'])
+        therapist, score, breakdown = matches[0]
+        self.assertEqual(therapist, self.therapists[1])
+        self.assertTrue(breakdown['degraded'])
+        self.assertEqual(breakdown['layer2_semantic']['fallback'], 'tfidf')
+        self.assertGreater(breakdown['layer2_semantic']['score'], matches[1][2]['layer2_semantic']['score'])
+        self.assertEqual([(t.id, round(s, 9)) for t, s, _ in vectorized], [(t.id, round(s, 9)) for t, s, _ in matches])
+    
+    def test_degraded_match_is_upgraded_by_job(self):
+        from .jobs import run_job, run_matching
+        from .models import MatchJob
+        
+        with self._patched():
+            match, results = run_matching(self.response, latency_budget_ms=20)
+            self.assertTrue(match.degraded)
+            self.assertTrue(results[0]['degraded'])
+            
+            self.release.set()
+            job = MatchJob.objects.get(kind='rematch', match=match)
+            self.assertEqual(run_job(job.id).status, 'completed')
+        
+        match.refresh_from_db()
+        self.assertFalse(match.degraded)
+
+
+class BatchMatchingTestCase(TestCase):
+    """Test cohort matching with one patient x therapist similarity matrix"""
+    
+    BIOS = [
+        'Anxiety and panic attacks with cognitive behavioural therapy',
+        'Grief, loss and bereavement counseling',
+        'Couples therapy for relationship problems and trust',
+    ]
+    ANSWERS = ['panic attacks and anxiety', 'grieving the loss of my father', 'arguing with my partner']
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test.utils import override_settings
+        from surveys.models import SurveyAnswer, SurveyQuestion
+        
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            MATCHING_EMBEDDING_STORE_DIR=directory,
+            MATCHING_EMBEDDING_CACHE_MAX_MB=0,
+            MATCHING_ANN_CANDIDATES=None,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        for i, bio in enumerate(self.BIOS):
+            therapist = User.objects.create_user(
+                email=f'batch-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            profile = therapist.therapist_profile
+            profile.bio = bio
+            profile.specialization_tags = [['anxiety'], ['grief'], []][i]
+            profile.save()
+        
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        question = SurveyQuestion.objects.create(survey=survey, question_text='What brings you here', question_type='text')
+        self.responses = []
+        for i, text in enumerate(self.ANSWERS):
+            patient = User.objects.create_user(email=f'batch{i}@example.com', password='testpass123', role='patient')
+            response = SurveyResponse.objects.create(patient=patient, survey=survey, status='submitted')
+            SurveyAnswer.objects.create(response=response, question=question, answer_text=text)
+            self.responses.append(response)
+        self.encoded = []
+    
+    def _encoder(self, texts):
+        import zlib
+        
+        self.encoded.append(list(texts))
+        vectors = np.zeros((len(texts), 32), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace(',', ' ').split():
+                vectors[row, zlib.crc32(word[:5].encode()) % 32] += 1.0
+        return vectors
+    
+    def _patched(self):
+        from contextlib import ExitStack
+        from unittest import mock
+        from . import algorithm
+        
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(algorithm, 'EMBEDDINGS_AVAILABLE', True))
+        stack.enter_context(mock.patch.object(algorithm, 'encode_texts', side_effect=self._encoder))
+        return stack
+    
+    def test_cohort_matches_single_patient_scoring(self):
+        from .algorithm import load_therapist_pool
+        from .batch_matching import match_cohort
+        
+        with self._patched():
+            cohort = match_cohort([response.id for response in self.responses] + [999999], top_n=2)
+            patient_batches = [batch for batch in self.encoded if any(self.ANSWERS[0] in text for text in batch)]
+            expected = [
+                TherapistMatcher(response).find_best_matches(top_n=2, vectorized=True, pool=load_therapist_pool())
+                for response in self.responses
+            ]
+        
+        self.assertEqual(len(patient_batches), 1)
+        self.assertEqual(len(cohort), 3)
+        for result, single in zip(cohort, expected):
+            self.assertEqual([t.id for t, _, _ in result.matches], [t.id for t, _, _ in single])
+            for (_, score, breakdown), (_, single_score, single_breakdown) in zip(result.matches, single):
+                self.assertAlmostEqual(score, single_score, places=6)
+                self.assertAlmostEqual(
+                    breakdown['layer2_semantic']['score'], single_breakdown['layer2_semantic']['score'], places=6
+                )
+        self.assertEqual(cohort[1].matches[0][0].therapist_profile.bio, self.BIOS[1])
+    
+    def test_batch_endpoint_is_admin_only(self):
+        from rest_framework.test import APIClient
+        
+        client = APIClient()
+        client.force_authenticate(self.responses[0].patient)
+        payload = {'survey_response_ids': [response.id for response in self.responses], 'top_n': 1}
+        self.assertEqual(client.post('/api/matching/matches/batch/', payload, format='json').status_code, 403)
+        
+        admin = User.objects.create_user(email='batch-admin@example.com', password='testpass123', is_staff=True)
+        client.force_authenticate(admin)
+        response = client.post('/api/matching/matches/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['data'][0]['results']), 1)
+        
+        bad = client.post('/api/matching/matches/batch/', {'survey_response_ids': '1'}, format='json')
+        self.assertEqual(bad.status_code, 400)
+
+
+class LazyImportTestCase(TestCase):
+    """Test lazy loading of heavy dependencies and the startup budget"""
+    
+    def test_facade_imports_on_first_use(self):
+        import sys
+        from backend.lazy_imports import is_available, lazy_import
+        
+        sys.modules.pop('colorsys', None)
+        colorsys = lazy_import('colorsys')
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual(colorsys.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertTrue(colorsys.loaded)
+        self.assertTrue(is_available('colorsys'))
+        self.assertFalse(is_available('colorsys', 'no_such_package_anywhere'))
+    
+    def test_startup_stays_within_budget_without_heavy_imports(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        
+        out = StringIO()
+        call_command('profile_imports', budget_ms=60000, repeat=1, stdout=out)
+        self.assertIn('matching', out.getvalue())
+        
+        with self.assertRaisesMessage(CommandError, 'over the 1 ms budget'):
+            call_command('profile_imports', budget_ms=1, repeat=1, stdout=StringIO())
+
+
+class CollaborativeModelTestCase(TestCase):
+    """Test learned Layer 3 from appointment outcomes"""
+    
+    def setUp(self):
+        import datetime
+        import shutil
+        import tempfile
+        from django.test.utils import override_settings
+        from booking.models import Appointment, AppointmentFeedback
+        from booking.session_reports import SessionReport
+        
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(MATCHING_CF_MODEL_DIR=directory, MATCHING_ANN_CANDIDATES=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.good, self.poor = [
+            User.objects.create_user(
+                email=f'cf-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(2)
+        ]
+        self.patients = [
+            User.objects.create_user(email=f'cf-patient{i}@example.com', password='testpass123', role='patient')
+            for i in range(6)
+        ]
+        
+        def appointment(patient, therapist, status, rating=None, outcome=None):
+            booked = Appointment.objects.create(
+                patient=patient,
+                therapist=therapist,
+                appointment_date=datetime.date(2026, 1, 5),
+                start_time=datetime.time(10, 0),
+                status=status,
+                reason_for_visit='Anxiety',
+                contact_phone='1234567890',
+                contact_email=patient.email,
+            )
+            if rating is not None:
+                AppointmentFeedback.objects.create(appointment=booked, rating=rating, would_recommend=rating >= 4)
+            if outcome is not None:
+                SessionReport.objects.create(
+                    appointment=booked, therapist=therapist, patient=patient,
+                    session_summary='Session', mood_rating=5, session_outcome=outcome,
+                )
+        
+        for patient in self.patients[:4]:
+            appointment(patient, self.good, 'completed', rating=5, outcome='breakthrough')
+            appointment(patient, self.poor, 'no_show')
+        appointment(self.patients[4], self.poor, 'completed', rating=1, outcome='blocked')
+        appointment(self.patients[5], self.good, 'completed', rating=4)
+    
+    def test_outcomes_are_aggregated_per_pair(self):
+        from .collaborative_model import collect_interactions
+        
+        interactions = collect_interactions()
+        pairs = {
+            (int(patient), int(therapist)): score
+            for patient, therapist, score in zip(
+                interactions.patient_ids, interactions.therapist_ids, interactions.scores
+            )
+        }
+        self.assertEqual(len(pairs), 10)
+        self.assertAlmostEqual(pairs[(self.patients[0].id, self.good.id)], (0.6 + 1.0 + 1.0 + 1.0) / 4)
+        self.assertEqual(pairs[(self.patients[0].id, self.poor.id)], 0.0)
+        self.assertLess(pairs[(self.patients[4].id, self.poor.id)], 0.5)
+    
+    def test_trained_model_prefers_good_outcomes(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .collaborative_model import get_collaborative_model
+        
+        out = StringIO()
+        call_command('train_collaborative_model', factors=4, iterations=10, stdout=out)
+        self.assertIn('10 patient-therapist pairs', out.getvalue())
+        
+        model = get_collaborative_model()
+        self.assertEqual(len(model), 2)
+        for patient_id in (self.patients[0].id, 424242):  # Known and cold-start patients
+            known, predictions = model.predict(model.patient_vector(patient_id), [self.good.id, self.poor.id, 999])
+            self.assertEqual(known, [self.good.id, self.poor.id])
+            self.assertGreater(predictions[0], predictions[1])
+        
+        # No stored survey embeddings: new patients get the mean patient factor
+        self.assertEqual(model.cold_start.shape, (0, 4))
+    
+    def test_cold_start_regression_recovers_factors(self):
+        from .collaborative_model import fit_cold_start
+        
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(50, 8))
+        weights = rng.normal(size=(8, 3))
+        factors = (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)) @ weights + 0.5
+        fitted = fit_cold_start(embeddings, factors, regularization=1e-6)
+        self.assertEqual(fitted.shape, (9, 3))
+        np.testing.assert_allclose(fitted[-1], 0.5, atol=1e-3)
+    
+    def test_layer3_uses_learned_scores_without_queries(self):
+        from django.core.management import call_command
+        from io import StringIO
+        
+        call_command('train_collaborative_model', factors=4, iterations=10, stdout=StringIO())
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        response = SurveyResponse.objects.create(patient=self.patients[0], survey=survey, status='submitted')
+        matcher = TherapistMatcher(response)
+        
+        with self.assertNumQueries(0):
+            matcher._load_layer3_scores([self.good.id, self.poor.id])
+        good = matcher._layer3_collaborative_filtering(self.good)
+        poor = matcher._layer3_collaborative_filtering(self.poor)
+        self.assertTrue(good['learned'])
+        self.assertGreater(good['score'], poor['score'])
+        
+        matches = matcher.find_best_matches(top_n=2)
+        self.assertEqual(matches[0][0].id, self.good.id)
+        self.assertTrue(matches[0][2]['layer3_collaborative']['learned'])
+
+    def test_learned_results_are_cached_per_patient_and_model(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .result_cache import matching_inputs, match_is_current, result_cache_key
+
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        responses = [
+            SurveyResponse.objects.create(patient=patient, survey=survey, status='submitted')
+            for patient in self.patients[:2]
+        ]
+        shared = [matching_inputs(response) for response in responses]
+        self.assertIsNone(shared[0].patient_id)
+        self.assertEqual(result_cache_key(shared[0], 3), result_cache_key(shared[1], 3))
+
+        call_command('train_collaborative_model', factors=4, iterations=10, stdout=StringIO())
+        personal = [matching_inputs(response) for response in responses]
+        self.assertEqual(personal[0].pool_version, shared[0].pool_version + 1)
+        self.assertEqual(personal[0].patient_id, self.patients[0].id)
+        self.assertNotEqual(result_cache_key(personal[0], 3), result_cache_key(personal[1], 3))
+
+        match = TherapistMatch.objects.create(
+            patient=self.patients[0], survey_response=responses[0], top_match_1=self.good,
+            survey_fingerprint=shared[0].fingerprint, pool_version=shared[0].pool_version,
+        )
+        self.assertFalse(match_is_current(match, personal[0]))
+
+    def test_cold_start_matcher_ignores_learned_factors(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .collaborative_model import get_collaborative_model
+
+        call_command('train_collaborative_model', factors=4, iterations=10, stdout=StringIO())
+        model = get_collaborative_model()
+        patient_id = self.patients[0].id
+        np.testing.assert_array_equal(model.patient_vector(patient_id, learned=False), model.mean_patient)
+        self.assertFalse(np.array_equal(model.patient_vector(patient_id), model.mean_patient))
+
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        response = SurveyResponse.objects.create(patient=self.patients[0], survey=survey, status='submitted')
+        matcher = TherapistMatcher(response, cold_start=True)
+        matcher._load_learned_scores([self.good.id, self.poor.id])
+        _, expected = model.predict(model.mean_patient, [self.good.id, self.poor.id])
+        self.assertAlmostEqual(matcher._cf_scores[self.good.id][0], expected[0], places=5)
+
+
+class SimilarPatientIndexTestCase(TestCase):
+    """Test the float16 similar-patient index and its Layer 3 blend"""
+    
+    def setUp(self):
+        import datetime
+        import shutil
+        import tempfile
+        from django.test.utils import override_settings
+        from booking.models import Appointment, AppointmentFeedback
+        from .blog_sections import encode_embedding
+        from .models import PatientMatchFeatures
+        
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            MATCHING_PATIENT_INDEX_DIR=directory,
+            MATCHING_CF_MODEL_DIR=directory + '/cf',
+            MATCHING_SIMILAR_PATIENTS_K=3,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.anxiety, self.grief = [
+            User.objects.create_user(
+                email=f'knn-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(2)
+        ]
+        self.survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        
+        def patient(i, direction):
+            user = User.objects.create_user(email=f'knn-patient{i}@example.com', password='testpass123', role='patient')
+            response = SurveyResponse.objects.create(patient=user, survey=self.survey, status='submitted')
+            vector = np.zeros(8, dtype=np.float32)
+            vector[direction] = 1.0
+            vector[7] = 0.1 * i
+            PatientMatchFeatures.objects.create(
+                survey_response=response, survey_fingerprint='x', embedding=encode_embedding(vector)
+            )
+            return user
+        
+        self.appointment_number = 0
+        
+        def appointment(user, therapist, rating):
+            self.appointment_number += 1
+            booked = Appointment.objects.create(
+                patient=user,
+                therapist=therapist,
+                appointment_date=datetime.date(2026, 1, self.appointment_number),
+                start_time=datetime.time(10, 0),
+                status='completed',
+                reason_for_visit='Support',
+                contact_phone='1234567890',
+                contact_email=user.email,
+            )
+            AppointmentFeedback.objects.create(appointment=booked, rating=rating, would_recommend=rating >= 4)
+        
+        self.appointment = appointment
+        self.patient = patient
+        # Anxious patients (axis 0) did well with the anxiety therapist, grieving ones (axis 1) with the other
+        for i in range(3):
+            anxious = patient(i, 0)
+            appointment(anxious, self.anxiety, 5)
+            appointment(anxious, self.grief, 1)
+            appointment(patient(10 + i, 1), self.grief, 5)
+    
+    def _query(self, direction):
+        vector = np.zeros(8, dtype=np.float32)
+        vector[direction] = 1.0
+        return vector
+    
+    def test_nearest_patients_outcomes(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .patient_index import get_patient_index
+        
+        out = StringIO()
+        call_command('build_patient_index', stdout=out)
+        self.assertIn('6 patients, 9 therapist outcomes', out.getvalue())
+        
+        index = get_patient_index()
+        self.assertEqual(index.vectors.dtype, np.float16)
+        self.assertEqual(index.outcomes.dtype, np.float16)
+        
+        anxious = index.therapist_outcomes(self._query(0), k=3)
+        self.assertEqual(anxious[self.anxiety.id][2], 3)
+        self.assertGreater(anxious[self.anxiety.id][0], 0.8)
+        self.assertLess(anxious[self.grief.id][0], 0.5)
+        
+        grieving = index.therapist_outcomes(self._query(1), k=3)
+        self.assertNotIn(self.anxiety.id, grieving)
+        self.assertGreater(grieving[self.grief.id][0], 0.8)
+        
+        # A patient is never their own neighbour
+        own = User.objects.get(email='knn-patient0@example.com')
+        self.assertEqual(index.therapist_outcomes(self._query(0), k=3, exclude=own.id)[self.anxiety.id][2], 2)
+    
+    def test_feedback_updates_index_incrementally(self):
+        from .patient_index import get_patient_index, refresh_similar_patient
+        from .result_cache import get_pool_version
+        
+        index = get_patient_index()
+        index.build()
+        newcomer = self.patient(20, 1)
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.appointment(newcomer, self.anxiety, 5)
+        self.assertTrue(callbacks)
+        
+        version, generation = get_pool_version(), index.generation()
+        refresh_similar_patient(newcomer.id)  # What the scheduled callback runs
+        self.assertEqual(get_pool_version(), version)
+        self.assertNotEqual(index.generation(), generation)
+        self.assertEqual(len(index), 7)
+        
+        # Refreshing a patient whose row did not change leaves the file alone
+        generation = index.generation()
+        self.assertFalse(index.refresh_patient(newcomer.id))
+        self.assertFalse(index.refresh_patient(self.patient(21, 1).id))
+        self.assertEqual(index.generation(), generation)
+        grieving = index.therapist_outcomes(self._query(1), k=4)
+        self.assertEqual(grieving[self.anxiety.id][2], 1)
+        
+        # Unchanged patients keep their outcomes
+        self.assertEqual(index.therapist_outcomes(self._query(0), k=3)[self.anxiety.id][2], 3)
+    
+    def test_layer3_blends_similar_patient_outcomes(self):
+        from .patient_index import get_patient_index
+        
+        get_patient_index().build()
+        user = User.objects.create_user(email='knn-new@example.com', password='testpass123', role='patient')
+        response = SurveyResponse.objects.create(patient=user, survey=self.survey, status='submitted')
+        matcher = TherapistMatcher(response)
+        matcher.patient_embedding = self._query(0)
+        matcher._load_layer3_scores([self.anxiety.id, self.grief.id])
+        
+        anxiety = matcher._layer3_collaborative_filtering(self.anxiety)
+        grief = matcher._layer3_collaborative_filtering(self.grief)
+        self.assertEqual(anxiety['similar_patients_matched'], 3)
+        self.assertGreater(anxiety['score'], grief['score'])
+    
+    def test_cohort_blends_similar_patients_into_learned_scores_once(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from . import batch_matching
+    
+        call_command('train_collaborative_model', factors=4, iterations=10, stdout=StringIO())
+        similar = {self.anxiety.id: (1.0, 2.0, 2), self.grief.id: (0.0, 2.0, 2)}
+    
+        def load_similar_patients(matchers):
+            for matcher in matchers:
+                matcher._similar_patient_outcomes = similar
+    
+        response = SurveyResponse.objects.get(patient=self.patient(30, 0))
+        with mock.patch.object(batch_matching, '_load_similar_patients', side_effect=load_similar_patients):
+            cohort = batch_matching.match_cohort([response.id], top_n=2)
+    
+        matcher = TherapistMatcher(response)
+        matcher._load_learned_scores([self.anxiety.id, self.grief.id])
+        matcher._similar_patient_outcomes = similar
+        for therapist, _, breakdown in cohort[0].matches:
+            self.assertTrue(breakdown['layer3_collaborative']['learned'])
+            self.assertAlmostEqual(
+                breakdown['layer3_collaborative']['score'],
+                matcher._layer3_collaborative_filtering(therapist)['score'],
+                places=6,
+            )
+    
+    def test_cached_results_are_per_patient_with_an_index(self):
+        from .patient_index import get_patient_index
+        from .result_cache import matching_inputs, result_cache_key
+        
+        response = SurveyResponse.objects.get(patient=self.patient(30, 0))
+        self.assertIsNone(matching_inputs(response).patient_id)
+        
+        index = get_patient_index()
+        index.build()
+        inputs = matching_inputs(response)
+        self.assertEqual(inputs.patient_id, response.patient_id)
+        self.assertEqual(inputs.index_generation, index.generation())
+        self.assertTrue(result_cache_key(inputs, 3).endswith(f':{response.patient_id}:{index.generation()}'))
+
+
+class CapacityTestCase(TestCase):
+    """Test free-slot counts and capacity-aware ranking"""
+    
+    def setUp(self):
+        from surveys.models import SurveyAnswer, SurveyQuestion
+        
+        cache.clear()
+        self.open, self.booked = [
+            User.objects.create_user(
+                email=f'capacity-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(2)
+        ]
+        for therapist, schedule in ((self.open, {day: ['09:00 - 17:00'] for day in (
+            'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
+        )}), (self.booked, {})):
+            profile = therapist.therapist_profile
+            profile.bio = 'Anxiety and stress'
+            profile.availability_slots = schedule
+            profile.save()
+        
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        question = SurveyQuestion.objects.create(survey=survey, question_text='What brings you here', question_type='text')
+        patient = User.objects.create_user(email='capacity-patient@example.com', password='testpass123', role='patient')
+        self.response = SurveyResponse.objects.create(patient=patient, survey=survey, status='submitted')
+        SurveyAnswer.objects.create(response=self.response, question=question, answer_text='anxiety and stress')
+    
+    def test_free_slots_follow_booking_rules(self):
+        import datetime
+        from django.utils import timezone as django_timezone
+        from .capacity import count_free_slots
+        
+        now = django_timezone.make_aware(datetime.datetime(2026, 1, 4, 8, 0))  # A Sunday
+        mondays = [datetime.date(2026, 1, 5), datetime.date(2026, 1, 12)]
+        schedule = {'Monday': ['09:00 - 12:00', 'broken'], 'Tuesday': ['12:00 - 09:00']}
+        
+        self.assertEqual(count_free_slots(schedule, [], [], [], now=now)[0], 6)
+        free, earliest = count_free_slots(
+            schedule,
+            time_off=[(mondays[0], mondays[0])],
+            appointments=[(mondays[1], datetime.time(10, 30), datetime.time(11, 30))],
+            booked_slots=[{'date': '2026-01-12', 'start_time': '09:00:00', 'end_time': '10:00:00'}],
+            now=now,
+        )
+        self.assertEqual(free, 0)
+        self.assertIsNone(earliest)
+        
+        free, earliest = count_free_slots(schedule, [(mondays[0], mondays[0])], [], [], now=now)
+        self.assertEqual(free, 3)
+        self.assertEqual(earliest, django_timezone.make_aware(datetime.datetime(2026, 1, 12, 9, 0)))
+        self.assertEqual(count_free_slots(None, [], [], [], now=now), (0, None))
+    
+    def test_refresh_counts_and_upserts(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .capacity import get_capacity, refresh_capacity
+        from .models import TherapistCapacity
+        
+        out = StringIO()
+        call_command('refresh_capacity', stdout=out)
+        self.assertIn('1 without a free slot', out.getvalue())
+        
+        capacity = get_capacity([self.open.id, self.booked.id])
+        self.assertGreater(capacity[self.open.id][0], 90)
+        self.assertEqual(capacity[self.booked.id], (0, None))
+        
+        refresh_capacity([self.open.id])
+        self.assertEqual(TherapistCapacity.objects.count(), 2)
+    
+    def test_matcher_filters_or_penalises_booked_therapists(self):
+        from django.test.utils import override_settings
+        from .capacity import refresh_capacity
+        
+        refresh_capacity([self.open.id, self.booked.id])
+        
+        with override_settings(MATCHING_CAPACITY_MODE=None):
+            ranked = TherapistMatcher(self.response).find_best_matches(top_n=5)
+        self.assertEqual({therapist.id for therapist, _, _ in ranked}, {self.open.id, self.booked.id})
+        self.assertNotIn('availability', ranked[0][2])
+        unpenalised = {therapist.id: score for therapist, score, _ in ranked}
+        
+        with override_settings(MATCHING_CAPACITY_MODE='filter'):
+            for vectorized in (False, True):
+                matcher = TherapistMatcher(self.response)
+                ranked = matcher.find_best_matches(top_n=5, vectorized=vectorized)
+                self.assertEqual([therapist.id for therapist, _, _ in ranked], [self.open.id])
+                self.assertEqual(matcher.eligible_count, 1)
+        
+        with override_settings(MATCHING_CAPACITY_MODE='penalty', MATCHING_CAPACITY_PENALTY=0.5):
+            for vectorized in (False, True):
+                ranked = TherapistMatcher(self.response).find_best_matches(top_n=5, vectorized=vectorized)
+                scores = {therapist.id: score for therapist, score, _ in ranked}
+                breakdowns = {therapist.id: breakdown for therapist, _, breakdown in ranked}
+                self.assertAlmostEqual(scores[self.booked.id], unpenalised[self.booked.id] * 0.5)
+                self.assertAlmostEqual(scores[self.open.id], unpenalised[self.open.id])
+                self.assertEqual(breakdowns[self.booked.id]['availability']['free_slots'], 0)
+                self.assertIsNotNone(breakdowns[self.open.id]['availability']['next_available_at'])
+
+    def test_pool_version_bumps_when_ranking_changes(self):
+        from django.test.utils import override_settings
+        from .capacity import _ranking_changed
+
+        def changed(mode, old, new):
+            return _ranking_changed(mode, np.array(old), np.array(new))
+
+        with override_settings(MATCHING_CAPACITY_PENALTY=0.3, MATCHING_CAPACITY_MIN_FREE_SLOTS=3):
+            self.assertTrue(changed('penalty', [2], [1]))  # Same side of zero, new factor
+            self.assertFalse(changed('penalty', [5], [4]))  # Full score either way
+            self.assertFalse(changed('penalty', [-1], [3]))
+            self.assertFalse(changed('filter', [2], [1]))
+            self.assertTrue(changed('filter', [1], [0]))
+            self.assertTrue(changed('filter', [-1], [0]))  # First count of a fully booked therapist
+            self.assertFalse(changed(None, [2], [0]))
+
+
+class ReplayEvaluationTestCase(TestCase):
+    """Test the offline replay of historical responses against bookings"""
+    
+    def setUp(self):
+        import datetime
+        from booking.models import Appointment, AppointmentFeedback
+        from surveys.models import SurveyAnswer, SurveyQuestion
+        
+        cache.clear()
+        self.therapists = [
+            User.objects.create_user(
+                email=f'replay-therapist{i}@example.com', password='testpass123', role='therapist', gender='female'
+            )
+            for i in range(3)
+        ]
+        survey = Survey.objects.create(title='Matching Survey', assessment_type='custom', is_active=True)
+        question = SurveyQuestion.objects.create(survey=survey, question_text='What brings you here', question_type='text')
+        
+        def booking(patient, therapist, response=None, rating=None, status='completed'):
+            appointment = Appointment.objects.create(
+                patient=patient,
+                therapist=therapist,
+                survey_response=response,
+                appointment_date=datetime.date(2026, 1, 5),
+                start_time=datetime.time(10, 0),
+                status=status,
+                reason_for_visit='Anxiety',
+                contact_phone='1234567890',
+                contact_email=patient.email,
+            )
+            if rating is not None:
+                AppointmentFeedback.objects.create(appointment=appointment, rating=rating)
+        
+        self.responses = []
+        for i in range(2):
+            patient = User.objects.create_user(email=f'replay{i}@example.com', password='testpass123', role='patient')
+            response = SurveyResponse.objects.create(
+                patient=patient, survey=survey, status='submitted', completed_at=timezone.now()
+            )
+            SurveyAnswer.objects.create(response=response, question=question, answer_text='anxiety')
+            self.responses.append(response)
+        
+        booking(self.responses[0].patient, self.therapists[0], response=self.responses[0], rating=5)
+        booking(self.responses[0].patient, self.therapists[1], status='cancelled')
+        booking(self.responses[1].patient, self.therapists[2], status='no_show')  # Unattached, after the response
+        outsider = User.objects.create_user(email='replay-nosurvey@example.com', password='testpass123', role='patient')
+        booking(outsider, self.therapists[0])
+    
+    def test_metrics(self):
+        from .benchmarks.replay import ndcg_at_k, recall_at_k
+        
+        relevance = {1: 2.0, 2: 1.0}
+        self.assertAlmostEqual(ndcg_at_k([1, 2, 3], relevance, 3), 1.0)
+        self.assertLess(ndcg_at_k([2, 1, 3], relevance, 3), 1.0)
+        self.assertEqual(ndcg_at_k([3, 4], relevance, 2), 0.0)
+        self.assertEqual(recall_at_k([3, 1], relevance, 2), 0.5)
+        self.assertEqual(recall_at_k([3, 1, 2], relevance, 1), 0.0)
+    
+    def test_cases_grade_bookings(self):
+        from .benchmarks.replay import collect_replay_cases
+        
+        cases = {case.survey_response_id: case.relevance for case in collect_replay_cases()}
+        self.assertEqual(cases, {
+            self.responses[0].id: {self.therapists[0].id: 2.0},
+            self.responses[1].id: {self.therapists[2].id: 0.5},
+        })
+    
+    def test_unattached_bookings_follow_completion_time(self):
+        import datetime
+        from .benchmarks.replay import collect_replay_cases
+        
+        # Started before the booking but only submitted after it
+        SurveyResponse.objects.filter(pk=self.responses[1].pk).update(
+            completed_at=timezone.now() + datetime.timedelta(days=1)
+        )
+        cases = {case.survey_response_id for case in collect_replay_cases()}
+        self.assertEqual(cases, {self.responses[0].id})
+    
+    def test_replay_reports_quality_and_cost_without_writes(self):
+        import json
+        import os
+        import shutil
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        output = os.path.join(directory, 'replay.json')
+        out = StringIO()
+        call_command('replay_matching', k=3, output=output, label='test', stdout=out)
+        with open(output) as f:
+            report = json.load(f)
+        
+        runs = {run['matcher']: run for run in report['runs']}
+        self.assertEqual(report['parameters']['cases'], 2)
+        for name in ('loop', 'vectorized'):
+            self.assertEqual(runs[name]['cases'], 2)
+            self.assertEqual(runs[name]['recall'], 1.0)  # Every therapist fits in the top 3
+            self.assertGreater(runs[name]['ndcg'], 0.0)
+            self.assertGreater(runs[name]['queries']['max'], 0)
+        self.assertEqual(runs['loop']['ndcg'], runs['vectorized']['ndcg'])
+        self.assertIn('engine', runs)
+        self.assertIn('NDCG@3', out.getvalue())
+        self.assertEqual(TherapistMatch.objects.count(), 0)
+        
+        # A baseline that ranked better is a regression
+        for run in report['runs']:
+            if 'ndcg' in run:
+                run['ndcg'] += 0.1
+        with open(output, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'regression'):
+            call_command('replay_matching', matchers='loop', compare=output, stdout=StringIO(), stderr=StringIO())
+        
+        with self.assertRaisesMessage(CommandError, 'Unknown weight'):
+            call_command('replay_matching', weights='bogus=1', stdout=StringIO())
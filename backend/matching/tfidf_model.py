@@ -0,0 +1,380 @@
+"""
+Persistent TF-IDF Model
+Therapist document vectors fitted once and reused by every MatchingEngine request
+
+The vectorizer is fitted over all therapist documents (profile, bio and
+recent published posts, as ProfileBuilder builds them) and stored on disk:
+the vocabulary and owners as JSON, the idf weights and the L2-normalised
+sparse document matrix as ``.npy`` / ``.npz``. A request only transforms
+the patient text with the stored vocabulary and takes one sparse product
+with the matrix, so its cost no longer grows with a refit over the pool.
+
+A changed therapist document is re-transformed with the current
+vocabulary and its row replaced in place. Once enough documents have
+changed since the last fit (MATCHING_TFIDF_REFIT_FRACTION) the vocabulary
+and idf weights are refitted in a background thread.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from backend.lazy_imports import lazy_import
+from .embedding_store import directory_lock
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use, not when the URLconf loads (see backend.lazy_imports)
+sparse = lazy_import('scipy.sparse')
+sklearn_text = lazy_import('sklearn.feature_extraction.text')
+sklearn_preprocessing = lazy_import('sklearn.preprocessing')
+
+# Shared with MatchingEngine's per-request fallback
+VECTORIZER_PARAMS = {
+    'max_features': 500,
+    'stop_words': 'english',
+    'ngram_range': (1, 2),  # Consider single words and bigrams
+    'min_df': 1,
+    'max_df': 0.8,
+}
+
+# Published posts included per therapist document
+DOCUMENT_BLOG_POSTS = 5
+
+
+class TfidfModel:
+    """
+    Disk-backed fitted TF-IDF vocabulary and therapist document matrix
+
+    Layout inside ``directory``:
+    - model.json: {vocabulary, owners, fitted_size, changed}
+    - idf.npy:    idf weight per vocabulary term
+    - matrix.npz: CSR matrix, one L2-normalised row per owner
+
+    Writes are atomic and serialised across processes with a lock file;
+    readers reload when model.json's modification time changes.
+    """
+
+    MODEL_FILE = 'model.json'
+    IDF_FILE = 'idf.npy'
+    MATRIX_FILE = 'matrix.npz'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float64)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self.owners: List[int] = []
+        self._rows: Dict[int, int] = {}
+        self._counter: Optional['sklearn_text.CountVectorizer'] = None
+        self.fitted_size = 0
+        # Owners whose row was replaced since the last fit
+        self.changed: set = set()
+
+    # ------------------------------------------------------------------
+    # Loading / saving
+    # ------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _model_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._path(self.MODEL_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        mtime = self._model_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+
+        try:
+            with open(self._path(self.MODEL_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            idf = np.load(self._path(self.IDF_FILE))
+            matrix = sparse.load_npz(self._path(self.MATRIX_FILE)).tocsr()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load TF-IDF model from {self.directory}: {e}")
+            return
+
+        self._reset()
+        self.vocabulary = meta['vocabulary']
+        self.owners = meta['owners']
+        self.fitted_size = meta.get('fitted_size', len(self.owners))
+        self.changed = set(meta.get('changed', []))
+        self.idf = idf
+        self.matrix = matrix
+        self._rows = {owner: row for row, owner in enumerate(self.owners)}
+        self._loaded_mtime = mtime
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        idf_tmp = self._path(self.IDF_FILE) + '.tmp.npy'
+        matrix_tmp = self._path(self.MATRIX_FILE) + '.tmp.npz'
+        model_tmp = self._path(self.MODEL_FILE) + '.tmp'
+
+        np.save(idf_tmp, self.idf)
+        sparse.save_npz(matrix_tmp, self.matrix)
+        with open(model_tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'vocabulary': self.vocabulary,
+                'owners': self.owners,
+                'fitted_size': self.fitted_size,
+                'changed': sorted(self.changed),
+            }, f)
+
+        # Arrays first so a reader never sees owners pointing past the matrix
+        os.replace(idf_tmp, self._path(self.IDF_FILE))
+        os.replace(matrix_tmp, self._path(self.MATRIX_FILE))
+        os.replace(model_tmp, self._path(self.MODEL_FILE))
+        self._loaded_mtime = self._model_mtime()
+
+    # ------------------------------------------------------------------
+    # Fitting and incremental updates
+    # ------------------------------------------------------------------
+
+    def fit(self, owners: List[int], documents: List[str]) -> None:
+        """Fit the vocabulary and idf over all documents and replace the model"""
+        vectorizer = sklearn_text.TfidfVectorizer(**VECTORIZER_PARAMS)
+        try:
+            matrix = vectorizer.fit_transform(documents) if documents else None
+        except ValueError as e:
+            # Empty vocabulary after stop words / max_df pruning
+            logger.warning(f"TF-IDF fit skipped: {e}")
+            matrix = None
+
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reset()
+            if matrix is not None:
+                self.vocabulary = {term: int(column) for term, column in vectorizer.vocabulary_.items()}
+                self.idf = vectorizer.idf_.astype(np.float64)
+                self.matrix = matrix.tocsr()
+                self.owners = [int(owner) for owner in owners]
+                self._rows = {owner: row for row, owner in enumerate(self.owners)}
+                self.fitted_size = len(self.owners)
+            self._save()
+
+    def _transform(self, documents: List[str]) -> 'sparse.csr_matrix':
+        """TF-IDF rows for documents under the fitted vocabulary (no refit)"""
+        if self._counter is None:
+            # Same tokenisation as the fit; the vocabulary is already pruned
+            self._counter = sklearn_text.CountVectorizer(
+                vocabulary=self.vocabulary,
+                stop_words=VECTORIZER_PARAMS['stop_words'],
+                ngram_range=VECTORIZER_PARAMS['ngram_range'],
+            )
+        counts = self._counter.transform(documents).astype(np.float64)
+        return sklearn_preprocessing.normalize(counts.multiply(self.idf).tocsr())
+
+    def replace_owner(self, owner: int, document: Optional[str]) -> bool:
+        """
+        Re-transform one therapist's document (removed when None)
+
+        Returns:
+            True when enough documents changed since the last fit that the
+            vocabulary should be refitted
+        """
+        with self._lock, directory_lock(self.directory, self.LOCK_FILE):
+            self._reload_if_changed()
+            if not self.vocabulary:
+                return True
+
+            row = self._rows.get(owner)
+            if document is None:
+                if row is None:
+                    return False
+                keep = np.ones(len(self.owners), dtype=bool)
+                keep[row] = False
+                self.matrix = self.matrix[keep]
+                self.owners = [other for other in self.owners if other != owner]
+                self._rows = {other: index for index, other in enumerate(self.owners)}
+            else:
+                vector = self._transform([document])
+                if row is None:
+                    self.matrix = sparse.vstack([self.matrix, vector], format='csr')
+                    self.owners.append(owner)
+                    self._rows[owner] = len(self.owners) - 1
+                else:
+                    self.matrix = sparse.vstack(
+                        [self.matrix[:row], vector, self.matrix[row + 1:]],
+                        format='csr',
+                    )
+
+            self.changed.add(owner)
+            self._save()
+            return self.needs_refit()
+
+    def needs_refit(self) -> bool:
+        fraction = getattr(settings, 'MATCHING_TFIDF_REFIT_FRACTION', 0.2)
+        return len(self.changed) > max(1.0, fraction * self.fitted_size)
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        """True once the model has been fitted (see build_tfidf_model)"""
+        return os.path.exists(self._path(self.MODEL_FILE))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self.owners)
+
+    def similarities(
+        self,
+        query: str,
+        owners: List[int],
+        documents: Optional[List[str]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Cosine similarity of ``query`` with each owner's stored document
+
+        Owners missing from the matrix are scored from ``documents`` (same
+        order as ``owners``) under the fitted vocabulary, or 0 without one.
+        Returns None when no model has been fitted yet.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if not self.vocabulary:
+                return None
+
+            query_vector = self._transform([query])
+            scores = np.zeros(len(owners))
+            rows = [self._rows.get(owner) for owner in owners]
+            stored = [index for index, row in enumerate(rows) if row is not None]
+            if stored:
+                matrix = self.matrix[[rows[index] for index in stored]]
+                scores[stored] = (matrix @ query_vector.T).toarray().ravel()
+
+            missing = [index for index, row in enumerate(rows) if row is None]
+            if missing and documents is not None:
+                vectors = self._transform([documents[index] for index in missing])
+                scores[missing] = (vectors @ query_vector.T).toarray().ravel()
+
+        return scores
+
+
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+
+
+def get_tfidf_model() -> TfidfModel:
+    """Process-wide TF-IDF model (stored in MATCHING_TFIDF_MODEL_DIR)"""
+    global _MODEL
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            directory = getattr(
+                settings,
+                'MATCHING_TFIDF_MODEL_DIR',
+                os.path.join(settings.BASE_DIR, 'matching_data', 'tfidf'),
+            )
+            _MODEL = TfidfModel(str(directory))
+        return _MODEL
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    """Re-open the model when MATCHING_TFIDF_MODEL_DIR is overridden (tests, benchmarks)"""
+    global _MODEL
+    if setting == 'MATCHING_TFIDF_MODEL_DIR':
+        with _MODEL_LOCK:
+            _MODEL = None
+
+
+def therapist_documents(therapist_ids: Optional[Iterable[int]] = None) -> Tuple[List[int], List[str]]:
+    """
+    Match documents of completed therapist profiles
+
+    Built like ProfileBuilder's profile_text: profile fields plus the
+    latest published posts, cleaned with TextProcessor.
+
+    Returns:
+        (therapist user ids, documents)
+    """
+    from accounts.models import TherapistProfile
+    from blogs.models import BlogPost
+    from .services.text_processor import TextProcessor
+
+    profiles = TherapistProfile.objects.filter(profile_completed=True).order_by('user_id')
+    if therapist_ids is not None:
+        profiles = profiles.filter(user_id__in=list(therapist_ids))
+    profiles = list(profiles)
+
+    posts: Dict[int, List[BlogPost]] = {}
+    published = BlogPost.objects.filter(
+        author_id__in=[profile.user_id for profile in profiles],
+        status='published',
+    ).order_by('author_id', '-published_at').only('author_id', 'content')
+    for post in published.iterator():
+        author_posts = posts.setdefault(post.author_id, [])
+        if len(author_posts) < DOCUMENT_BLOG_POSTS:
+            author_posts.append(post)
+
+    owners, documents = [], []
+    for profile in profiles:
+        text = TextProcessor.build_therapist_text(profile, posts.get(profile.user_id))
+        owners.append(profile.user_id)
+        documents.append(TextProcessor.clean_text(text))
+    return owners, documents
+
+
+def refit_tfidf_model() -> int:
+    """Fit the model over every therapist document; returns documents fitted"""
+    owners, documents = therapist_documents()
+    get_tfidf_model().fit(owners, documents)
+    return len(owners)
+
+
+_REFIT_EXECUTOR = None
+_REFIT_PENDING = threading.Event()
+
+
+def _refit_in_background() -> None:
+    try:
+        refit_tfidf_model()
+    except Exception as e:
+        logger.warning(f"[MATCHING] TF-IDF refit failed: {e}")
+    finally:
+        _REFIT_PENDING.clear()
+        close_old_connections()
+
+
+def schedule_tfidf_refit() -> None:
+    """Refit in a background thread (coalesced while one is pending)"""
+    global _REFIT_EXECUTOR
+    with _MODEL_LOCK:
+        if _REFIT_PENDING.is_set():
+            return
+        _REFIT_PENDING.set()
+        if _REFIT_EXECUTOR is None:
+            _REFIT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tfidf-refit')
+    _REFIT_EXECUTOR.submit(_refit_in_background)
+
+
+def refresh_tfidf_therapist(therapist_id: int) -> None:
+    """Replace one therapist's row after their profile or posts changed"""
+    model = get_tfidf_model()
+    if not model.exists():
+        return  # Model not fitted yet (see build_tfidf_model)
+
+    owners, documents = therapist_documents([therapist_id])
+    if model.replace_owner(therapist_id, documents[0] if owners else None):
+        schedule_tfidf_refit()
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TherapistMatchViewSet
+from .views import TherapistMatchViewSet, MatchJobViewSet, matching_stats
 
 router = DefaultRouter()
 router.register(r'matches', TherapistMatchViewSet, basename='therapist-match')
+router.register(r'jobs', MatchJobViewSet, basename='match-job')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('ops/stats/', matching_stats, name='matching-stats'),
 ]
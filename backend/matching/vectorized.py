@@ -0,0 +1,153 @@
+"""
+Vectorized Scoring
+NumPy versions of the per-therapist scoring steps used by TherapistMatcher
+
+Every function here takes one array per feature (one entry per therapist)
+and mirrors the arithmetic of the scalar code in algorithm.py and
+improved_matching.py operation for operation, so both paths produce the
+same floats and therefore the same ranking.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .improved_matching import COMPOSITE_WEIGHTS
+
+
+def hard_rule_mask(genders: List[Optional[str]], required_gender: Optional[str]) -> np.ndarray:
+    """
+    Boolean mask of therapists passing Layer 1
+
+    Gender is the only mandatory rule (see _layer1_hard_rules): when the
+    patient states a preference, the therapist's gender must equal it.
+    """
+    required_gender = (required_gender or '').lower().strip()
+    if not required_gender:
+        return np.ones(len(genders), dtype=bool)
+
+    normalized = np.array([(gender or '').lower().strip() for gender in genders], dtype=object)
+    return normalized == required_gender
+
+
+def semantic_scores(bio_similarity: np.ndarray, blog_similarity: np.ndarray) -> np.ndarray:
+    """
+    Layer 2 score from bio and best blog-section similarity
+
+    Mirrors TherapistMatcher._layer2_semantic_matching: 40/60 blend when
+    both are positive, otherwise whichever is positive, otherwise the 0.5
+    default; then boosted by 1.3 and clipped to [0, 1].
+    """
+    bio = np.asarray(bio_similarity, dtype=np.float64)
+    blog = np.asarray(blog_similarity, dtype=np.float64)
+
+    score = np.where(
+        (bio > 0) & (blog > 0),
+        bio * 0.4 + blog * 0.6,
+        np.where(bio > 0, bio, np.where(blog > 0, blog, 0.5)),
+    )
+    return np.minimum(1.0, np.maximum(0.0, score * 1.3))
+
+
+def weighted_scores(
+    layer2: np.ndarray,
+    layer3: np.ndarray,
+    spec: np.ndarray,
+    weights: Dict[str, float],
+) -> np.ndarray:
+    """Plain weighted sum used when composite scoring is unavailable"""
+    return (
+        weights['layer2_semantic'] * layer2 +
+        weights['layer3_collaborative'] * layer3 +
+        weights['specialization'] * spec
+    )
+
+
+def calculate_std(*columns: np.ndarray) -> np.ndarray:
+    """
+    Row-wise population standard deviation of several score columns
+
+    Same summation order as improved_matching._calculate_std.
+    """
+    count = len(columns)
+    if count < 2:
+        return np.zeros_like(np.asarray(columns[0], dtype=np.float64))
+
+    total = columns[0]
+    for column in columns[1:]:
+        total = total + column
+    mean = total / count
+
+    squares = (columns[0] - mean) ** 2
+    for column in columns[1:]:
+        squares = squares + (column - mean) ** 2
+    return np.sqrt(squares / count)
+
+
+def composite_scores(
+    layer2: np.ndarray,
+    layer3: np.ndarray,
+    spec: np.ndarray,
+    therapist_activity: np.ndarray,
+    survey_completion: float,
+    weights: Optional[Dict[str, float]] = None,
+) -> np.ndarray:
+    """
+    Array version of improved_matching.calculate_composite_score
+
+    Base weighted score plus confidence, activity and survey bonuses,
+    clipped to [0, 1].
+    """
+    weights = weights or COMPOSITE_WEIGHTS
+    layer2 = np.asarray(layer2, dtype=np.float64)
+    layer3 = np.asarray(layer3, dtype=np.float64)
+    spec = np.asarray(spec, dtype=np.float64)
+    activity = np.asarray(therapist_activity, dtype=np.float64)
+
+    base_score = (
+        weights['layer2_semantic'] * layer2 +
+        weights['layer3_collaborative'] * layer3 +
+        weights['specialization'] * spec
+    )
+
+    # Confidence boost: consistent scores up, conflicting scores down
+    score_std = calculate_std(layer2, layer3, spec)
+    confidence_boost = np.where(score_std < 0.15, 0.05, np.where(score_std > 0.35, -0.05, 0.0))
+
+    # Activity bonus: favor active therapists
+    activity_bonus = np.where(activity < 0.3, -0.05, np.where(activity > 0.7, 0.03, 0.0))
+
+    # Survey quality bonus is the same for every therapist
+    if survey_completion < 0.5:
+        survey_bonus = -0.03
+    elif survey_completion > 0.8:
+        survey_bonus = 0.02
+    else:
+        survey_bonus = 0.0
+
+    final_score = base_score + confidence_boost + activity_bonus + survey_bonus
+    return np.minimum(1.0, np.maximum(0.0, final_score))
+
+
+def top_n_indices(scores: np.ndarray, top_n: int) -> List[int]:
+    """
+    Indices of the ``top_n`` highest scores, best first
+
+    Uses argpartition to avoid sorting the whole pool. Ties are broken by
+    position, exactly like a stable descending sort of the Python list.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    count = scores.shape[0]
+    if top_n <= 0 or count == 0:
+        return []
+
+    if top_n < count:
+        partitioned = np.argpartition(-scores, top_n - 1)[:top_n]
+        cutoff = scores[partitioned].min()
+        # Everything tied with the cutoff competes on position
+        candidates = np.flatnonzero(scores >= cutoff)
+    else:
+        candidates = np.arange(count)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return [int(idx) for idx in candidates[order][:top_n]]
@@ -1,12 +1,27 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 from surveys.models import SurveyResponse
-from .models import TherapistMatch
-from .serializers import TherapistMatchSerializer, MatchResultSerializer
-from .algorithm import TherapistMatcher
+from .models import TherapistMatch, MatchJob, MatchingLog
+from .serializers import TherapistMatchSerializer, MatchResultSerializer, MatchJobSerializer
+from .jobs import run_matching, enqueue_match_job, match_result_entry
+from .batch_matching import match_cohort
+from .result_cache import matching_inputs, match_is_current
+from .instrumentation import summarize_matching_logs
 
 
 class TherapistMatchViewSet(viewsets.ModelViewSet):
@@ -66,52 +81,29 @@ class TherapistMatchViewSet(viewsets.ModelViewSet):
                 'data': serializer.data
             })
         
-        # Run the matching algorithm
-        matcher = TherapistMatcher(survey_response)
-        top_matches = matcher.find_best_matches(top_n=3)
+        if _wants_async(request):
+            job = enqueue_match_job(survey_response, kind='find')
+            return _job_accepted_response(request, job)
+        
+        # Run the matching algorithm and save the match record
+        therapist_match, match_results = run_matching(
+            survey_response,
+            latency_budget_ms=getattr(settings, 'MATCHING_LATENCY_BUDGET_MS', None),
+        )
         
-        if not top_matches:
+        if therapist_match is None:
             return Response({
                 'success': False,
                 'message': 'No matching therapists found',
                 'data': None
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Create the match record
-        match_data = {
-            'patient': request.user,
-            'survey_response': survey_response,
-        }
-        
-        # Add top matches with their scores and reasons
-        match_results = []
-        for i, (therapist, score, breakdown) in enumerate(top_matches, 1):
-            match_data[f'top_match_{i}'] = therapist
-            match_data[f'top_match_{i}_score'] = score
-            
-            reasons = matcher.generate_match_reasons(therapist, breakdown)
-            match_results.append({
-                'rank': i,
-                'therapist_id': therapist.id,
-                'therapist_name': therapist.full_name,
-                'score': round(score * 100, 1),  # Convert to percentage
-                'reasons': reasons,
-                'breakdown': {
-                    'semantic_score': round(breakdown['layer2_semantic']['score'] * 100, 1),
-                    'collaborative_score': round(breakdown['layer3_collaborative']['score'] * 100, 1),
-                    'specialization_score': round(breakdown['specialization_score'] * 100, 1),
-                }
-            })
-        
-        # Save to database
-        therapist_match = TherapistMatch.objects.create(**match_data)
-        
         # Serialize and return
         serializer = TherapistMatchSerializer(therapist_match)
         
         return Response({
             'success': True,
-            'message': f'Found {len(top_matches)} matching therapists',
+            'message': f'Found {len(match_results)} matching therapists',
             'match_id': therapist_match.id,
             'results': match_results,
             'data': serializer.data
@@ -148,26 +140,235 @@ class TherapistMatchViewSet(viewsets.ModelViewSet):
         match = self.get_object()
         survey_response = match.survey_response
         
-        # Run matching again
-        matcher = TherapistMatcher(survey_response)
-        top_matches = matcher.find_best_matches(top_n=3)
+        # Nothing to recompute when neither the answers nor the pool changed
+        inputs = matching_inputs(survey_response)
+        if match_is_current(match, inputs):
+            serializer = TherapistMatchSerializer(match)
+            return Response({
+                'success': True,
+                'message': 'Matches are already up to date',
+                'data': serializer.data
+            })
+        
+        if _wants_async(request):
+            job = enqueue_match_job(survey_response, kind='rematch', match=match)
+            return _job_accepted_response(request, job)
         
-        if not top_matches:
+        # Run matching again and update the match record
+        updated_match, _ = run_matching(
+            survey_response,
+            match=match,
+            inputs=inputs,
+            latency_budget_ms=getattr(settings, 'MATCHING_LATENCY_BUDGET_MS', None),
+        )
+        
+        if updated_match is None:
             return Response({
                 'success': False,
                 'message': 'No matching therapists found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Update the match record
-        for i, (therapist, score, breakdown) in enumerate(top_matches, 1):
-            setattr(match, f'top_match_{i}', therapist)
-            setattr(match, f'top_match_{i}_score', score)
-        
-        match.save()
-        
         serializer = TherapistMatchSerializer(match)
         return Response({
             'success': True,
             'message': 'Matches updated',
             'data': serializer.data
-        })
\ No newline at end of file
+        })
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdminUser])
+    def batch(self, request):
+        """
+        Match a cohort of survey responses in one pass (nothing is saved)
+        
+        POST /api/matching/matches/batch/
+        Body: {"survey_response_ids": [1, 2, 3], "top_n": 3}
+        """
+        response_ids = request.data.get('survey_response_ids')
+        max_responses = getattr(settings, 'MATCHING_BATCH_MAX_RESPONSES', 500)
+        try:
+            if not isinstance(response_ids, list):
+                raise TypeError
+            response_ids = [int(response_id) for response_id in response_ids]
+            top_n = int(request.data.get('top_n', 3))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'survey_response_ids must be a list of ids and top_n a number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not response_ids or len(response_ids) > max_responses or not 1 <= top_n <= 20:
+            return Response(
+                {'error': f'Send 1 to {max_responses} survey_response_ids and a top_n between 1 and 20'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        cohort = match_cohort(response_ids, top_n=top_n)
+        found = {result.survey_response.id for result in cohort}
+        
+        return Response({
+            'success': True,
+            'count': len(cohort),
+            'missing': [response_id for response_id in response_ids if response_id not in found],
+            'data': [
+                {
+                    'survey_response_id': result.survey_response.id,
+                    'patient_id': result.survey_response.patient_id,
+                    'eligible_count': result.matcher.eligible_count,
+                    'results': [
+                        match_result_entry(result.matcher, rank, therapist, score, breakdown)
+                        for rank, (therapist, score, breakdown) in enumerate(result.matches, 1)
+                    ],
+                }
+                for result in cohort
+            ],
+        })
+
+
+def _wants_async(request) -> bool:
+    """Job mode requested with {"async": true} or ?async=1"""
+    value = request.data.get('async', request.query_params.get('async', False))
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _job_accepted_response(request, job):
+    return Response({
+        'success': True,
+        'message': 'Matching started',
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('match-job-detail', args=[job.id])),
+        'stream_url': request.build_absolute_uri(reverse('match-job-stream', args=[job.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class MatchJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status of asynchronous matching jobs
+    
+    GET /api/matching/jobs/{id}/         - poll
+    GET /api/matching/jobs/{id}/stream/  - server-sent events until finished (ASGI; WSGI sends
+                                           the current status and lets the client reconnect)
+    """
+    serializer_class = MatchJobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        """Return jobs of the current user only"""
+        return MatchJob.objects.filter(
+            patient=self.request.user
+        ).select_related(
+            'match',
+            'match__top_match_1__therapist_profile',
+            'match__top_match_2__therapist_profile',
+            'match__top_match_3__therapist_profile',
+        )
+    
+    @action(detail=True, methods=['get'])
+    def stream(self, request, pk=None):
+        """
+        Stream job status as server-sent events
+        
+        Sends a 'status' event whenever the status changes and a final
+        'result' event with the serialized job once it has finished.
+        
+        Served by ASGI, the events come from an async generator that waits
+        with asyncio.sleep, so an open stream holds no worker. Under WSGI a
+        stream would pin a worker thread for minutes, so the current
+        status is sent once with a 'retry' hint instead and EventSource
+        clients reconnect (i.e. poll) on their own.
+        """
+        job = self.get_object()
+        poll_interval = getattr(settings, 'MATCHING_JOB_STREAM_POLL_INTERVAL', 0.5)
+        
+        if isinstance(request._request, ASGIRequest):
+            timeout = getattr(settings, 'MATCHING_JOB_STREAM_TIMEOUT', 120)
+            events = _job_events(self.get_queryset(), job, poll_interval, timeout)
+        else:
+            events = _job_snapshot(job, retry_ms=int(max(poll_interval, 1) * 1000))
+        
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+async def _job_events(queryset, job: MatchJob, poll_interval: float, timeout: float):
+    """Server-sent events of a job until it finishes or ``timeout`` seconds pass"""
+    last_status = None
+    deadline = time.monotonic() + timeout
+    current = job
+    
+    while True:
+        if current.status != last_status:
+            last_status = current.status
+            yield _sse('status', {'job_id': str(current.id), 'status': current.status})
+        
+        if current.is_finished:
+            yield _sse('result', await sync_to_async(_serialized_job)(current))
+            return
+        
+        if time.monotonic() > deadline:
+            yield _sse('timeout', {'job_id': str(current.id), 'status': current.status})
+            return
+        
+        await asyncio.sleep(poll_interval)
+        current = await queryset.aget(pk=current.pk)
+
+
+def _job_snapshot(job: MatchJob, retry_ms: int):
+    """The job's current events, with the delay before the client reconnects"""
+    yield f"retry: {retry_ms}\n\n"
+    yield _sse('status', {'job_id': str(job.id), 'status': job.status})
+    if job.is_finished:
+        yield _sse('result', _serialized_job(job))
+
+
+def _serialized_job(job: MatchJob):
+    return MatchJobSerializer(job).data
+
+
+def _sse(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def matching_stats(request):
+    """
+    Rolling latency / query percentiles per matcher and stage
+    
+    GET /api/matching/ops/stats/?window=500&hours=24&matcher=therapist_matcher
+    
+    Aggregates the most recent ``window`` MatchingLog rows (optionally only
+    those from the last ``hours`` and of one matcher).
+    """
+    try:
+        window = min(max(int(request.query_params.get('window', 500)), 1), 10000)
+        hours = request.query_params.get('hours')
+        hours = float(hours) if hours else None
+    except ValueError:
+        return Response(
+            {'error': 'window and hours must be numbers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    logs = MatchingLog.objects.all()
+    matcher = request.query_params.get('matcher')
+    if matcher:
+        logs = logs.filter(matcher=matcher)
+    if hours:
+        logs = logs.filter(created_at__gte=timezone.now() - timedelta(hours=hours))
+    
+    rows = list(logs.order_by('-created_at').values(
+        'matcher', 'processing_time_ms', 'query_count', 'encoder_calls', 'stage_timings', 'created_at'
+    )[:window])
+    
+    return Response({
+        'success': True,
+        'window': window,
+        'count': len(rows),
+        'since': rows[-1]['created_at'] if rows else None,
+        'data': summarize_matching_logs(rows),
+    })
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from django.db.models import Q, F
+from matching.patient_features import enqueue_patient_features
 from .models import Survey, SurveyQuestion, SurveyResponse, SurveyAnswer
 from .serializers import (
     SurveyListSerializer,
@@ -243,6 +244,10 @@ class SurveyResponseViewSet(viewsets.ModelViewSet):
         response.is_latest = True
         response.save()
         
+        # Embed the answers and extract matching features in the background,
+        # so a later match request does not wait for the encoder
+        enqueue_patient_features(response)
+        
         serializer = SurveyResponseSerializer(response)
         return Response(serializer.data)
     